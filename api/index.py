@@ -9,6 +9,14 @@ sys.path.insert(0, str(project_root))
 # Set Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'archive_project.settings')
 
+try:
+    # 開発環境では .env ファイルから環境変数を読み込む（既に設定されている値は上書きしない）
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    load_dotenv()
+
 # Import Django WSGI application
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
@@ -1,8 +1,10 @@
 # archive_app/admin.py
 
 from django.contrib import admin
-from .models import Archive  # Archiveモデルをインポート
+from .models import Archive, GeocodeCache, UploadJob  # Archiveモデルをインポート
 
 admin.site.register(Archive) 
+admin.site.register(GeocodeCache)
+admin.site.register(UploadJob)
 
 # Register your models here.
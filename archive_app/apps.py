@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(using, **kwargs):
+    # SQLiteではテーブルの作り直しで全文検索のトリガーが消えるので、マイグレーションのたびに確認する
+    from django.db import connections
+    from .search import install_search_index
+    install_search_index(connections[using])
 
 
 class ArchiveAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'archive_app'
+
+    def ready(self):
+        # Archiveの書き込み時にキャッシュを無効にするシグナルを登録
+        from . import signals  # noqa: F401
+        # アップロードのスプールの設定を確認するシステムチェックを登録
+        from . import checks  # noqa: F401
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,146 @@
+# archive_app/caching.py
+
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+# バージョンはキャッシュではなくデータベース（CacheVersion）に置く
+# （キャッシュがプロセスごとのメモリの場合でも、ワーカーや import_archives など
+# 他のプロセスでの書き込みがすぐに反映されるように）
+DATASET_VERSION_KEY = 'dataset'
+# 更新・削除があったときだけ上がるバージョン（追加だけなら差分の取得で済むかの判定に使う）
+DATASET_EDIT_VERSION_KEY = 'dataset:edits'
+
+# 一度の IN 句に含めるキーの数（SQLiteの変数の数の上限を超えないように）
+VERSION_QUERY_CHUNK = 500
+
+
+def _initial_version():
+    # データベースを作り直した後に、共有のキャッシュに残っている古いバージョン番号を
+    # 再利用しないよう、初期値には現在時刻（ミリ秒）を使う
+    return int(time.time() * 1000)
+
+
+def _location_version_key(latitude, longitude):
+    return f'location:{latitude}:{longitude}'
+
+
+def _chunks(keys):
+    keys = list(keys)
+    for start in range(0, len(keys), VERSION_QUERY_CHUNK):
+        yield keys[start:start + VERSION_QUERY_CHUNK]
+
+
+def _bump_versions(keys):
+    """
+    指定したキーのバージョンを上げる（まだ無いキーは初期値で作る）
+    """
+    from .models import CacheVersion
+
+    keys = set(keys)
+    with transaction.atomic():
+        for chunk in _chunks(keys):
+            existing = set(CacheVersion.objects.filter(key__in=chunk).values_list('key', flat=True))
+            if existing:
+                CacheVersion.objects.filter(key__in=existing).update(version=F('version') + 1)
+            # 同時に別のプロセスが作った場合は、そちらの初期値（新しい番号）をそのまま使う
+            CacheVersion.objects.bulk_create(
+                [CacheVersion(key=key, version=_initial_version()) for key in chunk if key not in existing],
+                ignore_conflicts=True,
+            )
+
+
+def _get_version(key):
+    from .models import CacheVersion
+
+    version = CacheVersion.objects.filter(key=key).values_list('version', flat=True).first()
+    if version is None:
+        CacheVersion.objects.bulk_create([CacheVersion(key=key, version=_initial_version())], ignore_conflicts=True)
+        version = CacheVersion.objects.get(key=key).version
+    return version
+
+
+def get_dataset_version():
+    """
+    現在のデータセットのバージョンを返す（1行だけのテーブルを読む）
+    """
+    return _get_version(DATASET_VERSION_KEY)
+
+
+def get_edit_version():
+    """
+    最後に Archive が更新・削除されたときのバージョンを返す
+    （これが変わっていなければ、前回から増えたのは追加されたデータだけ）
+    """
+    return _get_version(DATASET_EDIT_VERSION_KEY)
+
+
+def bump_dataset_version(edited=False):
+    """
+    データセットのバージョンを上げて、それに紐づくキャッシュを無効にする
+
+    edited: 追加ではなく更新・削除の場合は True（差分ではなく全体を読み込み直させる）
+    """
+    _bump_versions([DATASET_VERSION_KEY, DATASET_EDIT_VERSION_KEY] if edited else [DATASET_VERSION_KEY])
+
+
+def get_location_versions(locations):
+    """
+    (緯度, 経度) ごとのバージョンを {(緯度, 経度): バージョン} の辞書で返す
+    （一度も変更されていない場所は 0）
+    """
+    from .models import CacheVersion
+
+    keys = {_location_version_key(lat, lon): (lat, lon) for lat, lon in locations}
+    versions = {coords: 0 for coords in keys.values()}
+    for chunk in _chunks(keys):
+        for key, version in CacheVersion.objects.filter(key__in=chunk).values_list('key', 'version'):
+            versions[keys[key]] = version
+    return versions
+
+
+def bump_location_versions(locations):
+    """
+    指定した場所のバージョンを上げて、その場所のポップアップを作り直させる
+    """
+    _bump_versions(_location_version_key(lat, lon) for lat, lon in locations)
+
+
+def bump_location_version(latitude, longitude):
+    bump_location_versions([(latitude, longitude)])
+
+
+def get_or_build(key, build, timeout):
+    """
+    キャッシュにあればそれを、無ければ build() の結果を保存して返す
+
+    キャッシュが無いときに大量のリクエストが同時に来ても build() が1回だけ実行されるよう、
+    cache.add でロックを取ったリクエストだけが作り直し、他のリクエストはキャッシュに入るのを待つ
+    （CACHE_BUILD_WAIT 秒待っても入らなければ、キャッシュを使わずに自分で作る）
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + settings.CACHE_BUILD_WAIT
+    while True:
+        if cache.add(lock_key, 1, settings.CACHE_BUILD_LOCK_TIMEOUT):
+            try:
+                # ロックを待っている間に、他のリクエストが作り終えていることがある
+                value = cache.get(key)
+                if value is None:
+                    value = build()
+                    cache.set(key, value, timeout)
+                return value
+            finally:
+                cache.delete(lock_key)
+
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if time.monotonic() >= deadline:
+            return build()
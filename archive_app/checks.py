@@ -0,0 +1,36 @@
+# archive_app/checks.py
+
+import os
+
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+
+@register(Tags.compatibility)
+def check_upload_spool(app_configs, **kwargs):
+    """
+    バックグラウンドのジョブ（UPLOAD_USE_QUEUE）を使う場合に、
+    web が保存したスプールのファイルを worker が読めるかを確認する
+    """
+    if not settings.UPLOAD_USE_QUEUE:
+        return []
+    local = settings.UPLOAD_SPOOL_STORAGE == 'local' or settings.ARCHIVE_STORAGE_BACKEND == 'local'
+    if not local:
+        return []
+    if os.environ.get('VERCEL'):
+        # Vercel の /tmp は関数の呼び出しごとに別で、worker とは共有されない
+        return [Error(
+            'Vercel ではスプールをローカルのディスクに置けません。',
+            hint='UPLOAD_SPOOL_STORAGE=archive と Supabase Storage を使うか、UPLOAD_USE_QUEUE=false にしてください。',
+            id='archive_app.E001',
+        )]
+    return [Warning(
+        'スプールをローカルのディスクに置いています'
+        f'（UPLOAD_SPOOL_STORAGE={settings.UPLOAD_SPOOL_STORAGE}, ARCHIVE_STORAGE_BACKEND={settings.ARCHIVE_STORAGE_BACKEND}）。',
+        hint=(
+            'web と worker が別のマシン・コンテナで動く場合はファイルを読めないので、'
+            'UPLOAD_SPOOL_STORAGE=archive（Supabase Storage）にしてください。'
+            '同じマシンや共有ボリュームで動かしている場合は、SILENCED_SYSTEM_CHECKS に追加して無視できます。'
+        ),
+        id='archive_app.W001',
+    )]
@@ -1,7 +1,8 @@
 from django import forms
 
 class UploadForm(forms.Form):
-    file = forms.FileField(label="ファイル")
+    # 同じファイルがアップロード済みの場合、ブラウザはファイル本体を送らずに content_hash だけを送る
+    file = forms.FileField(label="ファイル", required=False)
     file_type = forms.ChoiceField(
         label="ファイルの種類",
         choices=[
@@ -27,4 +28,11 @@ class UploadForm(forms.Form):
         widget=forms.TextInput(attrs={'placeholder': '地図上でクリックするか、手動で入力してください'})
     )
     latitude = forms.FloatField(widget=forms.HiddenInput(), required=False)
-    longitude = forms.FloatField(widget=forms.HiddenInput(), required=False)
\ No newline at end of file
+    longitude = forms.FloatField(widget=forms.HiddenInput(), required=False)
+    content_hash = forms.RegexField(regex=r'^[0-9a-f]{64}$', widget=forms.HiddenInput(), required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('file') and not cleaned_data.get('content_hash'):
+            self.add_error('file', 'ファイルを選択してください。')
+        return cleaned_data
\ No newline at end of file
@@ -0,0 +1,128 @@
+# archive_app/geo.py
+
+import math
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+
+# ジオハッシュで使う文字（この順に並べると文字列の大小と位置の順序が一致する）
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+
+# 地球の半径（メートル）
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    緯度・経度をジオハッシュに変換する
+    先頭の文字が同じものほど近い場所にあるので、前方一致（範囲検索）で近くのデータを絞り込める
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # 偶数番目のビットは経度、奇数番目は緯度
+    while len(chars) < precision:
+        target, rng = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (rng[0] + rng[1]) / 2
+        if target >= mid:
+            value = value * 2 + 1
+            rng[0] = mid
+        else:
+            value = value * 2
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    2点間の大圏距離（メートル）を返す
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius):
+    """
+    半径 radius メートルの円を囲む範囲を (south, west, north, east) で返す（services.filter_by_bbox と同じ形式）
+    日付変更線をまたぐ場合は west > east になり、極を含む場合はすべての経度を含める
+    """
+    d_lat = radius / METERS_PER_DEGREE
+    south, north = latitude - d_lat, latitude + d_lat
+    if south <= -90 or north >= 90:
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+    # 経度1度の長さは極に近いほど短いので、範囲のうち極に近い方の緯度で計算する（円を必ず囲める）
+    d_lon = d_lat / math.cos(math.radians(max(abs(south), abs(north))))
+    if d_lon >= 180:
+        return south, -180.0, north, 180.0
+    west = (longitude - d_lon + 180) % 360 - 180
+    east = (longitude + d_lon + 180) % 360 - 180
+    return south, west, north, east
+
+
+def bbox_condition(south, west, north, east):
+    """
+    (south, west, north, east) の範囲内にあるデータを探す条件を返す
+    （latitude/longitude の複合インデックスを使った範囲検索になる）
+    """
+    condition = Q(latitude__gte=south, latitude__lte=north)
+    if west <= east:
+        return condition & Q(longitude__gte=west, longitude__lte=east)
+    # 日付変更線をまたぐ範囲（例: 西端170度・東端-170度）
+    return condition & (Q(longitude__gte=west) | Q(longitude__lte=east))
+
+
+def _approximate_distance(latitude, longitude):
+    # 正距円筒図法での距離の2乗（度）。近い範囲では大圏距離とほぼ同じ順序になるので、
+    # データベースで候補を近い順に並べて、読み込む件数を絞るのに使う
+    scale = math.cos(math.radians(latitude))
+    d_lat = F('latitude') - latitude
+    d_lon = (F('longitude') - longitude) * scale
+    return ExpressionWrapper(d_lat * d_lat + d_lon * d_lon, output_field=FloatField())
+
+
+def _with_distances(items, latitude, longitude):
+    for item in items:
+        item.distance = haversine(latitude, longitude, item.latitude, item.longitude)
+    return sorted(items, key=lambda item: item.distance)
+
+
+def within_radius(queryset, latitude, longitude, radius, limit):
+    """
+    半径 radius メートル以内のデータを、近い順に最大 limit 件返す
+    円を囲む範囲でインデックスを使って絞り込み、近い順に NEARBY_MAX_CANDIDATES 件までを読み込んでから、
+    正確な距離で判定する
+    """
+    candidates = (
+        queryset
+        .filter(bbox_condition(*bounding_box(latitude, longitude, radius)))
+        .order_by(_approximate_distance(latitude, longitude).asc())
+    )[:max(limit, settings.NEARBY_MAX_CANDIDATES)]
+    items = [item for item in _with_distances(list(candidates), latitude, longitude) if item.distance <= radius]
+    return items[:limit]
+
+
+def nearest(queryset, latitude, longitude, k):
+    """
+    近い順に k 件のデータを返す
+    NEARBY_INITIAL_RADIUS メートルから within_radius() で探し、k 件見つかるまで半径を4倍ずつ広げる
+    （半径の中で近い k 件が見つかれば、それより遠いデータは調べなくてよい）
+    NEARBY_MAX_RADIUS まで広げても k 件に満たなければ、見つかった分だけを返す
+    """
+    radius = min(settings.NEARBY_INITIAL_RADIUS, settings.NEARBY_MAX_RADIUS)
+    while True:
+        items = within_radius(queryset, latitude, longitude, radius, k)
+        if len(items) >= k or radius >= settings.NEARBY_MAX_RADIUS:
+            return items
+        radius = min(radius * 4, settings.NEARBY_MAX_RADIUS)
@@ -0,0 +1,142 @@
+# archive_app/geocache.py
+
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import counter
+from .models import GeocodeCache
+
+# キャッシュの利用状況（result は memory_hit / db_hit / miss のいずれか）
+GEOCODE_CACHE_REQUESTS = counter(
+    'archive_geocode_cache_requests_total',
+    'ジオコーディングキャッシュの参照回数',
+    ('kind', 'result'),
+)
+
+
+class LRUCache:
+    """
+    有効期限付きの、プロセス内LRUキャッシュ
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        (見つかったか, 値) を返す。期限切れのものは捨てる
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at <= timezone.now():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_memory_cache = LRUCache(settings.GEOCODE_MEMORY_CACHE_SIZE)
+
+
+def normalize_address(address):
+    """
+    住所をキャッシュのキー用に正規化する（全角・半角の統一、空白の整理）
+    """
+    address = unicodedata.normalize('NFKC', address or '')
+    return ' '.join(address.split()).lower()
+
+
+def coordinate_key(lat, lon):
+    """
+    緯度・経度を丸めて、逆ジオコーディングのキャッシュキーにする
+    """
+    precision = settings.GEOCODE_REVERSE_PRECISION
+    return f"{round(float(lat), precision)},{round(float(lon), precision)}"
+
+
+def _to_value(entry):
+    if not entry.found:
+        return None
+    if entry.kind == GeocodeCache.KIND_FORWARD:
+        return (entry.latitude, entry.longitude)
+    return entry.address
+
+
+def lookup(kind, key, fetch, refresh=False):
+    """
+    キャッシュ（メモリ → データベース）から結果を探し、無ければ fetch() を呼んで保存する
+
+    fetch() は、住所からの変換なら (緯度, 経度)、座標からの変換なら住所を返し、
+    見つからなかった場合は None を返す（None も「見つからない」として短めの期限で保存する）。
+    通信エラーなどの例外はキャッシュせず、そのまま呼び出し元に伝える。
+    """
+    memory_key = (kind, key)
+    if not refresh:
+        hit, value = _memory_cache.get(memory_key)
+        if hit:
+            GEOCODE_CACHE_REQUESTS.inc(kind=kind, result='memory_hit')
+            return value
+
+        entry = GeocodeCache.objects.filter(kind=kind, key=key, expires_at__gt=timezone.now()).first()
+        if entry is not None:
+            GEOCODE_CACHE_REQUESTS.inc(kind=kind, result='db_hit')
+            value = _to_value(entry)
+            _memory_cache.set(memory_key, value, entry.expires_at)
+            return value
+
+    GEOCODE_CACHE_REQUESTS.inc(kind=kind, result='miss')
+    value = fetch()
+    store(kind, key, value)
+    return value
+
+
+def store(kind, key, value):
+    """
+    結果をデータベースとメモリの両方に保存する
+    """
+    found = value is not None
+    ttl = settings.GEOCODE_CACHE_TTL if found else settings.GEOCODE_NEGATIVE_CACHE_TTL
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+
+    defaults = {'found': found, 'expires_at': expires_at, 'latitude': None, 'longitude': None, 'address': ''}
+    if found and kind == GeocodeCache.KIND_FORWARD:
+        defaults['latitude'], defaults['longitude'] = value
+    elif found:
+        defaults['address'] = value
+    GeocodeCache.objects.update_or_create(kind=kind, key=key, defaults=defaults)
+    _memory_cache.set((kind, key), value, expires_at)
+
+
+def clear_memory_cache():
+    """
+    プロセス内のキャッシュを空にする（データベースのキャッシュは残る）
+    """
+    _memory_cache.clear()
+
+
+def get_stats():
+    """
+    キャッシュの参照回数を {(種類, 結果): 回数} の辞書で返す
+    """
+    return GEOCODE_CACHE_REQUESTS.samples()
@@ -0,0 +1,260 @@
+# archive_app/http_client.py
+
+import asyncio
+import logging
+import threading
+import time
+import urllib.parse
+import weakref
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+# 外部サービスへのリクエストの結果（outcome は ok / http_error / error / circuit_open）
+UPSTREAM_REQUESTS = counter(
+    'archive_upstream_requests_total',
+    '外部サービスへのリクエスト回数',
+    ('call_site', 'host', 'outcome'),
+)
+
+# 外部サービスの応答時間（ストリーミングの場合はヘッダーを受け取るまで）
+UPSTREAM_LATENCY = histogram(
+    'archive_upstream_request_seconds',
+    '外部サービスへのリクエストの応答時間（秒）',
+    ('call_site', 'host'),
+)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    接続先が落ちていると判断して、リクエストを送らずに失敗させたときの例外
+    """
+
+
+class CircuitBreaker:
+    """
+    接続先ごとのサーキットブレーカー
+    連続して失敗したら一定時間リクエストを止め、その後1件だけ試して復旧を確認する
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        リクエストを送ってよいかを返す
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_progress:
+                return False
+            # 一定時間たったので、復旧の確認として1件だけ通す
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """
+        結果が分からないまま終わったリクエスト（キャンセルなど）の後に呼ぶ
+        失敗には数えないが、復旧の確認中であれば次の1件を通せるようにする
+        """
+        with self._lock:
+            self._trial_in_progress = False
+
+
+_sessions = {}
+_breakers = {}
+_lock = threading.Lock()
+
+# イベントループごとの非同期クライアント（httpx.AsyncClient は作成したループでしか使えないため）
+_async_clients = weakref.WeakKeyDictionary()
+
+# 再試行してよいメソッドと、再試行するステータスコード
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'})
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+def get_session(host):
+    """
+    接続先ごとに共有する requests.Session を返す（Keep-Aliveで接続を使い回す）
+    """
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            retry = Retry(
+                total=settings.HTTP_MAX_RETRIES,
+                backoff_factor=settings.HTTP_RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_maxsize=settings.HTTP_POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+
+def get_breaker(host):
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                settings.HTTP_CIRCUIT_FAILURE_THRESHOLD, settings.HTTP_CIRCUIT_RESET_TIMEOUT,
+            )
+            _breakers[host] = breaker
+        return breaker
+
+
+def request(method, url, *, call_site, timeout=None, **kwargs):
+    """
+    外部サービスにリクエストを送る（全ての外部通信はこの関数を通す）
+
+    - 接続先ごとに共有したセッションで接続を使い回す
+    - 接続・読み込みのタイムアウトを必ず指定する
+    - 冪等なリクエストは 502/503/504 や接続エラーの時に間隔をあけて再試行する
+    - 失敗が続いている接続先には送らずに CircuitOpenError を送出する
+    - call_site（呼び出し元の名前）ごとに応答時間と結果を記録する
+    """
+    host = urllib.parse.urlparse(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='circuit_open')
+        raise CircuitOpenError(f"{host} への接続を一時的に停止しています")
+
+    if timeout is None:
+        timeout = (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+    start = time.perf_counter()
+    try:
+        response = get_session(host).request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException:
+        breaker.record_failure()
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='error')
+        raise
+    except BaseException:
+        # 割り込みなどで中断した場合も、復旧の確認中のままにしない
+        breaker.release()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        UPSTREAM_LATENCY.observe(elapsed, call_site=call_site, host=host)
+        logger.debug("%s %s %s %.3fs", call_site, method, host, elapsed)
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='http_error')
+    else:
+        breaker.record_success()
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='ok')
+    return response
+
+
+def get(url, *, call_site, **kwargs):
+    """
+    GETリクエストを送る（request() の省略形）
+    """
+    return request('GET', url, call_site=call_site, **kwargs)
+
+
+def get_async_client():
+    """
+    実行中のイベントループで共有する httpx.AsyncClient を返す（Keep-Aliveで接続を使い回す）
+    """
+    # httpx は非同期のビューでしか使わないので、起動を遅くしないよう使うときに読み込む
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=settings.HTTP_ASYNC_MAX_CONNECTIONS),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def arequest(method, url, *, call_site, stream=False, **kwargs):
+    """
+    request() の非同期版（httpx を使う）。応答は httpx.Response で返す
+
+    stream=True の場合は本文を読まずに返すので、呼び出し元で aiter_bytes() を読み、
+    最後に aclose() で接続を戻す
+    """
+    import httpx
+
+    host = urllib.parse.urlparse(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='circuit_open')
+        raise CircuitOpenError(f"{host} への接続を一時的に停止しています")
+
+    client = get_async_client()
+    retries = settings.HTTP_MAX_RETRIES if method.upper() in IDEMPOTENT_METHODS else 0
+    try:
+        for attempt in range(retries + 1):
+            if attempt:
+                # requests 側（urllib3 の Retry）と同じく、回数ごとに間隔を倍にする
+                await asyncio.sleep(settings.HTTP_RETRY_BACKOFF * 2 ** (attempt - 1))
+            start = time.perf_counter()
+            try:
+                response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+            except httpx.HTTPError:
+                if attempt < retries:
+                    continue
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                UPSTREAM_LATENCY.observe(elapsed, call_site=call_site, host=host)
+                logger.debug("%s %s %s %.3fs", call_site, method, host, elapsed)
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                await response.aclose()
+                continue
+            break
+    except httpx.HTTPError:
+        breaker.record_failure()
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='error')
+        raise
+    except BaseException:
+        # タスクのキャンセル（クライアントの切断など）で中断した場合も、復旧の確認中のままにしない
+        breaker.release()
+        raise
+
+    if response.status_code >= 500:
+        breaker.record_failure()
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='http_error')
+    else:
+        breaker.record_success()
+        UPSTREAM_REQUESTS.inc(call_site=call_site, host=host, outcome='ok')
+    return response
+
+
+async def aget(url, *, call_site, **kwargs):
+    """
+    非同期のGETリクエストを送る（arequest() の省略形）
+    """
+    return await arequest('GET', url, call_site=call_site, **kwargs)
@@ -0,0 +1,180 @@
+# archive_app/jobs.py
+
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import UploadJob
+from .services import prepare_archive_from_upload
+from .storage import get_spool_storage
+
+logger = logging.getLogger(__name__)
+
+
+def spool_uploaded_file(uploaded_file, storage_file_name):
+    """
+    アップロードされたファイルをスプール用のストレージに保存し、その名前を返す
+    （初期値ではアーカイブと同じストレージなので、web と別のマシンで動くワーカーからも読める。
+    ローカルのディスクの場合、一時ファイルとしてディスクにあればコピーせずに移動する）
+    """
+    return get_spool_storage().save(f"{settings.UPLOAD_SPOOL_PREFIX}{storage_file_name}", uploaded_file)
+
+
+def enqueue_upload(uploaded_file, storage_file_name, file_type, description, address, lat, lon):
+    """
+    ファイルをスプールに保存し、アップロードのジョブを登録する
+    """
+    spool_path = spool_uploaded_file(uploaded_file, storage_file_name)
+    return UploadJob.objects.create(
+        spool_path=spool_path,
+        storage_file_name=storage_file_name,
+        file_type=file_type,
+        description=description,
+        address=address or '',
+        latitude=lat,
+        longitude=lon,
+    )
+
+
+def claim_next_job():
+    """
+    処理待ちのジョブを1件取り出して「処理中」にする。無ければ None
+    （複数のワーカーが同時に動いても、同じジョブを二重に処理しないよう
+    状態が「処理待ち」のままの場合だけ更新する）
+    """
+    while True:
+        job_id = (
+            UploadJob.objects
+            .filter(status=UploadJob.STATUS_PENDING, run_after__lte=timezone.now())
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = UploadJob.objects.filter(pk=job_id, status=UploadJob.STATUS_PENDING).update(
+            status=UploadJob.STATUS_RUNNING,
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return UploadJob.objects.get(pk=job_id)
+
+
+def _job_filter(job):
+    """
+    このワーカーが取り出したときのままのジョブ（「処理中」で、試行回数も変わっていない）
+    途中で処理待ちに戻されて別のワーカーが取り出した場合は、試行回数が増えているので一致しない
+    """
+    return UploadJob.objects.filter(pk=job.pk, status=UploadJob.STATUS_RUNNING, attempts=job.attempts)
+
+
+def _update_job(job, **fields):
+    """
+    ジョブがまだこのワーカーのものであれば更新して True を返す
+    """
+    return _job_filter(job).update(updated_at=timezone.now(), **fields) > 0
+
+
+@contextmanager
+def _heartbeat(job):
+    """
+    処理中は UPLOAD_JOB_HEARTBEAT_INTERVAL 秒ごとに updated_at を更新し、
+    時間のかかるアップロードが requeue_stale_jobs() に止まったジョブとみなされないようにする
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.UPLOAD_JOB_HEARTBEAT_INTERVAL):
+                _update_job(job)
+        finally:
+            # スレッドごとに作られたデータベースの接続を閉じる
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'upload-job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    ジョブを1件処理する（Storageへのアップロード → ジオコーディング → Archiveへの保存）
+    失敗した場合は、回数の上限までは時間をおいて再試行する
+    """
+    try:
+        with _heartbeat(job), get_spool_storage().open(job.spool_path, 'rb') as f:
+            archive = prepare_archive_from_upload(
+                File(f, name=job.storage_file_name),
+                job.storage_file_name,
+                job.file_type,
+                job.description,
+                job.address,
+                job.latitude,
+                job.longitude,
+            )
+    except Exception as e:
+        logger.exception("アップロードのジョブ %s が失敗しました", job.pk)
+        if isinstance(e, FileNotFoundError):
+            # スプールのファイルが無い場合は再試行しても見つからない
+            # （web と worker がスプールを共有していない場合など。UPLOAD_SPOOL_STORAGE を確認する）
+            _update_job(job, status=UploadJob.STATUS_FAILED, last_error=f"スプールのファイルが見つかりません: {job.spool_path}")
+        elif job.attempts < settings.UPLOAD_JOB_MAX_ATTEMPTS:
+            # 失敗するたびに再試行までの間隔を倍にする
+            delay = settings.UPLOAD_JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+            _update_job(
+                job, status=UploadJob.STATUS_PENDING, last_error=str(e),
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+        elif _update_job(job, status=UploadJob.STATUS_FAILED, last_error=str(e)):
+            _remove_spool_file(job)
+        job.refresh_from_db()
+        return job
+
+    if archive is None:
+        # 住所から位置が特定できなかった場合は、再試行しても結果は変わらない
+        finished = _update_job(job, status=UploadJob.STATUS_FAILED, last_error='位置情報が取得できませんでした。')
+    else:
+        # Archiveの保存とジョブの完了を同時に行う
+        # （ジョブがすでに別のワーカーに渡っていれば保存しないので、Archiveが二重に作られない）
+        with transaction.atomic():
+            archive.save()
+            finished = _update_job(job, status=UploadJob.STATUS_DONE, archive=archive, last_error='')
+            if not finished:
+                transaction.set_rollback(True)
+
+    if finished:
+        _remove_spool_file(job)
+    else:
+        logger.warning("アップロードのジョブ %s は別のワーカーに処理待ちに戻されていたため、結果を保存しませんでした", job.pk)
+    job.refresh_from_db()
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    ワーカーが途中で止まって「処理中」のまま残ったジョブを「処理待ち」に戻す
+    """
+    stale_before = timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_STALE_TIMEOUT)
+    return UploadJob.objects.filter(
+        status=UploadJob.STATUS_RUNNING, updated_at__lt=stale_before,
+    ).update(status=UploadJob.STATUS_PENDING, updated_at=timezone.now())
+
+
+def _remove_spool_file(job):
+    try:
+        get_spool_storage().delete(job.spool_path)
+    except Exception:
+        # 消せなくてもジョブの結果には影響しないので、記録だけして続ける
+        logger.warning("スプールのファイル %s を削除できませんでした", job.spool_path, exc_info=True)
@@ -0,0 +1,91 @@
+# archive_app/management/commands/check_startup.py
+
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# 新しいPythonプロセスで、サーバーレス環境の起動時と同じ処理（WSGIアプリとURL設定の読み込み）を行う
+STARTUP_SCRIPT = '''
+import sys, time
+sys.stderr.write("--- startup ---\\n")
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print((time.perf_counter() - started) * 1000)
+'''
+
+_IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = '起動時のモジュール読み込み時間を -X importtime で計測し、予算（STARTUP_IMPORT_BUDGET_MS）を超えていないか確認する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, default=3,
+            help='計測する回数（いちばん速かった回で判定する）',
+        )
+        parser.add_argument(
+            '--budget', type=float,
+            help='起動にかけてよい時間（ミリ秒）。省略時は STARTUP_IMPORT_BUDGET_MS',
+        )
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='読み込みに時間のかかったモジュールを何件表示するか',
+        )
+
+    def handle(self, *args, **options):
+        budget = options['budget'] or settings.STARTUP_IMPORT_BUDGET_MS
+        results = [self._measure() for _ in range(max(1, options['runs']))]
+        wall_ms, modules = min(results, key=lambda result: result[0])
+
+        self.stdout.write(f"起動時間: {wall_ms:.0f} ms（予算 {budget:.0f} ms、{len(results)} 回中の最速）")
+        self.stdout.write(f"読み込んだモジュール: {len(modules)} 個")
+        self.stdout.write('時間のかかったモジュール（依存先を含む、ミリ秒）:')
+        top_level = sorted(
+            ((cumulative, name) for name, (cumulative, depth) in modules.items() if depth == 0),
+            reverse=True,
+        )
+        for cumulative, name in top_level[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f}  {name}")
+
+        errors = []
+        lazy = sorted(
+            name for name in modules
+            if name.split('.')[0] in settings.STARTUP_LAZY_MODULES
+        )
+        if lazy:
+            errors.append(f"起動時に読み込まないはずのモジュールが読み込まれています: {', '.join(lazy[:10])}")
+        if wall_ms > budget:
+            errors.append(f"起動時間が予算を超えています: {wall_ms:.0f} ms > {budget:.0f} ms")
+        if errors:
+            raise CommandError('\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('起動時間は予算内です'))
+
+    def _measure(self):
+        """
+        起動処理を1回実行し、(経過時間（ミリ秒）, {モジュール名: (累積時間（マイクロ秒）, 階層)}) を返す
+        """
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'archive_project.settings'))
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f"起動に失敗しました:\n{completed.stderr[-2000:]}")
+
+        # Python自体の起動（site など）は除き、アプリの起動処理中の読み込みだけを数える
+        stderr = completed.stderr.split('--- startup ---', 1)[-1]
+        modules = {}
+        for line in stderr.splitlines():
+            match = _IMPORTTIME_RE.match(line)
+            if match:
+                depth = (len(match.group(3)) - 1) // 2
+                modules[match.group(4)] = (int(match.group(2)), depth)
+        return float(completed.stdout.strip().splitlines()[-1]), modules
@@ -0,0 +1,58 @@
+# archive_app/management/commands/generate_thumbnails.py
+
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from archive_app import http_client
+from archive_app.models import Archive
+from archive_app.storage import get_archive_storage
+from archive_app.thumbnails import generate_derivatives
+
+
+class Command(BaseCommand):
+    help = '縮小画像がまだ無い画像データについて、サムネイル・中サイズの画像を作成する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='作成済みのものも含めて作り直す',
+        )
+
+    def handle(self, *args, **options):
+        archives = Archive.objects.filter(file_type='image').order_by('id')
+        if not options['all']:
+            archives = archives.filter(thumbnail_url='')
+
+        storage = get_archive_storage()
+        created = 0
+        for archive in archives.iterator():
+            storage_name = storage.name_from_url(archive.file_path) or os.path.basename(archive.file_path)
+            with tempfile.TemporaryFile() as source:
+                self._fetch_original(storage, storage_name, archive.file_path, source)
+                derivatives = generate_derivatives(source, storage_name)
+            if not derivatives:
+                self.stdout.write(self.style.WARNING(f"作成できませんでした: {archive.file_path}"))
+                continue
+            for field, url in derivatives.items():
+                setattr(archive, field, url)
+            archive.save(update_fields=list(derivatives))
+            created += 1
+        self.stdout.write(self.style.SUCCESS(f"{created} 件の縮小画像を作成しました"))
+
+    def _fetch_original(self, storage, storage_name, file_url, destination):
+        """
+        元の画像を一時ファイルに書き出す（メモリに全体を読み込まない）
+        """
+        if isinstance(storage, FileSystemStorage):
+            with storage.open(storage_name) as f:
+                for chunk in f.chunks():
+                    destination.write(chunk)
+            return
+        response = http_client.get(file_url, stream=True, call_site='generate_thumbnails')
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=256 * 1024):
+            destination.write(chunk)
+        response.close()
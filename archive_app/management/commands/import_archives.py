@@ -0,0 +1,347 @@
+# archive_app/management/commands/import_archives.py
+
+import csv
+import mimetypes
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from archive_app import geocache
+from archive_app.metadata import extract_metadata
+from archive_app.models import Archive
+from archive_app.services import (
+    bulk_create_archives, compute_content_hash, resolve_location, upload_file_to_supabase_storage,
+)
+from archive_app.thumbnails import generate_derivatives
+
+# 以前のCSV保存方式（pre_views.add_data_to_csv）と同じ列
+MANIFEST_COLUMNS = ['file_path', 'file_type', 'description', 'address', 'latitude', 'longitude', 'upload_date']
+
+
+def guess_file_type(path):
+    """
+    拡張子からファイルの種類（image / video / audio / other）を判定する
+    """
+    mime_type, _ = mimetypes.guess_type(path)
+    main_type = (mime_type or '').split('/')[0]
+    return main_type if main_type in ('image', 'video', 'audio') else 'other'
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'フォルダ、またはマニフェストCSVに書かれたファイルをまとめてアップロードし、データベースに登録する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            help=f"ファイルの入ったフォルダ、またはマニフェストCSV（列: {', '.join(MANIFEST_COLUMNS)}）",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='同時にアップロードする数',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='まとめてデータベースに登録する件数（この単位で進み具合を記録する）',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='登録済みのファイルを記録するファイル（省略時は「<source>.checkpoint」）',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='記録を無視して最初から登録し直す',
+        )
+        parser.add_argument(
+            '--address',
+            help='フォルダを指定した場合に、すべてのファイルに設定する住所（位置情報付きの写真・動画はその位置を使う）',
+        )
+        parser.add_argument('--lat', type=float, help='フォルダを指定した場合に、すべてのファイルに設定する緯度')
+        parser.add_argument('--lon', type=float, help='フォルダを指定した場合に、すべてのファイルに設定する経度')
+        parser.add_argument(
+            '--sleep', type=float, default=0.2,
+            help='地理院APIへの問い合わせの間隔（秒）',
+        )
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        if not source.exists():
+            raise CommandError(f"見つかりません: {source}")
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers と --batch-size は1以上を指定してください')
+
+        checkpoint_path = Path(options['checkpoint'] or f"{str(source).rstrip('/')}.checkpoint")
+        if options['restart'] and checkpoint_path.exists():
+            checkpoint_path.unlink()
+        done = self._load_checkpoint(checkpoint_path)
+
+        rows = self._read_directory(source, options) if source.is_dir() else self._read_manifest(source)
+        total = len(rows)
+        rows = [row for row in rows if row['key'] not in done]
+        self.stdout.write(f"{total} 件中 {total - len(rows)} 件は登録済みのためスキップします")
+
+        rows, no_location = self._resolve_locations(rows, options['sleep'])
+        for row in no_location:
+            self.stdout.write(self.style.WARNING(f"位置情報が特定できないためスキップします: {row['key']}"))
+
+        self.started = time.monotonic()
+        self.stats = {'created': 0, 'reused': 0, 'failed': 0, 'bytes': 0}
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            self._upload_all(rows, options, checkpoint)
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS('完了しました'))
+        self.stdout.write(f"  登録: {self.stats['created']} 件（うち同じファイルの使い回し {self.stats['reused']} 件）")
+        self.stdout.write(f"  スキップ（登録済み）: {total - len(rows) - len(no_location)} 件")
+        self.stdout.write(f"  位置情報なし: {len(no_location)} 件")
+        self.stdout.write(f"  失敗: {self.stats['failed']} 件（もう一度実行すると再試行します）")
+        self.stdout.write(
+            f"  経過時間: {elapsed:.1f} 秒、{self.stats['created'] / max(elapsed, 0.001):.1f} 件/秒、"
+            f"{self.stats['bytes'] / 1024 / 1024 / max(elapsed, 0.001):.2f} MB/秒"
+        )
+
+    def _load_checkpoint(self, path):
+        if not path.exists():
+            return set()
+        with open(path, encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+
+    def _read_manifest(self, path):
+        """
+        マニフェストCSVを読み込む
+        file_path が URL の行はアップロードせずにそのまま登録し、それ以外はCSVからの相対パスとして扱う
+        """
+        rows = []
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            for record in csv.DictReader(f):
+                file_path = (record.get('file_path') or '').strip()
+                if not file_path:
+                    continue
+                is_url = file_path.startswith(('http://', 'https://'))
+                created_at = None
+                if record.get('upload_date'):
+                    try:
+                        created_at = timezone.make_aware(
+                            datetime.strptime(record['upload_date'].strip(), '%Y-%m-%d %H:%M:%S')
+                        )
+                    except ValueError:
+                        pass
+                rows.append({
+                    'key': file_path,
+                    'path': None if is_url else path.parent / file_path,
+                    'url': file_path if is_url else None,
+                    'file_type': record.get('file_type') or guess_file_type(file_path),
+                    'description': record.get('description') or '',
+                    'address': (record.get('address') or '').strip(),
+                    'latitude': _to_float(record.get('latitude')),
+                    'longitude': _to_float(record.get('longitude')),
+                    'created_at': created_at,
+                    'captured_at': None,
+                })
+        return rows
+
+    def _read_directory(self, path, options):
+        rows = []
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(files):
+                if name.startswith('.'):
+                    continue
+                file_path = Path(root) / name
+                rows.append({
+                    'key': str(file_path.relative_to(path)),
+                    'path': file_path,
+                    'url': None,
+                    'file_type': guess_file_type(name),
+                    'description': '',
+                    'address': options['address'] or '',
+                    'latitude': options['lat'],
+                    'longitude': options['lon'],
+                    'created_at': None,
+                    'captured_at': None,
+                })
+        return rows
+
+    def _read_metadata(self, row):
+        """
+        ファイルに埋め込まれた撮影位置・撮影日時を読み取る（位置が指定されていない場合だけ位置を使う）
+        """
+        if row['path'] is None or not row['path'].exists():
+            return
+        with open(row['path'], 'rb') as f:
+            metadata = extract_metadata(f)
+        if (row['latitude'] is None or row['longitude'] is None) and 'latitude' in metadata:
+            row.update(latitude=metadata['latitude'], longitude=metadata['longitude'])
+        row['captured_at'] = metadata.get('captured_at')
+
+    def _resolve_locations(self, rows, sleep):
+        """
+        住所・緯度経度を補完する。同じ住所・座標は1回だけ問い合わせる
+        """
+        resolved = {}
+        located, no_location = [], []
+        for row in rows:
+            self._read_metadata(row)
+            lat, lon, address = row['latitude'], row['longitude'], row['address']
+            if lat is None or lon is None:
+                key = ('address', geocache.normalize_address(address))
+            elif not address:
+                key = ('coordinate', geocache.coordinate_key(lat, lon))
+            else:
+                key = None
+
+            if key is not None:
+                if key not in resolved:
+                    misses_before = self._geocode_misses()
+                    resolved[key] = resolve_location(lat, lon, address)
+                    if self._geocode_misses() > misses_before and sleep:
+                        time.sleep(sleep)
+                    if len(resolved) % 100 == 0:
+                        self.stdout.write(f"ジオコーディング: {len(resolved)} 件")
+                lat, lon, resolved_address = resolved[key]
+                address = address or resolved_address or ''
+
+            if lat is None or lon is None:
+                no_location.append(row)
+                continue
+            row.update(latitude=lat, longitude=lon, address=address)
+            located.append(row)
+        return located, no_location
+
+    def _geocode_misses(self):
+        return sum(count for (kind, result), count in geocache.get_stats().items() if result == 'miss')
+
+    def _upload_all(self, rows, options, checkpoint):
+        """
+        最大 --workers 件を同時にアップロードし、--batch-size 件ごとにデータベースへ登録する
+        """
+        # 登録済みのファイルの中身のハッシュ（同じファイルはアップロードせずに使い回す）
+        self.stored = {
+            content_hash: {'file_path': file_path, 'thumbnail_url': thumbnail_url, 'medium_url': medium_url}
+            for content_hash, file_path, thumbnail_url, medium_url in (
+                Archive.objects.exclude(content_hash='').order_by('-id')
+                .values_list('content_hash', 'file_path', 'thumbnail_url', 'medium_url')
+            )
+        }
+        self.stored_lock = threading.Lock()
+
+        pending = []
+        in_flight = set()
+        remaining = iter(rows)
+        max_in_flight = options['workers'] * 4
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                for row in remaining:
+                    in_flight.add(pool.submit(self._upload, row))
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    break
+
+                completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    try:
+                        pending.append(future.result())
+                    except Exception as e:
+                        self.stats['failed'] += 1
+                        self.stdout.write(self.style.ERROR(f"アップロードに失敗しました: {e}"))
+                if len(pending) >= options['batch_size']:
+                    self._flush(pending, options['batch_size'], checkpoint, len(rows))
+                    pending = []
+        if pending:
+            self._flush(pending, options['batch_size'], checkpoint, len(rows))
+
+    def _upload(self, row):
+        """
+        1件のファイルをアップロードして、未保存のArchiveを返す（別スレッドで実行される）
+        同じ中身のファイルが登録済みなら、アップロードせずにそのファイルを使う
+        """
+        stored = {'file_path': row['url']}
+        content_hash = ''
+        size = 0
+        reused = False
+        if not row['url']:
+            with open(row['path'], 'rb') as f:
+                content_hash = compute_content_hash(f)
+                existing = self._claim_hash(content_hash)
+                if existing is None:
+                    uploaded = None
+                    try:
+                        storage_file_name = f"{uuid.uuid4()}{row['path'].suffix}"
+                        uploaded = {'file_path': upload_file_to_supabase_storage(f, storage_file_name)}
+                        if row['file_type'] == 'image':
+                            uploaded.update(generate_derivatives(f, storage_file_name))
+                    finally:
+                        self._release_hash(content_hash, uploaded)
+                    stored = uploaded
+                    size = row['path'].stat().st_size
+                else:
+                    stored = existing
+                    reused = True
+
+        archive = Archive(
+            file_type=row['file_type'],
+            description=row['description'],
+            address=row['address'],
+            latitude=row['latitude'],
+            longitude=row['longitude'],
+            captured_at=row.get('captured_at'),
+            content_hash=content_hash,
+            **stored,
+        )
+        if row['created_at']:
+            archive.created_at = row['created_at']
+        return row['key'], archive, size, reused
+
+    def _claim_hash(self, content_hash):
+        """
+        同じ中身のファイルが登録済みならその情報を返す。無ければ None を返し、
+        アップロードが終わるまで同じ中身の他のファイルを待たせる（同時に二重にアップロードしないため）
+        """
+        while True:
+            with self.stored_lock:
+                existing = self.stored.get(content_hash)
+                if existing is None:
+                    self.stored[content_hash] = threading.Event()
+                    return None
+            if not isinstance(existing, threading.Event):
+                return existing
+            existing.wait()
+
+    def _release_hash(self, content_hash, stored):
+        with self.stored_lock:
+            uploading = self.stored.pop(content_hash)
+            if stored is not None:
+                self.stored[content_hash] = stored
+        # 失敗した場合は、待っていたファイルのどれかが改めてアップロードする
+        uploading.set()
+
+    def _flush(self, pending, batch_size, checkpoint, total):
+        bulk_create_archives([archive for _, archive, _, _ in pending], batch_size=batch_size)
+        # データベースへの登録が終わってから記録する（途中で止まった場合は、記録の無いものを次回に再試行する）
+        checkpoint.writelines(f"{key}\n" for key, _, _, _ in pending)
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+        self.stats['created'] += len(pending)
+        self.stats['bytes'] += sum(size for _, _, size, _ in pending)
+        self.stats['reused'] += sum(1 for _, _, _, reused in pending if reused)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f"{self.stats['created']}/{total} 件を登録しました "
+            f"({self.stats['created'] / max(elapsed, 0.001):.1f} 件/秒)"
+        )
@@ -0,0 +1,281 @@
+# archive_app/management/commands/run_benchmarks.py
+
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from archive_app.caching import bump_dataset_version
+from archive_app.models import Archive
+from archive_app.services import bulk_create_archives, create_map_html
+
+# 合成データの中心にする都市（緯度, 経度, 重み）。実際の投稿と同じように、人の多い場所に偏らせる
+CITIES = [
+    ('東京都千代田区', 35.6812, 139.7671, 30),
+    ('大阪府大阪市', 34.7025, 135.4959, 15),
+    ('愛知県名古屋市', 35.1709, 136.8815, 8),
+    ('北海道札幌市', 43.0687, 141.3508, 6),
+    ('福岡県福岡市', 33.5902, 130.4207, 6),
+    ('京都府京都市', 35.0116, 135.7681, 6),
+    ('宮城県仙台市', 38.2601, 140.8824, 4),
+    ('広島県広島市', 34.3978, 132.4753, 4),
+    ('沖縄県那覇市', 26.2124, 127.6809, 3),
+    ('石川県金沢市', 36.5781, 136.6480, 2),
+]
+# 日本全体の範囲（都市から離れた場所にも少しだけ投稿がある）
+JAPAN_BBOX = (24.0, 123.0, 45.5, 146.0)
+FILE_TYPES = [('image', 60), ('video', 20), ('audio', 10), ('other', 10)]
+WORDS = ['桜', '紅葉', '祭り', '夜景', '駅前', '商店街', '神社', '公園', '海岸', '山道', '朝市', '花火', 'ライブ', '記録']
+EXTENSIONS = {'image': '.jpg', 'video': '.mp4', 'audio': '.mp3', 'other': '.pdf'}
+
+
+def generate_archives(count, seed, batch_size=5000):
+    """
+    都市の周りに集まった、それらしい合成データを batch_size 件ずつ作って返す
+    """
+    rng = random.Random(seed)
+    city_weights = [city[3] for city in CITIES]
+    type_names = [name for name, _ in FILE_TYPES]
+    type_weights = [weight for _, weight in FILE_TYPES]
+    now = timezone.now()
+    recent_points = []
+    batch = []
+    for i in range(count):
+        if recent_points and rng.random() < 0.2:
+            # 同じ場所に複数のファイルが登録されることも多い
+            address, lat, lon = rng.choice(recent_points)
+        elif rng.random() < 0.05:
+            south, west, north, east = JAPAN_BBOX
+            address, lat, lon = '日本', rng.uniform(south, north), rng.uniform(west, east)
+        else:
+            name, city_lat, city_lon, _ = rng.choices(CITIES, weights=city_weights)[0]
+            spread = rng.choice([0.01, 0.05, 0.2])
+            address = f"{name}{rng.randint(1, 40)}丁目"
+            lat, lon = rng.gauss(city_lat, spread), rng.gauss(city_lon, spread)
+        recent_points = (recent_points + [(address, lat, lon)])[-1000:]
+
+        file_type = rng.choices(type_names, weights=type_weights)[0]
+        batch.append(Archive(
+            file_type=file_type,
+            file_path=f"https://example.com/storage/v1/object/public/archive/{seed}-{i}{EXTENSIONS[file_type]}",
+            description=' '.join(rng.sample(WORDS, 3)),
+            address=address,
+            latitude=lat,
+            longitude=lon,
+            created_at=now - timedelta(seconds=rng.randint(0, 3 * 365 * 86400)),
+        ))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _response_bytes(response):
+    if getattr(response, 'streaming', False):
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = '合成データで読み込み処理（get_markers・file_list・create_map_html など）の速さを計測し、結果をJSONに保存する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,100000',
+            help='データ件数（カンマ区切り）。例: 1000,100000,1000000',
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='各処理を計測する回数')
+        parser.add_argument('--seed', type=int, default=0, help='合成データの乱数の種（同じ値なら同じデータになる）')
+        parser.add_argument(
+            '--map-max-rows', type=int, default=5000,
+            help='create_map_html を計測する最大のデータ件数（これより多い場合は省略する）',
+        )
+        parser.add_argument('--output', help='結果を保存するJSONファイル（省略時は benchmark_results/ の下）')
+        parser.add_argument('--compare', help='比較する以前の結果のJSONファイル')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes は数値をカンマ区切りで指定してください')
+
+        setup_test_environment()
+        # 本番のデータベースを汚さないよう、テスト用のデータベースを作って計測する
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = []
+        try:
+            for size in sizes:
+                results.extend(self._run_dataset(size, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {'meta': self._meta(options), 'results': results}
+        output = Path(options['output'] or Path(settings.BASE_DIR) / 'benchmark_results' / (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['git_commit'][:8] or 'unknown'}.json"
+        ))
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        self.stdout.write(self.style.SUCCESS(f"結果を保存しました: {output}"))
+
+        if options['compare']:
+            self._compare(results, options['compare'])
+
+    def _meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            ).stdout.strip()
+        except OSError:
+            commit = ''
+        return {
+            'git_commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'seed': options['seed'],
+            'iterations': options['iterations'],
+        }
+
+    def _seed(self, size, seed):
+        with connection.cursor() as cursor:
+            # 件数が多いとシグナル付きの削除は遅いので、SQLで直接消す
+            cursor.execute(f'DELETE FROM {Archive._meta.db_table}')
+        bump_dataset_version(edited=True)
+        cache.clear()
+        started = time.perf_counter()
+        for batch in generate_archives(size, seed):
+            bulk_create_archives(batch, batch_size=len(batch))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f"\n{size:,} 件のデータを作成しました（{time.perf_counter() - started:.1f} 秒）")
+
+    def _scenarios(self, size, options):
+        """
+        計測する処理の一覧を (名前, 実行する関数, キャッシュを毎回消すか) で返す
+        """
+        client = Client()
+        tokyo = '139.70,35.65,139.80,35.72'
+        japan = '123,24,146,45.5'
+        middle = Archive.objects.order_by('-created_at', '-id').values_list('id', flat=True)[size // 2]
+
+        scenarios = [
+            ('get_markers (日本全体)', lambda: client.get('/get_markers/', {'bbox': japan}), False),
+            ('get_markers (東京の一部)', lambda: client.get('/get_markers/', {'bbox': tokyo}), False),
+            ('get_markers (columnar)', lambda: client.get('/get_markers/', {'bbox': japan, 'format': 'columnar'}), False),
+            ('get_markers (binary)', lambda: client.get('/get_markers/', {'bbox': japan, 'format': 'binary'}), False),
+            ('get_clusters (zoom 5)', lambda: client.get('/get_clusters/', {'bbox': japan, 'zoom': 5}), False),
+            ('get_clusters (zoom 14)', lambda: client.get('/get_clusters/', {'bbox': tokyo, 'zoom': 14}), False),
+            ('file_list (先頭ページ)', lambda: client.get('/files/'), False),
+            ('file_list (中ほどのページ)', lambda: client.get('/files/', {'from': middle}), False),
+            ('search', lambda: client.get('/search/', {'q': '夜景 東京'}), False),
+            ('nearby (k=20)', lambda: client.get('/nearby/', {'lat': 35.68, 'lon': 139.76, 'k': 20}), False),
+        ]
+        if size <= options['map_max_rows']:
+            scenarios += [
+                ('create_map_html (キャッシュなし)', create_map_html, True),
+                ('create_map_html (キャッシュあり)', create_map_html, False),
+            ]
+        return scenarios
+
+    def _run_dataset(self, size, options):
+        self._seed(size, options['seed'])
+        results = []
+        for name, call, clear_cache in self._scenarios(size, options):
+            iterations = min(options['iterations'], 3) if clear_cache else options['iterations']
+            result = self._measure(call, iterations, clear_cache)
+            result.update(dataset=size, scenario=name)
+            results.append(result)
+            self.stdout.write(
+                f"  {name:<32} p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                f"クエリ {result['queries']:3d}  {result['response_bytes']:>12,} バイト  "
+                f"メモリ {result['peak_memory_bytes'] / 1024 / 1024:7.1f} MB"
+            )
+        if size > options['map_max_rows']:
+            self.stdout.write(f"  create_map_html は {options['map_max_rows']:,} 件を超えるため省略しました")
+        return results
+
+    def _measure(self, call, iterations, clear_cache):
+        # 1回目は準備（テンプレートの読み込みなど）を含むので、計測から外す
+        if clear_cache:
+            cache.clear()
+        call()
+
+        timings = []
+        for _ in range(iterations):
+            if clear_cache:
+                cache.clear()
+            started = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # クエリ数・レスポンスの大きさ・メモリの最大使用量は、時間の計測とは別に1回だけ測る
+        if clear_cache:
+            cache.clear()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                response = call()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if isinstance(response, str):
+            size = len(response.encode('utf-8'))
+            status = 200
+        else:
+            size = _response_bytes(response)
+            status = response.status_code
+
+        return {
+            'iterations': iterations,
+            'status': status,
+            'mean_ms': round(statistics.mean(timings), 3),
+            'p50_ms': round(_percentile(timings, 50), 3),
+            'p95_ms': round(_percentile(timings, 95), 3),
+            'p99_ms': round(_percentile(timings, 99), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': len(queries),
+            'response_bytes': size,
+            'peak_memory_bytes': peak,
+        }
+
+    def _compare(self, results, path):
+        """
+        以前の結果と p50 を比べて表示する
+        """
+        with open(path, encoding='utf-8') as f:
+            previous = {(r['dataset'], r['scenario']): r for r in json.load(f)['results']}
+        self.stdout.write(f"\n{path} との比較（p50）:")
+        for result in results:
+            before = previous.get((result['dataset'], result['scenario']))
+            if before is None:
+                continue
+            ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+            style = self.style.ERROR if ratio > 1.2 else self.style.SUCCESS if ratio < 0.8 else str
+            self.stdout.write(style(
+                f"  {result['dataset']:>9,} {result['scenario']:<32} "
+                f"{before['p50_ms']:9.2f} → {result['p50_ms']:9.2f} ms（{ratio:.2f} 倍）"
+            ))
@@ -0,0 +1,47 @@
+# archive_app/management/commands/run_upload_worker.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from archive_app.jobs import claim_next_job, requeue_stale_jobs, run_job
+from archive_app.models import UploadJob
+
+
+class Command(BaseCommand):
+    help = 'スプールされたアップロードのジョブを処理するワーカー'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='処理待ちのジョブが無くなったら終了する',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='処理待ちのジョブが無いときに待つ時間（秒）',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('アップロードのワーカーを開始します')
+        last_requeue = 0
+        while True:
+            # 止まったワーカーが残した「処理中」のジョブを定期的に戻す
+            if time.monotonic() - last_requeue > 60:
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(f"{requeued} 件のジョブを処理待ちに戻しました")
+                last_requeue = time.monotonic()
+
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            job = run_job(job)
+            message = f"ジョブ {job.pk} ({job.storage_file_name}): {job.get_status_display()}"
+            if job.status == UploadJob.STATUS_DONE:
+                self.stdout.write(self.style.SUCCESS(message))
+            else:
+                self.stdout.write(self.style.WARNING(f"{message} {job.last_error}"))
@@ -0,0 +1,66 @@
+# archive_app/management/commands/warm_geocode_cache.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from archive_app import geocache
+from archive_app.models import Archive
+from archive_app.utils import geocode_address, reverse_geocode
+
+
+class Command(BaseCommand):
+    help = 'ジオコーディングのキャッシュを事前に作成する（登録済みの住所・座標、または住所リストから）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='1行に1件の住所を書いたテキストファイル（指定しない場合は登録済みのデータを使う）',
+        )
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='キャッシュが有効でも地理院APIに問い合わせ直す',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0.2,
+            help='地理院APIへの問い合わせの間隔（秒）',
+        )
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                addresses = [line.strip() for line in f if line.strip()]
+            coordinates = []
+        else:
+            addresses = list(
+                Archive.objects.exclude(address='').values_list('address', flat=True).distinct()
+            )
+            coordinates = list(
+                Archive.objects.values_list('latitude', 'longitude').distinct()
+            )
+
+        # 正規化すると同じになる住所・丸めると同じになる座標は1回だけ問い合わせる
+        addresses = list({geocache.normalize_address(a): a for a in addresses}.values())
+        coordinates = list({geocache.coordinate_key(lat, lon): (lat, lon) for lat, lon in coordinates}.values())
+        self.stdout.write(f"住所 {len(addresses)} 件、座標 {len(coordinates)} 件のキャッシュを作成します")
+
+        for address in addresses:
+            self._throttled(options, lambda: geocode_address(address, refresh=options['refresh']))
+        for lat, lon in coordinates:
+            self._throttled(options, lambda: reverse_geocode(lat, lon, refresh=options['refresh']))
+
+        for (kind, result), count in sorted(geocache.get_stats().items()):
+            self.stdout.write(f"  {kind} {result}: {count}")
+        self.stdout.write(self.style.SUCCESS('完了しました'))
+
+    def _throttled(self, options, call):
+        """
+        キャッシュに無かった（APIに問い合わせた）ときだけ間隔をあける
+        """
+        misses_before = self._misses()
+        call()
+        if self._misses() > misses_before and options['sleep']:
+            time.sleep(options['sleep'])
+
+    def _misses(self):
+        return sum(count for (kind, result), count in geocache.get_stats().items() if result == 'miss')
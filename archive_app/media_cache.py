@@ -0,0 +1,206 @@
+# archive_app/media_cache.py
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import counter
+
+# キャッシュの利用状況（result は hit / revalidated / miss / bypass のいずれか。
+# revalidated は有効期間を過ぎたものを取得元に確認して、変更が無かったのでキャッシュから返したもの）
+MEDIA_CACHE_REQUESTS = counter(
+    'archive_media_cache_requests_total',
+    'ダウンロード用ディスクキャッシュの参照回数',
+    ('result',),
+)
+
+# キャッシュから本体を返したことで、取得元から転送せずに済んだバイト数（304 で返したものは含まない）
+MEDIA_CACHE_BYTES_SAVED = counter(
+    'archive_media_cache_bytes_saved_total',
+    'ディスクキャッシュから返したバイト数',
+)
+
+# キャッシュに書き込んだバイト数
+MEDIA_CACHE_BYTES_WRITTEN = counter(
+    'archive_media_cache_bytes_written_total',
+    'ディスクキャッシュに書き込んだバイト数',
+)
+
+
+class MediaCache:
+    """
+    ダウンロードするファイルのディスクキャッシュ
+    ファイルのURLごとに本体（.data）とメタデータ（.json、ETagなど）を保存し、
+    合計サイズが上限を超えたら最近使われていないものから削除する
+    有効期間（fresh_seconds）を過ぎたものは、保存した ETag の条件付きGETで変更が無いことを確かめてから使う
+    """
+
+    def __init__(self, directory, max_bytes, max_object_bytes, fresh_seconds):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.fresh_seconds = fresh_seconds
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / f"{key}.data", self.directory / f"{key}.json"
+
+    def lookup(self, url):
+        """
+        キャッシュ済みなら (本体のパス, メタデータ, 有効期間内か) を、無ければ None を返す
+        （有効期間を過ぎたものは、保存した ETag で取得元に確認してから使う）
+        """
+        data_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            stat = data_path.stat()
+        except (FileNotFoundError, ValueError):
+            return None
+        if meta.get('url') != url or stat.st_size != meta.get('size'):
+            return None
+        fresh = time.time() - meta['stored_at'] <= self.fresh_seconds
+        if fresh:
+            # 最近使ったものとして更新日時を新しくする（LRUの順序に使う）
+            os.utime(data_path)
+        return data_path, meta, fresh
+
+    def revalidated(self, url, meta):
+        """
+        取得元が変更なし（304）と答えたので、有効期間を延ばして最近使ったものにする
+        """
+        data_path, meta_path = self._paths(url)
+        self._write_meta(meta_path, {**meta, 'stored_at': time.time()})
+        os.utime(data_path)
+
+    def should_store(self, upstream):
+        """
+        取得元の応答をキャッシュしてよいか（全体の取得で、ETagがあり、大きすぎないもの）
+        """
+        if upstream.status_code != 200 or 'ETag' not in upstream.headers:
+            return False
+        length = upstream.headers.get('Content-Length')
+        return length is not None and int(length) <= self.max_object_bytes
+
+    def stream_and_store(self, url, upstream, chunks):
+        """
+        取得元から受け取ったデータをクライアントに返しながら、一時ファイルに書き込む
+        最後まで受け取れた場合だけ、一時ファイルを置き換えてキャッシュにする
+        （途中で切断された場合は一時ファイルを削除する）
+        """
+        tmp_path = self.directory / f".{uuid.uuid4().hex}.tmp"
+        written = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+        finally:
+            self._finish_store(url, upstream, tmp_path, written)
+
+    async def astream_and_store(self, url, upstream, chunks):
+        """
+        stream_and_store() の非同期版（chunks は非同期イテレーター）
+        """
+        tmp_path = self.directory / f".{uuid.uuid4().hex}.tmp"
+        written = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    yield chunk
+        finally:
+            self._finish_store(url, upstream, tmp_path, written)
+
+    def _finish_store(self, url, upstream, tmp_path, written):
+        data_path, meta_path = self._paths(url)
+        if written == int(upstream.headers['Content-Length']):
+            os.replace(tmp_path, data_path)
+            self._write_meta(meta_path, {
+                'url': url,
+                'etag': upstream.headers['ETag'],
+                'last_modified': upstream.headers.get('Last-Modified'),
+                'content_type': upstream.headers.get('Content-Type', 'application/octet-stream'),
+                'size': written,
+                'stored_at': time.time(),
+            })
+            MEDIA_CACHE_BYTES_WRITTEN.inc(written)
+            self.evict()
+        else:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+    def _write_meta(self, meta_path, meta):
+        tmp_path = self.directory / f".{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def evict(self):
+        """
+        合計サイズが上限を超えていたら、最近使われていないものから削除する
+        """
+        entries = []
+        total = 0
+        for data_path in self.directory.glob('*.data'):
+            try:
+                stat = data_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, data_path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, data_path in entries:
+            if total <= self.max_bytes:
+                break
+            for path in (data_path, data_path.with_suffix('.json')):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+_media_cache = None
+
+
+def get_media_cache():
+    """
+    ディスクキャッシュを返す（MEDIA_CACHE_DIR が設定されていなければ None）
+    """
+    global _media_cache
+    if not settings.MEDIA_CACHE_DIR:
+        return None
+    if _media_cache is None:
+        _media_cache = MediaCache(
+            settings.MEDIA_CACHE_DIR,
+            settings.MEDIA_CACHE_MAX_BYTES,
+            settings.MEDIA_CACHE_MAX_OBJECT_BYTES,
+            settings.MEDIA_CACHE_FRESH_SECONDS,
+        )
+    return _media_cache
+
+
+def get_stats():
+    """
+    キャッシュのヒット率と節約できたバイト数を返す
+    """
+    requests = {result: count for (result,), count in MEDIA_CACHE_REQUESTS.samples().items()}
+    hits = requests.get('hit', 0) + requests.get('revalidated', 0)
+    lookups = hits + requests.get('miss', 0)
+    return {
+        'requests': requests,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'bytes_saved': MEDIA_CACHE_BYTES_SAVED.samples().get((), 0),
+        'bytes_written': MEDIA_CACHE_BYTES_WRITTEN.samples().get((), 0),
+    }
@@ -0,0 +1,330 @@
+# archive_app/metadata.py
+
+import logging
+import re
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# EXIFの値の型ごとのバイト数
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# EXIFのタグ番号
+_TAG_DATETIME = 0x0132
+_TAG_EXIF_IFD = 0x8769
+_TAG_GPS_IFD = 0x8825
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_OFFSET_TIME_ORIGINAL = 0x9011
+_GPS_LATITUDE_REF, _GPS_LATITUDE, _GPS_LONGITUDE_REF, _GPS_LONGITUDE = 1, 2, 3, 4
+
+# MP4/MOVのボックスのうち、ファイルの先頭に来るもの
+_ISO_BMFF_TYPES = {b'ftyp', b'moov', b'wide', b'free', b'mdat', b'skip'}
+# MP4の時刻の基準（1904年1月1日 UTC）
+_MP4_EPOCH = datetime(1904, 1, 1, tzinfo=dt_timezone.utc)
+
+# ISO 6709 形式の位置（例: "+35.6586+139.7454+010.000/"）
+_ISO6709_RE = re.compile(r'([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)')
+
+
+def extract_metadata(file_obj):
+    """
+    写真・動画に埋め込まれた撮影位置と撮影日時を読み取る
+    {'latitude': ..., 'longitude': ..., 'captured_at': ...} のうち、見つかったものだけを返す
+
+    EXIF・XMPはファイルの先頭 METADATA_READ_BYTES バイトだけを読み、
+    MP4/MOVはボックスの見出しをたどって moov ボックスだけを読む（ファイル全体は読まない）
+    """
+    result = {}
+    try:
+        file_obj.seek(0)
+        head = file_obj.read(settings.METADATA_READ_BYTES)
+        parsers = [lambda: _parse_exif_in(head), lambda: _parse_xmp(head)]
+        if head[4:8] in _ISO_BMFF_TYPES:
+            parsers.insert(0, lambda: _parse_mp4(file_obj))
+        for parse in parsers:
+            try:
+                for key, value in parse().items():
+                    result.setdefault(key, value)
+            except Exception as e:
+                # 壊れたメタデータがあっても、アップロード自体は続ける
+                logger.warning("メタデータを読み取れませんでした: %s", e)
+    finally:
+        file_obj.seek(0)
+    return _valid(result)
+
+
+def _valid(result):
+    # 0,0 や範囲外の座標は、位置情報が無いものとして扱う
+    lat, lon = result.get('latitude'), result.get('longitude')
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        result.pop('latitude', None)
+        result.pop('longitude', None)
+    return result
+
+
+def _make_aware(value, offset=None):
+    if offset:
+        match = re.fullmatch(r'([+-])(\d{2}):?(\d{2})', offset.strip())
+        if match:
+            sign = 1 if match.group(1) == '+' else -1
+            delta = timedelta(hours=int(match.group(2)), minutes=int(match.group(3)))
+            return value.replace(tzinfo=dt_timezone(sign * delta))
+    if timezone.is_naive(value):
+        # 時差が書かれていない場合は、アプリのタイムゾーンでの時刻とみなす
+        return timezone.make_aware(value)
+    return value
+
+
+# --- EXIF ---
+
+def _parse_exif_in(data):
+    start = data.find(b'Exif\x00\x00')
+    if start < 0:
+        return {}
+    return parse_exif(data[start + 6:])
+
+
+def parse_exif(tiff):
+    """
+    EXIF（TIFF形式）のデータから撮影位置と撮影日時を読み取る
+    """
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        return {}
+
+    ifd0 = _read_ifd(tiff, struct.unpack_from(endian + 'I', tiff, 4)[0], endian)
+    exif = _read_ifd(tiff, ifd0[_TAG_EXIF_IFD], endian) if _TAG_EXIF_IFD in ifd0 else {}
+    gps = _read_ifd(tiff, ifd0[_TAG_GPS_IFD], endian) if _TAG_GPS_IFD in ifd0 else {}
+
+    result = {}
+    if all(tag in gps for tag in (_GPS_LATITUDE, _GPS_LONGITUDE)):
+        lat = _dms_to_degrees(gps[_GPS_LATITUDE])
+        lon = _dms_to_degrees(gps[_GPS_LONGITUDE])
+        if gps.get(_GPS_LATITUDE_REF, 'N').upper().startswith('S'):
+            lat = -lat
+        if gps.get(_GPS_LONGITUDE_REF, 'E').upper().startswith('W'):
+            lon = -lon
+        result.update(latitude=lat, longitude=lon)
+
+    taken = exif.get(_TAG_DATETIME_ORIGINAL) or ifd0.get(_TAG_DATETIME)
+    if isinstance(taken, str):
+        try:
+            captured_at = datetime.strptime(taken.strip(), '%Y:%m:%d %H:%M:%S')
+            result['captured_at'] = _make_aware(captured_at, exif.get(_TAG_OFFSET_TIME_ORIGINAL))
+        except ValueError:
+            pass
+    return result
+
+
+def _read_ifd(tiff, offset, endian):
+    """
+    IFD（タグの一覧）を {タグ番号: 値} の辞書として読む
+    """
+    entries = {}
+    if not isinstance(offset, int) or offset + 2 > len(tiff):
+        return entries
+    count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, value_type, value_count = struct.unpack_from(endian + 'HHI', tiff, entry)
+        size = _TIFF_TYPE_SIZES.get(value_type)
+        if size is None:
+            continue
+        value_offset = entry + 8
+        if size * value_count > 4:
+            value_offset = struct.unpack_from(endian + 'I', tiff, entry + 8)[0]
+        raw = tiff[value_offset:value_offset + size * value_count]
+        if len(raw) < size * value_count:
+            continue
+        entries[tag] = _decode_tiff_value(raw, value_type, value_count, endian)
+    return entries
+
+
+def _decode_tiff_value(raw, value_type, count, endian):
+    if value_type == 2:
+        return raw.split(b'\x00', 1)[0].decode('ascii', 'ignore')
+    if value_type in (5, 10):
+        code = 'I' if value_type == 5 else 'i'
+        numbers = struct.unpack(endian + code * (2 * count), raw)
+        values = [n / d if d else 0.0 for n, d in zip(numbers[::2], numbers[1::2])]
+    else:
+        code = {1: 'B', 7: 'B', 3: 'H', 4: 'I', 9: 'i'}[value_type]
+        values = list(struct.unpack(endian + code * count, raw))
+    return values[0] if count == 1 else values
+
+
+def _dms_to_degrees(value):
+    if not isinstance(value, list):
+        return float(value)
+    degrees, minutes, seconds = (list(value) + [0, 0, 0])[:3]
+    return degrees + minutes / 60 + seconds / 3600
+
+
+# --- XMP ---
+
+def _parse_xmp(data):
+    start = data.find(b'<x:xmpmeta')
+    if start < 0:
+        return {}
+    end = data.find(b'</x:xmpmeta>', start)
+    xmp = data[start:end if end > 0 else len(data)].decode('utf-8', 'ignore')
+
+    def value(name):
+        # 属性（name="..."）と要素（<name>...</name>）のどちらの書き方にも対応する
+        match = re.search(rf'{name}\s*=\s*"([^"]*)"', xmp) or re.search(rf'<{name}>([^<]*)</{name}>', xmp)
+        return match.group(1).strip() if match else None
+
+    result = {}
+    lat, lon = value('exif:GPSLatitude'), value('exif:GPSLongitude')
+    if lat and lon:
+        try:
+            result.update(latitude=_xmp_coordinate(lat), longitude=_xmp_coordinate(lon))
+        except ValueError:
+            pass
+
+    for name in ('exif:DateTimeOriginal', 'photoshop:DateCreated', 'xmp:CreateDate'):
+        taken = value(name)
+        if taken:
+            try:
+                result['captured_at'] = _make_aware(datetime.fromisoformat(taken))
+                break
+            except ValueError:
+                continue
+    return result
+
+
+def _xmp_coordinate(text):
+    """
+    XMPの座標（"35,39.516N" や "35,39,31N"、"35.6586" の形式）を度に変換する
+    """
+    direction = text[-1].upper() if text[-1].isalpha() else ''
+    parts = [float(part) for part in text.rstrip('NSEWnsew').split(',')]
+    degrees = _dms_to_degrees(parts) if len(parts) > 1 else parts[0]
+    return -degrees if direction in ('S', 'W') else degrees
+
+
+# --- MP4 / MOV ---
+
+def _iter_boxes(data, start=0, end=None):
+    """
+    メモリ上のデータに含まれるボックスを (種類, 中身の開始位置, 終了位置) で順に返す
+    """
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, position)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header or position + size > end:
+            break
+        yield box_type, position + header, position + size
+        position += size
+
+
+def _find_moov(file_obj):
+    """
+    ファイルの見出しだけをたどって moov ボックスを探し、その中身を返す
+    （撮影直後の動画は moov がファイルの最後にあることが多い）
+    """
+    file_obj.seek(0, 2)
+    file_size = file_obj.tell()
+    position = 0
+    while position + 8 <= file_size:
+        file_obj.seek(position)
+        header = file_obj.read(16)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack_from('>I4s', header)
+        header_size = 8
+        if size == 1 and len(header) >= 16:
+            size = struct.unpack_from('>Q', header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - position
+        if size < header_size:
+            break
+        if box_type == b'moov':
+            if size > settings.METADATA_MAX_MOOV_BYTES:
+                return None
+            file_obj.seek(position + header_size)
+            return file_obj.read(size - header_size)
+        position += size
+    return None
+
+
+def _parse_mp4(file_obj):
+    moov = _find_moov(file_obj)
+    if not moov:
+        return {}
+
+    result = {}
+    location = None
+    for box_type, start, end in _iter_boxes(moov):
+        if box_type == b'mvhd':
+            version = moov[start]
+            seconds = struct.unpack_from('>Q' if version == 1 else '>I', moov, start + 4)[0]
+            if seconds:
+                result['captured_at'] = _MP4_EPOCH + timedelta(seconds=seconds)
+        elif box_type == b'udta':
+            for child_type, child_start, child_end in _iter_boxes(moov, start, end):
+                if child_type == b'\xa9xyz':
+                    # 2バイトの長さ・2バイトの言語コードの後に ISO 6709 形式の文字列が続く
+                    location = location or moov[child_start + 4:child_end].decode('utf-8', 'ignore')
+        elif box_type == b'meta':
+            items = _quicktime_metadata(moov, start, end)
+            location = items.get('com.apple.quicktime.location.ISO6709') or location
+            created = items.get('com.apple.quicktime.creationdate')
+            if created:
+                try:
+                    result['captured_at'] = _make_aware(datetime.fromisoformat(created))
+                except ValueError:
+                    pass
+
+    if location:
+        match = _ISO6709_RE.match(location.strip())
+        if match:
+            result.update(latitude=float(match.group(1)), longitude=float(match.group(2)))
+    return result
+
+
+def _quicktime_metadata(data, start, end):
+    """
+    QuickTimeのメタデータ（meta ボックス内の keys と ilst）を {キー: 文字列} で返す
+    """
+    children = list(_iter_boxes(data, start, end))
+    if not children or children[0][0] != b'hdlr':
+        # ISO形式の meta ボックスは、先頭に4バイトのバージョン・フラグがある
+        children = list(_iter_boxes(data, start + 4, end))
+
+    keys, values = [], {}
+    for box_type, box_start, box_end in children:
+        if box_type == b'keys':
+            count = struct.unpack_from('>I', data, box_start + 4)[0]
+            position = box_start + 8
+            for _ in range(count):
+                size = struct.unpack_from('>I', data, position)[0]
+                if size < 8 or position + size > box_end:
+                    # 壊れたファイルで同じ位置を読み続けないよう、ボックスの外に出たら止める
+                    break
+                keys.append(data[position + 8:position + size].decode('utf-8', 'ignore'))
+                position += size
+        elif box_type == b'ilst':
+            for item_type, item_start, item_end in _iter_boxes(data, box_start, box_end):
+                index = struct.unpack('>I', item_type)[0]
+                for data_type, data_start, data_end in _iter_boxes(data, item_start, item_end):
+                    if data_type == b'data':
+                        # 4バイトの型・4バイトのロケールの後に値が続く
+                        values[index] = data[data_start + 8:data_end].decode('utf-8', 'ignore')
+    return {keys[index - 1]: value for index, value in values.items() if 0 < index <= len(keys)}
@@ -0,0 +1,198 @@
+# archive_app/metrics.py
+
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+# 登録されている全メトリクス（名前 → メトリクス）
+REGISTRY = {}
+
+
+class Counter:
+    """
+    ラベルごとに値が増えていくだけの単純なカウンター（プロセス内で集計）
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """
+        {(ラベルの値, ...): 値} の辞書を返す
+        """
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram:
+    """
+    観測値の分布（バケットごとの件数・合計・件数）をラベルごとに記録するヒストグラム
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            entry = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def samples(self):
+        """
+        {(ラベルの値, ...): {'buckets': [...], 'sum': 合計, 'count': 件数}} の辞書を返す
+        （buckets は各上限値以下の累積件数）
+        """
+        with self._lock:
+            return {
+                key: {'buckets': list(entry['buckets']), 'sum': entry['sum'], 'count': entry['count']}
+                for key, entry in self._values.items()
+            }
+
+
+def counter(name, documentation, labelnames=()):
+    """
+    カウンターを作成して登録する（同じ名前なら登録済みのものを返す）
+    """
+    if name not in REGISTRY:
+        REGISTRY[name] = Counter(name, documentation, labelnames)
+    return REGISTRY[name]
+
+
+def histogram(name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+    """
+    ヒストグラムを作成して登録する（同じ名前なら登録済みのものを返す）
+    """
+    if name not in REGISTRY:
+        REGISTRY[name] = Histogram(name, documentation, labelnames, buckets)
+    return REGISTRY[name]
+
+
+# 処理ごとの所要時間（trace で囲んだ処理）
+OPERATION_LATENCY = histogram(
+    'archive_operation_seconds',
+    'ジオコーディング・ストレージ・地図生成などの処理時間（秒）',
+    ('operation', 'outcome'),
+)
+
+# リクエストの処理中に trace で計測した処理の記録（遅いリクエストのログに使う）
+# 非同期のビューから sync_to_async で呼ばれた処理も記録できるよう、contextvars を使う
+_request_spans = contextvars.ContextVar('archive_request_spans', default=None)
+
+
+def start_request_spans():
+    _request_spans.set([])
+
+
+def pop_request_spans():
+    items = _request_spans.get() or []
+    _request_spans.set(None)
+    return items
+
+
+def _record_span(operation, outcome, start):
+    elapsed = time.perf_counter() - start
+    OPERATION_LATENCY.observe(elapsed, operation=operation, outcome=outcome)
+    items = _request_spans.get()
+    if items is not None:
+        items.append((operation, elapsed))
+
+
+def trace(operation):
+    """
+    関数の処理時間を archive_operation_seconds に記録するデコレーター（async def の関数にも使える）
+    リクエストの処理中であれば、遅いリクエストのログにも内訳として出す
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                outcome = 'error'
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = 'ok'
+                    return result
+                finally:
+                    _record_span(operation, outcome, start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outcome = 'error'
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                _record_span(operation, outcome, start)
+        return wrapper
+    return decorator
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus():
+    """
+    登録されている全メトリクスを Prometheus のテキスト形式（version 0.0.4）で返す
+    """
+    lines = []
+    for name in sorted(REGISTRY):
+        metric = REGISTRY[name]
+        help_text = metric.documentation.replace('\\', '\\\\').replace('\n', '\\n')
+        lines.append(f'# HELP {name} {help_text}')
+        if isinstance(metric, Histogram):
+            lines.append(f'# TYPE {name} histogram')
+            for key, entry in sorted(metric.samples().items()):
+                bounds = list(metric.buckets) + [float('inf')]
+                counts = entry['buckets'] + [entry['count']]
+                for bound, count in zip(bounds, counts):
+                    labels = _format_labels(metric.labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f'{name}_bucket{labels} {count}')
+                labels = _format_labels(metric.labelnames, key)
+                lines.append(f'{name}_sum{labels} {_format_value(entry["sum"])}')
+                lines.append(f'{name}_count{labels} {entry["count"]}')
+        else:
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(metric.samples().items()):
+                lines.append(f'{name}{_format_labels(metric.labelnames, key)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
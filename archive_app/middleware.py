@@ -0,0 +1,206 @@
+# archive_app/middleware.py
+
+import contextvars
+import logging
+import re
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import counter, histogram, pop_request_spans, start_request_spans
+
+logger = logging.getLogger(__name__)
+
+# ビューごとの処理時間（ストリーミングの場合はレスポンスを返し始めるまで）
+REQUEST_LATENCY = histogram(
+    'archive_request_seconds',
+    'リクエストの処理時間（秒）',
+    ('view', 'method', 'status'),
+)
+
+# 1リクエストあたりのSQLの実行回数・時間
+REQUEST_DB_QUERIES = histogram(
+    'archive_request_db_queries',
+    '1リクエストで実行したSQLの回数',
+    ('view',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_DB_SECONDS = histogram(
+    'archive_request_db_seconds',
+    '1リクエストでSQLの実行にかかった時間（秒）',
+    ('view',),
+)
+
+SLOW_REQUESTS = counter(
+    'archive_slow_requests_total',
+    'SLOW_REQUEST_THRESHOLD を超えたリクエストの回数',
+    ('view',),
+)
+
+# SQLの値の部分（文字列・数値）。ログで同じ形のSQLをまとめるために ? に置き換える
+_SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class QueryRecorder:
+    """
+    リクエスト中に実行したSQLの回数と時間を記録する（DEBUG = False でも使える）
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            entry = self.statements[_SQL_LITERAL_RE.sub('?', sql)]
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def breakdown(self, limit):
+        """
+        時間のかかったSQLを (SQL, 回数, 合計時間) で上位 limit 件返す
+        """
+        return sorted(
+            ((sql, count, seconds) for sql, (count, seconds) in self.statements.items()),
+            key=lambda entry: entry[2], reverse=True,
+        )[:limit]
+
+
+# 処理中のリクエストの QueryRecorder。非同期のビューではSQLが別のスレッド（sync_to_async）で
+# 実行されるので、スレッドではなく contextvars でリクエストと結びつける
+_current_recorder = contextvars.ContextVar('archive_query_recorder', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    データベース接続にSQLの記録用のラッパーを登録する（接続ごとに1回だけ）
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def _view_name(request):
+    # URLに含まれる値ごとにラベルが増えないよう、URL名（なければビュー関数名）を使う
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name or 'unknown'
+
+
+class RequestMetricsMiddleware:
+    """
+    リクエストごとの処理時間・SQLの回数と時間を記録する
+    SLOW_REQUEST_THRESHOLD（秒）を超えたリクエストは、SQLと外部処理の内訳をログに出す
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # 起動前に作られていた接続には connection_created が届かないので、ここでも登録する
+        install_query_recorder(connection)
+        recorder, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed, spans = self._finish(token, start)
+        self._record(request, response, elapsed, recorder, spans)
+        return response
+
+    async def __acall__(self, request):
+        recorder, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed, spans = self._finish(token, start)
+        self._record(request, response, elapsed, recorder, spans)
+        return response
+
+    def _start(self):
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        start_request_spans()
+        return recorder, token, time.perf_counter()
+
+    def _finish(self, token, start):
+        elapsed = time.perf_counter() - start
+        _current_recorder.reset(token)
+        return elapsed, pop_request_spans()
+
+    def _record(self, request, response, elapsed, recorder, spans):
+        view = _view_name(request)
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        REQUEST_DB_QUERIES.observe(recorder.count, view=view)
+        REQUEST_DB_SECONDS.observe(recorder.seconds, view=view)
+
+        threshold = settings.SLOW_REQUEST_THRESHOLD
+        if threshold is not None and elapsed >= threshold:
+            SLOW_REQUESTS.inc(view=view)
+            self._log_slow_request(request, response, view, elapsed, recorder, spans)
+
+    def _log_slow_request(self, request, response, view, elapsed, recorder, spans):
+        lines = [
+            f"遅いリクエスト: {request.method} {request.path} ({view}) {response.status_code} "
+            f"{elapsed * 1000:.0f} ms（SQL {recorder.count} 回 {recorder.seconds * 1000:.0f} ms）"
+        ]
+        for operation, seconds in spans:
+            lines.append(f"  {operation}: {seconds * 1000:.0f} ms")
+        for sql, count, seconds in recorder.breakdown(settings.SLOW_REQUEST_LOG_QUERIES):
+            lines.append(f"  SQL {count} 回 {seconds * 1000:.0f} ms: {sql[:300]}")
+        logger.warning('\n'.join(lines))
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    非同期のリクエストにも対応した WhiteNoiseMiddleware
+    （WhiteNoise は同期専用なので、そのままだと ASGI で全てのリクエストがスレッドを経由する）
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
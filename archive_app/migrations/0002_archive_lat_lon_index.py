@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archive',
+            index=models.Index(fields=['latitude', 'longitude'], name='archive_lat_lon_idx'),
+        ),
+    ]
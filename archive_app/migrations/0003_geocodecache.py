@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0002_archive_lat_lon_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('forward', '住所 → 緯度・経度'), ('reverse', '緯度・経度 → 住所')], max_length=10)),
+                ('key', models.CharField(max_length=512)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('address', models.CharField(blank=True, max_length=255)),
+                ('found', models.BooleanField(default=True)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='geocode_cache_kind_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0003_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', '処理待ち'), ('running', '処理中'), ('done', '完了'), ('failed', '失敗')], default='pending', max_length=10)),
+                ('spool_path', models.CharField(max_length=1024)),
+                ('storage_file_name', models.CharField(max_length=255)),
+                ('file_type', models.CharField(max_length=50)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('address', models.CharField(blank=True, max_length=255)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('archive', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='archive_app.archive')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='upload_job_status_idx')],
+            },
+        ),
+    ]
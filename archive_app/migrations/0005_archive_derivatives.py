@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0004_uploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archive',
+            name='medium_url',
+            field=models.URLField(blank=True, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='archive',
+            name='thumbnail_url',
+            field=models.URLField(blank=True, max_length=1024),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0005_archive_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archive',
+            index=models.Index(fields=['-created_at', '-id'], name='archive_created_id_idx'),
+        ),
+    ]
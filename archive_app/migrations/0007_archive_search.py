@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+def fill_search_text(apps, schema_editor):
+    from archive_app.search import build_search_text
+
+    Archive = apps.get_model('archive_app', 'Archive')
+    for archive in Archive.objects.only('id', 'description', 'address').iterator():
+        Archive.objects.filter(pk=archive.pk).update(
+            search_text=build_search_text(archive.description, archive.address)
+        )
+
+
+def install_search_index(apps, schema_editor):
+    from archive_app.search import install_search_index
+
+    install_search_index(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from archive_app.search import uninstall_search_index
+
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0006_archive_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archive',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+def fill_geohash(apps, schema_editor):
+    from archive_app.geo import encode_geohash
+
+    Archive = apps.get_model('archive_app', 'Archive')
+    for archive in Archive.objects.only('id', 'latitude', 'longitude').iterator():
+        Archive.objects.filter(pk=archive.pk).update(geohash=encode_geohash(archive.latitude, archive.longitude))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0007_archive_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archive',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
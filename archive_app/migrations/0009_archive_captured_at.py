@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0008_archive_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archive',
+            name='captured_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive_app', '0009_archive_captured_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archive',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
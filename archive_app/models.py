@@ -11,6 +11,10 @@ class Archive(models.Model):
     # Supabase上のファイルパス（公開URL）
     file_path = models.URLField(max_length=1024)
 
+    # 画像の縮小版（サムネイル・中サイズ）の公開URL。画像以外や未作成の場合は空
+    thumbnail_url = models.URLField(max_length=1024, blank=True)
+    medium_url = models.URLField(max_length=1024, blank=True)
+
     # 説明文
     description = models.TextField(blank=True, null=True) 
 
@@ -22,17 +26,141 @@ class Archive(models.Model):
 
     # 経度
     longitude = models.FloatField()
+
+    # 緯度・経度のジオハッシュ（近くのデータを探すためのもの。保存時に自動で作られる）
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     
     # 登録日（自動で現在日時が記録される）
     created_at = models.DateTimeField(default=timezone.now)
 
+    # 撮影日時（写真・動画のメタデータから読み取る。無い場合は空）
+    captured_at = models.DateTimeField(blank=True, null=True)
+
+    # ファイルの中身の SHA-256（同じファイルが再度アップロードされたときに、Storage上のファイルを使い回すため）
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+
+    # 全文検索用のテキスト（説明文と住所を n-gram に分けたもの。保存時に自動で作られる）
+    search_text = models.TextField(blank=True, default='', editable=False)
+
     @property
     def file_name(self):
         # ファイルパスからファイル名を抽出
         return os.path.basename(self.file_path)
     
+    class Meta:
+        indexes = [
+            # 地図の表示範囲（バウンディングボックス）で絞り込むための複合インデックス
+            models.Index(fields=['latitude', 'longitude'], name='archive_lat_lon_idx'),
+            # ファイル一覧を新しい順にページ分割するための複合インデックス
+            models.Index(fields=['-created_at', '-id'], name='archive_created_id_idx'),
+        ]
+
     def __str__(self):
         # 管理サイトなどで表示されるときの名前
         return f"{self.description[:20]} at {self.address}"
 
 # Create your models here.
+
+
+class GeocodeCache(models.Model):
+    """
+    地理院APIによるジオコーディング結果のキャッシュ
+    """
+    KIND_FORWARD = 'forward'  # 住所 → 緯度・経度
+    KIND_REVERSE = 'reverse'  # 緯度・経度 → 住所
+    KIND_CHOICES = [
+        (KIND_FORWARD, '住所 → 緯度・経度'),
+        (KIND_REVERSE, '緯度・経度 → 住所'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+
+    # 正規化した住所、または丸めた「緯度,経度」
+    key = models.CharField(max_length=512)
+
+    # 住所 → 緯度・経度 の結果
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+
+    # 緯度・経度 → 住所 の結果
+    address = models.CharField(max_length=255, blank=True)
+
+    # 見つからなかった結果も、短い期限でキャッシュする
+    found = models.BooleanField(default=True)
+
+    # この日時を過ぎたら問い合わせ直す
+    expires_at = models.DateTimeField()
+
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='geocode_cache_kind_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.key}"
+
+
+class UploadJob(models.Model):
+    """
+    バックグラウンドで処理するアップロードのジョブ
+    （ファイルはいったんスプールに保存し、ワーカーがStorageへのアップロード・
+    ジオコーディング・Archiveへの保存を行う）
+    """
+    STATUS_PENDING = 'pending'  # 処理待ち
+    STATUS_RUNNING = 'running'  # 処理中
+    STATUS_DONE = 'done'  # 完了
+    STATUS_FAILED = 'failed'  # 失敗（再試行しない）
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '処理待ち'),
+        (STATUS_RUNNING, '処理中'),
+        (STATUS_DONE, '完了'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    # スプール用のストレージ（settings.UPLOAD_SPOOL_STORAGE）に保存したファイルの名前と、Storage上のファイル名
+    spool_path = models.CharField(max_length=1024)
+    storage_file_name = models.CharField(max_length=255)
+
+    # フォームから送信された内容
+    file_type = models.CharField(max_length=50)
+    description = models.TextField(blank=True, null=True)
+    address = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+
+    # 再試行の管理
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    # 処理が完了したときに作成されたデータ
+    archive = models.ForeignKey(Archive, blank=True, null=True, on_delete=models.SET_NULL)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # ワーカーが次のジョブを探すためのインデックス
+            models.Index(fields=['status', 'run_after'], name='upload_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.storage_file_name} ({self.status})"
+
+
+class CacheVersion(models.Model):
+    """
+    キャッシュのキーに使うバージョン（データセット全体・場所ごと）
+    Archiveが書き込まれるたびに増え、古いバージョンのキャッシュは使われなくなる
+    """
+    # 'dataset'、または 'location:<緯度>:<経度>'
+    key = models.CharField(max_length=255, unique=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
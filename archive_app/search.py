@@ -0,0 +1,192 @@
+# archive_app/search.py
+
+import logging
+import re
+import unicodedata
+from django.db import OperationalError, connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from .models import Archive
+
+logger = logging.getLogger(__name__)
+
+# SQLiteで使う全文検索用の仮想テーブル（FTS5）
+FTS_TABLE = 'archive_search'
+# Postgresで使う全文検索用のGINインデックス
+GIN_INDEX = 'archive_search_gin'
+
+# 英数字の単語と、それ以外の文字（日本語など）の並びに分ける
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[^\W_a-z0-9]+')
+
+
+def _segments(text):
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return _TOKEN_RE.findall(text)
+
+
+def _is_word(segment):
+    return segment.isascii()
+
+
+def _bigrams(segment):
+    if len(segment) == 1:
+        return [segment]
+    return [segment[i:i + 2] for i in range(len(segment) - 1)]
+
+
+def _index_tokens(segment):
+    if _is_word(segment) or len(segment) == 1:
+        return [segment]
+    # 1文字での検索（前方一致）でも末尾の文字が見つかるよう、最後の1文字も登録する
+    return _bigrams(segment) + [segment[-1]]
+
+
+def build_search_text(*values):
+    """
+    説明文・住所などから、全文検索用のテキスト（空白区切りのトークン）を作る
+    日本語は単語の区切りがないので、2文字ずつの n-gram に分けて登録する
+    例: "東京都 港区" → "東京 京都 都 港区 区"
+    """
+    tokens = []
+    for value in values:
+        for segment in _segments(value):
+            tokens.extend(_index_tokens(segment))
+    return ' '.join(tokens)
+
+
+def _fts5_query(query):
+    # 英数字は前方一致、日本語は n-gram のフレーズ（連続して現れること）で検索する
+    terms = []
+    for segment in _segments(query):
+        if _is_word(segment) or len(segment) == 1:
+            terms.append(f'"{segment}"*')
+        else:
+            terms.append('"' + ' '.join(_bigrams(segment)) + '"')
+    return ' '.join(terms)
+
+
+def _tsquery(query):
+    terms = []
+    for segment in _segments(query):
+        if _is_word(segment) or len(segment) == 1:
+            terms.append(f"'{segment}':*")
+        else:
+            terms.append(' <-> '.join(f"'{gram}'" for gram in _bigrams(segment)))
+    return ' & '.join(terms)
+
+
+def _has_fts_table(conn):
+    return FTS_TABLE in conn.introspection.table_names()
+
+
+def search_archives(query, queryset=None):
+    """
+    説明文と住所を全文検索し、関連度の高い順に並べたクエリセットを返す
+    queryset を渡すと、その条件（表示範囲など）と組み合わせて検索する
+
+    SQLiteではFTS5、Postgresでは tsvector + GINインデックスを使う
+    どちらも使えない場合は、n-gram の部分一致で検索する（新しい順）
+    """
+    if queryset is None:
+        queryset = Archive.objects.all()
+    if not _segments(query):
+        return queryset.none()
+
+    table = Archive._meta.db_table
+    if connection.vendor == 'sqlite' and _has_fts_table(connection):
+        # bm25 は値が小さいほど関連度が高い
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[_fts5_query(query)],
+            select={'rank': f'bm25({FTS_TABLE})'},
+        ).order_by('rank', '-id')
+
+    if connection.vendor == 'postgresql':
+        tsquery = _tsquery(query)
+        vector = f"to_tsvector('simple', {table}.search_text)"
+        return queryset.annotate(
+            rank=RawSQL(f"ts_rank({vector}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField()),
+        ).extra(
+            where=[f"{vector} @@ to_tsquery('simple', %s)"],
+            params=[tsquery],
+        ).order_by('-rank', '-id')
+
+    for segment in _segments(query):
+        queryset = queryset.filter(search_text__contains=segment if _is_word(segment) else ' '.join(_bigrams(segment)))
+    return queryset.order_by('-created_at', '-id')
+
+
+def install_search_index(conn):
+    """
+    全文検索用のインデックスを作成する（すでにあれば何もしない）
+    SQLiteではテーブルの作り直しでトリガーが消えることがあるので、マイグレーションのたびに呼び出す
+    """
+    table = Archive._meta.db_table
+    with conn.cursor() as cursor:
+        # マイグレーションを戻して search_text 列がない場合は作らない
+        if table not in conn.introspection.table_names(cursor):
+            return
+        columns = {column.name for column in conn.introspection.get_table_description(cursor, table)}
+        if 'search_text' not in columns:
+            return
+
+        if conn.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON {table} "
+                f"USING gin (to_tsvector('simple', search_text))"
+            )
+            return
+
+        if conn.vendor != 'sqlite':
+            return
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                       [f'{FTS_TABLE}%'])
+        existing = {row[0] for row in cursor.fetchall()}
+        statements = {
+            FTS_TABLE: (
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"search_text, content='{table}', content_rowid='id', tokenize='unicode61')"
+            ),
+            f'{FTS_TABLE}_ai': (
+                f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END"
+            ),
+            f'{FTS_TABLE}_ad': (
+                f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) "
+                f"VALUES ('delete', old.id, old.search_text); END"
+            ),
+            f'{FTS_TABLE}_au': (
+                f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF search_text ON {table} BEGIN "
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) "
+                f"VALUES ('delete', old.id, old.search_text); "
+                f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END"
+            ),
+        }
+        missing = [name for name in statements if name not in existing]
+        if not missing:
+            return
+        try:
+            for name in missing:
+                cursor.execute(statements[name])
+        except OperationalError as e:
+            # FTS5が使えないSQLiteでは、部分一致の検索で代用する
+            logger.warning("全文検索インデックスを作成できませんでした: %s", e)
+            return
+        # 作成・再作成した場合は、現在のデータから索引を作り直す
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_index(conn):
+    """
+    install_search_index で作成したインデックスを削除する
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {GIN_INDEX}")
+        elif conn.vendor == 'sqlite':
+            for suffix in ('_ai', '_ad', '_au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
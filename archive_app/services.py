@@ -1,27 +1,392 @@
 # archive_app/services.py
 
 import os
-import folium
-from folium.plugins import MarkerCluster
-from supabase import create_client
-import urllib.parse
+import array
+import base64
+import gzip
+import hashlib
+import importlib.util
+import json
+import sys
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Floor
+from django.template.loader import render_to_string
+from django.urls import reverse
 from .models import Archive  # 👈 データベースのArchiveモデルをインポート
+from .caching import (
+    bump_dataset_version, bump_location_versions, get_dataset_version, get_edit_version, get_location_versions,
+    get_or_build,
+)
+from .geo import bbox_condition, encode_geohash
+from .metadata import extract_metadata
+from .metrics import trace
+from .search import build_search_text
+from .storage import get_archive_storage
+from .thumbnails import generate_derivatives
+from .utils import geocode_address, reverse_geocode
 
+
+def filter_by_bbox(queryset, bbox):
+    """
+    (south, west, north, east) の範囲内にあるデータだけに絞り込む
+    （latitude/longitude の複合インデックスを使った範囲検索になる）
+    """
+    if bbox is None:
+        return queryset
+    return queryset.filter(bbox_condition(*bbox))
+
+
+def serialize_marker(item):
+    """
+    Archiveのデータ1件を、JavaScriptで扱いやすいマーカー用の辞書に変換する
+    """
+    return {
+        'id': item.id,
+        'latitude': item.latitude,
+        'longitude': item.longitude,
+        'address': item.address,
+        'file_type': item.file_type,
+        'description': item.description,
+        'file_name': os.path.basename(item.file_path),
+        'file_url': item.file_path,
+        'thumbnail_url': item.thumbnail_url,
+        'upload_date': item.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'captured_at': item.captured_at.isoformat() if item.captured_at else None,
+    }
+
+
+# get_markers の応答の形式
+#   json:     マーカーごとのオブジェクトの配列（詳細な情報を含む）
+#   columnar: 列ごとの配列（ID・緯度・経度・種類の番号）。ピンを描くのに必要な情報だけを返す
+#   binary:   columnar と同じ内容を、リトルエンディアンの配列を並べたバイト列で返す
+#             （Float64 の ID × n、Float32 の緯度 × n、Float32 の経度 × n、Uint8 の種類の番号 × n）
+#             ID は BigAutoField なので Int32 には収まらないことがある。Float64 なら 2^53 まで正確で、
+#             JavaScript の数値（Float64Array）としてそのまま扱える
+MARKER_FORMATS = ('json', 'columnar', 'binary')
+
+# columnar・binary で、種類を番号に置き換えるための一覧（番号 = この一覧での位置）
+MARKER_FILE_TYPES = ('image', 'video', 'audio', 'other')
+
+
+def brotli_available():
+    """
+    brotli で圧縮できるか（brotli パッケージは任意）
+    """
+    return importlib.util.find_spec('brotli') is not None
+
+
+def _compress_payload(body):
+    """
+    応答の本文と、あらかじめ圧縮したもの（gzip と、brotli が使えれば br）を返す
+    """
+    payload = {'body': body, 'gzip': gzip.compress(body, compresslevel=6)}
+    if brotli_available():
+        import brotli
+        payload['br'] = brotli.compress(body, quality=5)
+    return payload
+
+
+def _encode_markers_columns(rows, fmt):
+    """
+    (ID, 緯度, 経度, 種類) の行を columnar（JSON）または binary の本文に変換する
+    """
+    type_index = {name: i for i, name in enumerate(MARKER_FILE_TYPES)}
+    other = type_index['other']
+    ids = [row[0] for row in rows]
+    types = [type_index.get(row[3], other) for row in rows]
+
+    if fmt == 'columnar':
+        return json.dumps({
+            'file_types': MARKER_FILE_TYPES,
+            'ids': ids,
+            # 小数点以下6桁（約10cm）に丸めて、桁数の分だけ小さくする
+            'latitudes': [round(row[1], 6) for row in rows],
+            'longitudes': [round(row[2], 6) for row in rows],
+            'types': types,
+        }, separators=(',', ':')).encode()
+
+    columns = [
+        array.array('d', ids),
+        array.array('f', (row[1] for row in rows)),
+        array.array('f', (row[2] for row in rows)),
+    ]
+    if sys.byteorder == 'big':
+        for column in columns:
+            column.byteswap()
+    return b''.join(column.tobytes() for column in columns) + bytes(types)
+
+
+def _build_markers_payload(bbox, since, fmt):
+    # 表示範囲内のデータだけをデータベースから取得（上限件数まで）
+    archives = filter_by_bbox(Archive.objects.all(), bbox).order_by('id')
+    if since:
+        # 前回の取得以降に追加されたデータだけに絞り込む
+        archives = archives.filter(id__gt=since)
+    if fmt != 'json':
+        # ピンを描くのに必要な列だけを取得する（モデルのインスタンスも作らない）
+        archives = archives.values_list('id', 'latitude', 'longitude', 'file_type')
+    limit = settings.MARKERS_MAX_RESULTS
+    rows = list(archives[:limit + 1])
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+
+    if fmt == 'json':
+        body = json.dumps([serialize_marker(item) for item in rows], cls=DjangoJSONEncoder).encode()
+        last_id = rows[-1].id if rows else None
+    else:
+        body = _encode_markers_columns(rows, fmt)
+        last_id = rows[-1][0] if rows else None
+    payload = _compress_payload(body)
+    payload.update(
+        count=len(rows),
+        truncated=truncated,
+        # 次回の since に指定するカーソル（今回返した中で最大のID）
+        cursor=last_id if last_id is not None else since,
+        # 更新・削除のバージョン（変わっていたら、差分ではなく全体を読み込み直す必要がある）
+        edits=get_edit_version(),
+    )
+    return payload
+
+
+def get_markers_payload(bbox, since, version=None, fmt='json'):
+    """
+    get_markers が返すマーカーの本文（と、あらかじめ圧縮したもの）を返す
+    データセットのバージョンと検索条件をキーにキャッシュするので、Archiveが書き込まれるまでは
+    データベースへの問い合わせも変換・圧縮も行わない
+
+    fmt: 'json'・'columnar'・'binary' のいずれか（MARKER_FORMATS）
+    戻り値: {'body': 本文, 'gzip': 圧縮した本文, 'br': brotliで圧縮した本文（使える場合のみ）,
+             'count': 件数, 'truncated': 上限で打ち切ったか, 'cursor': 次回の since,
+             'edits': 更新・削除のバージョン}
+    """
+    if version is None:
+        version = get_dataset_version()
+    bbox_key = ','.join(str(value) for value in bbox) if bbox else 'all'
+    return get_or_build(
+        f"archive:markers:{version}:{fmt}:{bbox_key}:{since}",
+        lambda: _build_markers_payload(bbox, since, fmt),
+        settings.MARKERS_CACHE_TIMEOUT,
+    )
+
+
+def encode_cursor(item):
+    """
+    ファイル一覧のページ分割用のカーソル（作成日時とIDの組）を文字列にする
+    """
+    value = f"{item.created_at.isoformat()}|{item.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    encode_cursor で作った文字列を (作成日時, ID) に戻す
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, item_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"カーソルの形式が正しくありません: {cursor}")
+
+
+def get_file_page(after=None, start=None, page_size=None):
+    """
+    ファイル一覧の1ページ分を、新しい順に (データのリスト, 次のページのカーソル) で返す
+    OFFSETを使わず (created_at, id) で続きから取得するので、何ページ目でも速さが変わらない
+
+      after: このカーソルより後（古い方）から取得する
+      start: このデータ（を含む）から取得する
+    """
+    page_size = page_size or settings.FILE_LIST_PAGE_SIZE
+    archives = Archive.objects.order_by('-created_at', '-id')
+    if after is not None:
+        created_at, item_id = after
+        archives = archives.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=item_id))
+    elif start is not None:
+        archives = archives.filter(
+            Q(created_at__lt=start.created_at) | Q(created_at=start.created_at, id__lte=start.id)
+        )
+
+    items = list(archives[:page_size + 1])
+    next_cursor = encode_cursor(items[page_size - 1]) if len(items) > page_size else None
+    return items[:page_size], next_cursor
+
+
+def get_archive_stats():
+    """
+    ファイル一覧の統計（総ファイル数・ファイル種類数・登録場所数）をデータベースで集計する
+    結果はデータセットのバージョンごとにキャッシュする
+    """
+    def compute():
+        return Archive.objects.aggregate(
+            total=Count('id'),
+            file_types=Count('file_type', distinct=True),
+            locations=Count('address', distinct=True),
+        )
+
+    cache_key = f"archive:stats:{get_dataset_version()}"
+    return cache.get_or_set(cache_key, compute, settings.MAP_HTML_CACHE_TIMEOUT)
+
+
+def cluster_cell_size(zoom):
+    """
+    ズームレベルに応じたクラスタのグリッド幅（度）を返す
+    （ズームレベル z のタイル1枚は経度 360 / 2^z 度なので、それをさらに分割する）
+    """
+    return 360.0 / (2 ** zoom) / settings.MARKER_CLUSTER_CELLS_PER_TILE
+
+
+def aggregate_clusters(bbox, zoom):
+    """
+    表示範囲内のデータをグリッドごとに集計し、クラスタのリストを返す
+    集計（件数・座標の合計）はデータベース側の GROUP BY で行う
+    """
+    cell = cluster_cell_size(zoom)
+    rows = (
+        filter_by_bbox(Archive.objects.all(), bbox)
+        .annotate(
+            cell_y=Floor(F('latitude') / cell),
+            cell_x=Floor(F('longitude') / cell),
+        )
+        .values('cell_y', 'cell_x', 'file_type')
+        .annotate(count=Count('id'), lat_sum=Sum('latitude'), lon_sum=Sum('longitude'))
+        .order_by()
+    )
+
+    # ファイルの種類ごとに分かれた集計結果を、グリッドごとにまとめる
+    cells = {}
+    for row in rows:
+        key = (row['cell_y'], row['cell_x'])
+        if key not in cells:
+            cells[key] = {'count': 0, 'lat_sum': 0.0, 'lon_sum': 0.0, 'file_types': {}}
+        cluster = cells[key]
+        cluster['count'] += row['count']
+        cluster['lat_sum'] += row['lat_sum']
+        cluster['lon_sum'] += row['lon_sum']
+        cluster['file_types'][row['file_type']] = row['count']
+
+    # 各グリッドの重心（平均座標）を計算
+    return [
+        {
+            'latitude': cluster['lat_sum'] / cluster['count'],
+            'longitude': cluster['lon_sum'] / cluster['count'],
+            'count': cluster['count'],
+            'file_types': cluster['file_types'],
+        }
+        for cluster in cells.values()
+    ]
+
+
+def render_location_popup(items_at_location) -> str:
+    """
+    同じ場所にある全アイテムの情報をまとめた、ポップアップ用のHTMLを生成する
+    """
+    return render_to_string('archive_app/location_popup.html', {'items': items_at_location})
+
+
+def get_location_popups(locations) -> dict:
+    """
+    {(緯度, 経度): [ID, ...]} を受け取り、{(緯度, 経度): ポップアップHTML} を返す
+    ポップアップは場所ごとのバージョン付きでキャッシュし、変更があった場所だけ作り直す
+    """
+    versions = get_location_versions(locations.keys())
+    keys = {
+        coords: f"archive:popup:{coords[0]}:{coords[1]}:{versions[coords]}"
+        for coords in locations
+    }
+    cached = cache.get_many(keys.values())
+
+    popups = {}
+    missing = []
+    for coords, key in keys.items():
+        if key in cached:
+            popups[coords] = cached[key]
+        else:
+            missing.append(coords)
+
+    # キャッシュに無い場所のデータだけをデータベースから取得してHTMLを作る
+    missing_ids = [item_id for coords in missing for item_id in locations[coords]]
+    items_by_id = Archive.objects.in_bulk(missing_ids)
+    new_fragments = {}
+    for coords in missing:
+        items_at_location = [items_by_id[item_id] for item_id in locations[coords] if item_id in items_by_id]
+        if not items_at_location:
+            continue
+        popups[coords] = render_location_popup(items_at_location)
+        new_fragments[keys[coords]] = popups[coords]
+    if new_fragments:
+        cache.set_many(new_fragments, settings.MAP_HTML_CACHE_TIMEOUT)
+    return popups
+
+
+def get_location_popup_html(latitude, longitude):
+    """
+    指定した場所（LOCATION_POPUP_TOLERANCE 度以内）にあるアイテムのポップアップHTMLを返す（無ければ None）
+    地図のピンの座標は丸められていることがあるので、完全に一致しなくてもよい
+    """
+    tolerance = settings.LOCATION_POPUP_TOLERANCE
+    rows = Archive.objects.filter(
+        latitude__range=(latitude - tolerance, latitude + tolerance),
+        longitude__range=(longitude - tolerance, longitude + tolerance),
+    ).order_by('id').values_list('latitude', 'longitude', 'id')
+
+    locations = {}
+    for lat, lon, item_id in rows:
+        locations.setdefault((lat, lon), []).append(item_id)
+    if not locations:
+        return None
+    popups = get_location_popups(locations)
+    return ''.join(popups[coords] for coords in locations if coords in popups)
+
+
+# create_map_html の地図で、ポップアップを開いたときに .lazy-popup の data-src から中身を読み込むスクリプト
+# （地図の変数が定義された後に実行されるよう、folium の MacroElement の script として埋め込む）
+LAZY_POPUP_TEMPLATE = """
+{% macro script(this, kwargs) %}
+{{ this._parent.get_name() }}.on('popupopen', function (e) {
+    var placeholder = e.popup.getElement().querySelector('.lazy-popup[data-src]');
+    if (!placeholder) {
+        return;
+    }
+    fetch(placeholder.dataset.src)
+        .then(function (response) { return response.ok ? response.text() : Promise.reject(response.status); })
+        .then(function (html) { e.popup.setContent(html); })
+        .catch(function () { placeholder.textContent = '読み込みに失敗しました'; });
+});
+{% endmacro %}
+"""
+
+
+@trace('create_map_html')
 def create_map_html() -> str:
     """
     【変更後】データベースからデータを取得し、同じ場所の情報をまとめて地図を生成する。
+    生成したHTMLはデータセットのバージョンをキーにキャッシュし、
+    Archiveが書き込まれるまでは作り直さない。
     """
-    # --- 1. データベースから全データを取得 ---
-    all_archives = Archive.objects.all()
+    return get_or_build(
+        f"archive:map_html:{get_dataset_version()}", _build_map_html, settings.MAP_HTML_CACHE_TIMEOUT,
+    )
+
+
+def _build_map_html():
+    # --- 1. データベースから位置・種類・IDだけを取得 ---
+    rows = Archive.objects.values_list('latitude', 'longitude', 'file_type', 'id').order_by('id')
 
     # --- 2. データを場所（緯度・経度）ごとにグループ化する ---
     locations = {}
-    for item in all_archives:
+    first_file_types = {}
+    for lat, lon, file_type, item_id in rows:
         # (緯度, 経度) のタプルをキーとして辞書にまとめる
-        coords = (item.latitude, item.longitude)
+        coords = (lat, lon)
         if coords not in locations:
             locations[coords] = []
-        locations[coords].append(item)
+            first_file_types[coords] = file_type
+        locations[coords].append(item_id)
 
     # --- 3. 地図の中心を計算する ---
     if locations:
@@ -36,6 +401,10 @@ def create_map_html() -> str:
         zoom_start = 5
     
     # --- 4. 地図オブジェクトを作成 ---
+    # folium は pandas・numpy ごと読み込まれて重いので、地図を作るときに初めて読み込む
+    import folium
+    from folium.plugins import MarkerCluster
+
     gsi_tile_url = "https://cyberjapandata.gsi.go.jp/xyz/std/{z}/{x}/{y}.png"
     gsi_attribution = "<a href='https://maps.gsi.go.jp/development/ichiran.html' target='_blank'>地理院タイル</a>"
     m = folium.Map(
@@ -54,74 +423,172 @@ def create_map_html() -> str:
     }
 
     # --- 5. グループ化された場所ごとにマーカーを1つ作成 ---
-    for coords, items_at_location in locations.items():
-        # ポップアップに表示するHTMLを生成
-        popup_html = f"""
-        <div style="min-width:200px; max-height:400px; overflow-y:auto;">
-            <b>住所:</b> {items_at_location[0].address}<br>
-            <hr style="margin: 5px 0;">
-        """
-
-        # --- 6. 同じ場所にある全アイテムの情報をループで追加 ---
-        for item in items_at_location:
-            media_html = ""
-            if item.file_type == 'image':
-                media_html = f'<img src="{item.file_path}" style="max-width:380px; height:auto; display:block; margin-top:10px;">'
-            elif item.file_type == 'video':
-                media_html = f'<video controls style="width:100%; max-width:380px; display:block; margin-top:10px;"><source src="{item.file_path}"></video>'
-            elif item.file_type == 'audio':
-                media_html = f'<audio controls style="width:100%; margin-top:10px;"><source src="{item.file_path}"></audio>'
-            
-            description_html = f"<b>説明:</b> {item.description}<br>" if item.description else ""
-            file_list_url = f"/files/#file-{urllib.parse.quote(item.file_name)}"
-            
-            # 各アイテムの情報をポップアップに追加
-            popup_html += f"""
-            <div style="margin-bottom: 15px; border-bottom: 1px solid #eee; padding-bottom: 10px;">
-                <b>種類:</b> {item.file_type}<br>
-                {description_html}
-                {media_html}
-                <div style="margin-top:10px;">
-                    <a href="{file_list_url}" target="_blank" class="btn-view">ファイル一覧で見る</a>
-                </div>
-            </div>
-            """
-        
-        popup_html += "</div>" # ポップアップのdivを閉じる
-
+    # ポップアップの中身は、開いたときに /locations/<緯度>,<経度>/ から読み込む
+    # （ほとんどのポップアップは開かれないので、地図HTMLには含めない）
+    for coords in locations:
         # アイコンは最初のアイテムの種類で決定
-        file_type = items_at_location[0].file_type
+        file_type = first_file_types[coords]
         setting = icon_settings.get(file_type, icon_settings['other'])
+        popup_url = reverse('location_detail', kwargs={'lat': f"{coords[0]:.7f}", 'lon': f"{coords[1]:.7f}"})
         
         marker = folium.Marker(
             location=coords,
-            popup=folium.Popup(popup_html, max_width=400),
+            popup=folium.Popup(f'<div class="lazy-popup" data-src="{popup_url}">読み込み中...</div>', max_width=400),
             icon=folium.Icon(color=setting['color'], icon=setting['icon'], prefix='fa')
         )
         marker.add_to(marker_cluster)
 
+    # --- 6. ポップアップを開いたときに中身を読み込むスクリプトを追加 ---
+    from branca.element import MacroElement
+    from jinja2 import Template
+    lazy_popup = MacroElement()
+    lazy_popup._template = Template(LAZY_POPUP_TEMPLATE)
+    m.add_child(lazy_popup)
+
     map_html = m._repr_html_()
     # 地図のdiv要素にIDを追加
     map_html = map_html.replace('<div class="folium-map"', '<div class="folium-map" id="map"')
-    
     return map_html
 
 
-def upload_file_to_supabase_storage(local_file, storage_file_name):
+def resolve_location(lat, lon, address):
     """
-    Supabase Storageにファイルをアップロードし、公開URLを返す
+    緯度・経度と住所を相互に補完して (緯度, 経度, 住所) を返す
+      - 住所だけ入力されていれば、緯度・経度を検索
+      - 緯度・経度だけ入力されていれば、住所を検索
     """
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY")
-    if not supabase_url or not supabase_key:
-        raise Exception("Supabaseの環境変数が設定されていません")
-    supabase = create_client(supabase_url, supabase_key)
-    file_bytes = local_file.read()
-    
-    file_options = {"upsert": "true"}
-    res = supabase.storage.from_("file-mapping-bucket").upload(
-        storage_file_name, file_bytes, file_options
+    if not lat and not lon and address:
+        lat, lon = geocode_address(address)
+    elif lat and lon and not address:
+        address = reverse_geocode(lat, lon)
+    return lat, lon, address
+
+
+def compute_content_hash(local_file):
+    """
+    ファイルの中身の SHA-256 を返す
+    受信しながら計算済みの場合（ContentHashMixin）は、その値をそのまま使う
+    """
+    content_hash = getattr(local_file, 'content_hash', None)
+    if content_hash:
+        return content_hash
+    sha256 = hashlib.sha256()
+    local_file.seek(0)
+    for chunk in iter(lambda: local_file.read(1024 * 1024), b''):
+        sha256.update(chunk)
+    local_file.seek(0)
+    return sha256.hexdigest()
+
+
+def find_stored_copy(content_hash):
+    """
+    同じ中身のファイルがすでにStorageにあれば、そのArchiveを返す（無ければ None）
+    """
+    if not content_hash:
+        return None
+    return Archive.objects.filter(content_hash=content_hash).order_by('id').first()
+
+
+def create_archive_from_upload(local_file, storage_file_name, file_type, description, address, lat, lon):
+    """
+    位置情報を補完し、ファイルをSupabase Storageにアップロードしてデータベースに保存する
+    位置情報が特定できなかった場合は、アップロードせずに None を返す
+    同じ中身のファイルがすでにアップロードされていれば、転送せずにそのファイルを使う
+    """
+    archive = prepare_archive_from_upload(local_file, storage_file_name, file_type, description, address, lat, lon)
+    if archive is not None:
+        archive.save()
+    return archive
+
+
+def prepare_archive_from_upload(local_file, storage_file_name, file_type, description, address, lat, lon):
+    """
+    create_archive_from_upload() のうち、データベースへの保存の手前まで（アップロードまで）を行い、
+    保存前のArchiveを返す（ジョブの完了と同じトランザクションで保存する場合に使う）
+    """
+    # 1. 写真・動画に埋め込まれた撮影位置・撮影日時を読み取る（ファイルの先頭部分だけを読む）
+    #    地図で位置が指定されていなければ、住所から検索する前に埋め込まれた位置を使う
+    metadata = extract_metadata(local_file)
+    if (lat is None or lon is None) and 'latitude' in metadata:
+        lat, lon = metadata['latitude'], metadata['longitude']
+
+    # 2. 緯度・経度と住所を相互に補完
+    lat, lon, address = resolve_location(lat, lon, address)
+    if lat is None or lon is None:
+        return None
+
+    content_hash = compute_content_hash(local_file)
+    existing = find_stored_copy(content_hash)
+    if existing is not None:
+        # 3a. 同じファイルがStorageにあるので、アップロードせずに使い回す
+        public_url = existing.file_path
+        derivatives = {'thumbnail_url': existing.thumbnail_url, 'medium_url': existing.medium_url}
+    else:
+        # 3b. ファイルをSupabase Storageにアップロードし、公開URLを取得
+        public_url = upload_file_to_supabase_storage(local_file, storage_file_name)
+        # 画像なら縮小版を作成して、元のファイルと同じ場所に保存
+        derivatives = generate_derivatives(local_file, storage_file_name) if file_type == 'image' else {}
+
+    # 4. 最終的な位置情報をもとに、データベースに保存するデータを作る
+    return Archive(
+        file_path=public_url,
+        file_type=file_type,
+        description=description,
+        address=address,
+        latitude=lat,
+        longitude=lon,
+        captured_at=metadata.get('captured_at'),
+        content_hash=content_hash,
+        **derivatives,
     )
-    
-    public_url = supabase.storage.from_("file-mapping-bucket").get_public_url(storage_file_name)
-    return public_url
\ No newline at end of file
+
+
+def create_archive_from_existing(existing, file_type, description, address, lat, lon):
+    """
+    ファイル本体を送らずに、Storageにある同じ中身のファイルを使ってデータベースに保存する
+    （ブラウザが事前にハッシュで確認した場合）
+    位置が指定されていなければ、既存のデータと同じ位置にする
+    """
+    if (lat is None or lon is None) and not address:
+        lat, lon, address = existing.latitude, existing.longitude, existing.address
+    lat, lon, address = resolve_location(lat, lon, address)
+    if lat is None or lon is None:
+        return None
+
+    return Archive.objects.create(
+        file_path=existing.file_path,
+        file_type=file_type,
+        description=description,
+        address=address,
+        latitude=lat,
+        longitude=lon,
+        captured_at=existing.captured_at,
+        content_hash=existing.content_hash,
+        thumbnail_url=existing.thumbnail_url,
+        medium_url=existing.medium_url,
+    )
+
+
+def bulk_create_archives(archives, batch_size=500):
+    """
+    複数のArchiveをまとめてデータベースに保存する
+    bulk_create ではシグナルが呼ばれないため、検索用の列の作成とキャッシュの無効化もここで行う
+    """
+    for archive in archives:
+        archive.search_text = build_search_text(archive.description, archive.address)
+        archive.geohash = encode_geohash(archive.latitude, archive.longitude)
+    created = Archive.objects.bulk_create(archives, batch_size=batch_size)
+
+    bump_dataset_version()
+    bump_location_versions((archive.latitude, archive.longitude) for archive in archives)
+    return created
+
+
+@trace('upload_file_to_supabase_storage')
+def upload_file_to_supabase_storage(local_file, storage_file_name):
+    """
+    ストレージ（通常はSupabase Storage）にファイルをアップロードし、公開URLを返す
+    """
+    storage = get_archive_storage()
+    name = storage.save(storage_file_name, local_file)
+    return storage.url(name)
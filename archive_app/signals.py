@@ -0,0 +1,51 @@
+# archive_app/signals.py
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_dataset_version, bump_location_version
+from .geo import encode_geohash
+from .models import Archive
+from .search import build_search_text
+
+
+@receiver(pre_save, sender=Archive)
+def remember_previous_location(sender, instance, **kwargs):
+    """
+    更新の場合は、保存前の位置を覚えておく（場所が変わったときに古い場所も無効にするため）
+    """
+    instance._previous_location = None
+    if instance.pk:
+        instance._previous_location = (
+            Archive.objects.filter(pk=instance.pk).values_list('latitude', 'longitude').first()
+        )
+
+
+@receiver(pre_save, sender=Archive)
+def update_search_text(sender, instance, **kwargs):
+    """
+    説明文と住所から全文検索用のテキストを作り直す
+    """
+    instance.search_text = build_search_text(instance.description, instance.address)
+
+
+@receiver(pre_save, sender=Archive)
+def update_geohash(sender, instance, **kwargs):
+    """
+    緯度・経度からジオハッシュを作り直す
+    """
+    instance.geohash = encode_geohash(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Archive)
+@receiver(post_delete, sender=Archive)
+def invalidate_archive_caches(sender, instance, **kwargs):
+    """
+    Archiveが書き込まれたら、データセットと該当する場所のキャッシュを無効にする
+    （追加以外の場合は、地図に差分ではなく全体を読み込み直させる）
+    """
+    bump_dataset_version(edited=not kwargs.get('created', False))
+    bump_location_version(instance.latitude, instance.longitude)
+    previous = getattr(instance, '_previous_location', None)
+    if previous and previous != (instance.latitude, instance.longitude):
+        bump_location_version(*previous)
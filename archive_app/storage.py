@@ -0,0 +1,263 @@
+# archive_app/storage.py
+
+import base64
+import mimetypes
+import os
+import tempfile
+import time
+import urllib.parse
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.utils.deconstruct import deconstructible
+
+from . import http_client
+
+# settings.STORAGES の中で、アーカイブのファイルに使うストレージの名前
+ARCHIVE_STORAGE_ALIAS = 'archive'
+# バックグラウンドのジョブに渡すファイル（スプール）に使うストレージの名前
+SPOOL_STORAGE_ALIAS = 'spool'
+
+
+def get_archive_storage():
+    """
+    アーカイブのファイルを保存するストレージを返す
+    （settings.STORAGES['archive'] の設定で、プロセス内で最初に使うときに1つだけ作られる）
+    """
+    return storages[ARCHIVE_STORAGE_ALIAS]
+
+
+def get_spool_storage():
+    """
+    アップロードのジョブに渡すファイルを保存するストレージを返す（settings.UPLOAD_SPOOL_STORAGE）
+    """
+    return storages[SPOOL_STORAGE_ALIAS]
+
+
+@deconstructible
+class SupabaseStorage(Storage):
+    """
+    Supabase StorageのREST APIを使うストレージ
+    通信は http_client の共有セッションを使うので、アップロードごとに接続を作り直さない
+    """
+
+    def __init__(self, bucket='file-mapping-bucket', url=None, key=None):
+        self.bucket = bucket
+        self._url = url
+        self._key = key
+
+    # --- 接続情報 ---
+
+    @property
+    def base_url(self):
+        url = self._url or os.environ.get("SUPABASE_URL")
+        if not url:
+            raise Exception("Supabaseの環境変数が設定されていません")
+        return url.rstrip('/')
+
+    @property
+    def key(self):
+        key = self._key or os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or os.environ.get("SUPABASE_ANON_KEY")
+        if not key:
+            raise Exception("Supabaseの環境変数が設定されていません")
+        return key
+
+    def _headers(self, **extra):
+        return {'Authorization': f"Bearer {self.key}", 'apikey': self.key, **extra}
+
+    def _object_url(self, name):
+        return f"{self.base_url}/storage/v1/object/{self.bucket}/{urllib.parse.quote(name)}"
+
+    def _request(self, method, url, **kwargs):
+        return http_client.request(method, url, call_site='upload_file_to_supabase_storage', **kwargs)
+
+    # --- Storage API ---
+
+    def get_available_name(self, name, max_length=None):
+        # 保存時は常に上書き（upsert）するので、存在確認の問い合わせはしない
+        return name
+
+    def _save(self, name, content):
+        """
+        ファイルをメモリに読み込まずにアップロードする
+        STORAGE_RESUMABLE_THRESHOLD 以上のファイルは再開可能な分割アップロードにする
+        """
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        size = content.size
+        content.seek(0)
+        if size >= settings.STORAGE_RESUMABLE_THRESHOLD:
+            self._upload_resumable(name, content, size, content_type)
+        else:
+            self._upload_stream(name, content, content_type)
+        return name
+
+    def _open(self, name, mode='rb'):
+        """
+        ファイルを一時ファイルにダウンロードして返す（大きなファイルはメモリではなくディスクに置く）
+        """
+        response = self._request('GET', self._object_url(name), headers=self._headers(), stream=True)
+        with response:
+            # Supabase Storage は存在しないファイルに 400 を返すことがある
+            if response.status_code in (400, 404):
+                raise FileNotFoundError(f"{self.bucket}/{name} が見つかりません")
+            response.raise_for_status()
+            temporary = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+            for chunk in response.iter_content(chunk_size=settings.DOWNLOAD_CHUNK_SIZE):
+                temporary.write(chunk)
+        temporary.seek(0)
+        return File(temporary, name=name)
+
+    def url(self, name):
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{urllib.parse.quote(name)}"
+
+    def name_from_url(self, url):
+        """
+        公開URLからストレージ上のファイル名を取り出す（このバケットのURLでなければ None）
+        """
+        prefix = f"{self.base_url}/storage/v1/object/public/{self.bucket}/"
+        if not url.startswith(prefix):
+            return None
+        return urllib.parse.unquote(url[len(prefix):].split('?', 1)[0])
+
+    def signed_url(self, name, expires_in, download=None):
+        """
+        期限付きの署名URLを発行する（download を指定すると、その名前で保存させる）
+        """
+        response = self._request(
+            'POST', f"{self.base_url}/storage/v1/object/sign/{self.bucket}/{urllib.parse.quote(name)}",
+            json={'expiresIn': expires_in}, headers=self._headers(),
+        )
+        response.raise_for_status()
+        url = f"{self.base_url}/storage/v1{response.json()['signedURL']}"
+        if download:
+            url += f"&download={urllib.parse.quote(download)}"
+        return url
+
+    def delete(self, name):
+        response = self._request('DELETE', self._object_url(name), headers=self._headers())
+        if response.status_code not in (200, 204, 404):
+            response.raise_for_status()
+
+    def exists(self, name):
+        response = self._request('HEAD', self._object_url(name), headers=self._headers())
+        return response.status_code == 200
+
+    def size(self, name):
+        response = self._request('HEAD', self._object_url(name), headers=self._headers())
+        response.raise_for_status()
+        return int(response.headers['Content-Length'])
+
+    # --- アップロード ---
+
+    def _upload_stream(self, name, content, content_type):
+        """
+        ファイルを1回のリクエストでアップロードする
+        （ファイルオブジェクトをそのまま渡すので、全体をメモリに読み込まずに少しずつ送信される）
+        """
+        response = self._request(
+            'POST', self._object_url(name), data=content,
+            headers=self._headers(**{'Content-Type': content_type, 'x-upsert': 'true'}),
+        )
+        response.raise_for_status()
+
+    def _upload_resumable(self, name, content, size, content_type):
+        """
+        大きなファイルを再開可能なアップロード（TUSプロトコル）で分割して送信する
+        通信が切れた場合は、サーバーが受け取った位置を問い合わせて続きから送り直す。
+        メモリに載るのは一度に送る1チャンク分だけ。
+        """
+        tus_headers = self._headers(**{'Tus-Resumable': '1.0.0'})
+        chunk_size = settings.STORAGE_UPLOAD_CHUNK_SIZE
+        endpoint = f"{self.base_url}/storage/v1/upload/resumable"
+
+        # 同じファイル名の途中までのアップロードがあれば、その続きから再開する
+        resume_key = f"archive:resumable_upload:{self.bucket}:{name}"
+        upload_url = cache.get(resume_key)
+        offset = self._resumable_offset(upload_url, tus_headers) if upload_url else None
+
+        if offset is None:
+            metadata = {'bucketName': self.bucket, 'objectName': name, 'contentType': content_type}
+            response = self._request(
+                'POST', endpoint,
+                headers={
+                    **tus_headers,
+                    'x-upsert': 'true',
+                    'Upload-Length': str(size),
+                    'Upload-Metadata': ','.join(
+                        f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in metadata.items()
+                    ),
+                },
+            )
+            response.raise_for_status()
+            upload_url = urllib.parse.urljoin(endpoint, response.headers['Location'])
+            cache.set(resume_key, upload_url, settings.STORAGE_RESUMABLE_UPLOAD_TTL)
+            offset = 0
+
+        failures = 0
+        while offset < size:
+            content.seek(offset)
+            chunk = content.read(chunk_size)
+            try:
+                response = self._request(
+                    'PATCH', upload_url, data=chunk,
+                    headers={
+                        **tus_headers,
+                        'Upload-Offset': str(offset),
+                        'Content-Type': 'application/offset+octet-stream',
+                    },
+                )
+                response.raise_for_status()
+                offset = int(response.headers['Upload-Offset'])
+                failures = 0
+            except requests.RequestException:
+                failures += 1
+                if failures > settings.STORAGE_UPLOAD_MAX_RETRIES:
+                    raise
+                # サーバーが実際に受け取った位置を確認して、そこから送り直す
+                time.sleep(settings.HTTP_RETRY_BACKOFF * (2 ** failures))
+                current = self._resumable_offset(upload_url, tus_headers)
+                if current is None:
+                    raise
+                offset = current
+        cache.delete(resume_key)
+
+    def _resumable_offset(self, upload_url, tus_headers):
+        """
+        再開可能なアップロードで、サーバーが受け取り済みのバイト数を返す（再開できなければ None）
+        """
+        try:
+            response = self._request('HEAD', upload_url, headers=tus_headers)
+        except requests.RequestException:
+            return None
+        if response.status_code != 200 or 'Upload-Offset' not in response.headers:
+            return None
+        return int(response.headers['Upload-Offset'])
+
+
+@deconstructible
+class LocalArchiveStorage(FileSystemStorage):
+    """
+    ローカルのディスクに保存するストレージ（開発・テスト・ベンチマーク用）
+    Supabaseと同じく、同じ名前のファイルは上書きする
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if self.exists(name):
+            self.delete(name)
+        return name
+
+    def name_from_url(self, url):
+        """
+        URLからファイル名を取り出す（このストレージのURLでなければ None）
+        """
+        path = urllib.parse.urlparse(url).path
+        if not path.startswith(self.base_url):
+            return None
+        return urllib.parse.unquote(path[len(self.base_url):])
+
+    def signed_url(self, name, expires_in, download=None):
+        # ローカルのファイルは署名せずにそのまま配信する
+        return self.url(name)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from unittest import mock
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import http_client, test_download
+from .http_client import CircuitOpenError
+from .test_http_client import start_server
+from .testing import make_archive
+from .views import download_file_async, get_markers, get_markers_async
+
+
+class IsolatedClientMixin:
+
+    def setUp(self):
+        super().setUp()
+        # 接続先ごとのセッション・ブレーカーはテストごとに作り直す
+        for patcher in (
+            mock.patch.dict(http_client._sessions, clear=True),
+            mock.patch.dict(http_client._breakers, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class Interrupted(BaseException):
+    """
+    requests の例外ではない中断（KeyboardInterrupt など）の代わり
+    """
+
+
+@override_settings(HTTP_CIRCUIT_FAILURE_THRESHOLD=1, HTTP_CIRCUIT_RESET_TIMEOUT=0)
+class HalfOpenTrialTests(IsolatedClientMixin, SimpleTestCase):
+    url = 'http://upstream.test/a'
+
+    def setUp(self):
+        super().setUp()
+        self.breaker = http_client.get_breaker('upstream.test')
+        self.breaker.record_failure()
+
+    def test_cancelled_async_trial_is_released(self):
+        async def scenario():
+            started = asyncio.Event()
+
+            async def hang(*args, **kwargs):
+                started.set()
+                await asyncio.sleep(60)
+
+            with mock.patch.object(httpx.AsyncClient, 'send', hang):
+                task = asyncio.create_task(http_client.aget(self.url, call_site='test'))
+                await started.wait()
+                # 復旧の確認中は他のリクエストを通さない
+                with self.assertRaises(CircuitOpenError):
+                    await http_client.aget(self.url, call_site='test')
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        asyncio.run(scenario())
+        self.assertTrue(self.breaker.allow())
+
+    def test_interrupted_sync_trial_is_released(self):
+        session = mock.Mock()
+        session.request.side_effect = Interrupted
+        with mock.patch('archive_app.http_client.get_session', return_value=session):
+            with self.assertRaises(Interrupted):
+                http_client.get(self.url, call_site='test')
+        self.assertTrue(self.breaker.allow())
+
+
+@override_settings(HTTP_MAX_RETRIES=2, HTTP_RETRY_BACKOFF=0, HTTP_CIRCUIT_FAILURE_THRESHOLD=3)
+class AsyncRequestTests(IsolatedClientMixin, SimpleTestCase):
+
+    def test_retries_gateway_errors(self):
+        server, url = start_server(self, [502, 504, 200])
+        response = asyncio.run(http_client.aget(url, call_site='test'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'ok')
+        self.assertEqual(len(server.requests), 3)
+
+    def test_does_not_retry_non_idempotent_methods(self):
+        server, url = start_server(self, [503, 200])
+        response = asyncio.run(http_client.arequest('POST', url, call_site='test', content=b'x'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(server.requests, ['POST'])
+
+    def test_connection_errors_open_the_circuit(self):
+        server, url = start_server(self, [200])
+        server.shutdown()
+        server.server_close()
+        for _ in range(3):
+            with self.assertRaises(httpx.ConnectError):
+                asyncio.run(http_client.aget(url, call_site='test'))
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(http_client.aget(url, call_site='test'))
+
+
+class AsyncMarkersTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_archive(address='東京', latitude=35.68, longitude=139.76)
+        make_archive(address='大阪', latitude=34.70, longitude=135.50)
+        self.factory = AsyncRequestFactory()
+
+    def test_same_payload_and_etag_as_sync_view(self):
+        sync_response = get_markers(self.factory.get('/get_markers/'))
+        response = async_to_sync(get_markers_async)(self.factory.get('/get_markers/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), json.loads(sync_response.content))
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+
+        request = self.factory.get('/get_markers/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(async_to_sync(get_markers_async)(request).status_code, 304)
+
+
+class AsyncDownloadFileTests(test_download.DownloadFileTests):
+    """
+    download_file() と同じテストを非同期版（download_file_async）で行う
+    """
+
+    def _get(self, **params):
+        query = {'url': self.file_url, **params.pop('query', {})}
+        # AsyncRequestFactory ではヘッダーを headers で渡す
+        headers = {name.removeprefix('HTTP_').replace('_', '-'): value for name, value in params.items()}
+        request = AsyncRequestFactory().get('/download/', query, headers=headers)
+
+        async def fetch():
+            # httpx のクライアントはイベントループごとなので、本文も同じループの中で読む
+            response = await download_file_async(request)
+            if response.streaming and response.is_async:
+                response.streaming_content = [b''.join([chunk async for chunk in response.streaming_content])]
+            return response
+
+        return async_to_sync(fetch)()
+
+    def test_missing_url(self):
+        response = async_to_sync(download_file_async)(AsyncRequestFactory().get('/download/'))
+        self.assertEqual(response.status_code, 400)
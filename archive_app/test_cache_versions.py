@@ -0,0 +1,44 @@
+import json
+
+from django.core.cache import cache
+from django.db.models import F
+from django.test import TestCase
+
+from .caching import DATASET_VERSION_KEY, get_location_versions
+from .models import Archive, CacheVersion
+from .services import bulk_create_archives, get_archive_stats
+from .testing import make_archive
+
+
+class CacheInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_archive(address='東京', latitude=35.68, longitude=139.76)
+
+    def test_bulk_create_invalidates_cached_markers_and_stats(self):
+        response = self.client.get('/get_markers/')
+        etag = response['ETag']
+        self.assertEqual(len(json.loads(response.content)), 1)
+        self.assertEqual(get_archive_stats()['total'], 1)
+        location_versions = get_location_versions([(34.70, 135.50)])
+
+        bulk_create_archives([
+            Archive(file_type='video', file_path='https://example.com/b.mp4', address='大阪', latitude=34.70, longitude=135.50),
+            Archive(file_type='audio', file_path='https://example.com/c.mp3', address='大阪', latitude=34.70, longitude=135.50),
+        ])
+
+        response = self.client.get('/get_markers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 3)
+        self.assertEqual(get_archive_stats()['total'], 3)
+        self.assertNotEqual(get_location_versions([(34.70, 135.50)]), location_versions)
+        # bulk_create ではシグナルが呼ばれないが、検索用の列も作られている
+        self.assertEqual(Archive.objects.filter(address='大阪').exclude(search_text='').count(), 2)
+
+    def test_version_written_by_another_process_is_seen(self):
+        # 他のプロセス（ワーカーなど）が書き込んだ場合、このプロセスのキャッシュは更新されないが、
+        # バージョンはデータベースにあるので、古いマーカーを返さない
+        etag = self.client.get('/get_markers/')['ETag']
+        CacheVersion.objects.filter(key=DATASET_VERSION_KEY).update(version=F('version') + 1)
+        self.assertEqual(self.client.get('/get_markers/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,57 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from .services import aggregate_clusters, cluster_cell_size
+from .testing import make_archive
+
+
+@override_settings(MARKER_CLUSTER_MAX_ZOOM=12, MARKER_CLUSTER_CELLS_PER_TILE=4)
+class ClusterTests(TestCase):
+
+    def setUp(self):
+        # 東京に3件（種類は2種類）、大阪に1件
+        self.tokyo = [
+            make_archive(file_type='image', latitude=35.68, longitude=139.76),
+            make_archive(file_type='image', latitude=35.69, longitude=139.77),
+            make_archive(file_type='video', latitude=35.70, longitude=139.78),
+        ]
+        self.osaka = make_archive(file_type='audio', latitude=34.70, longitude=135.50)
+
+    def test_cell_size_halves_with_each_zoom_level(self):
+        self.assertEqual(cluster_cell_size(0), 90.0)
+        self.assertEqual(cluster_cell_size(5), cluster_cell_size(4) / 2)
+
+    def test_groups_by_grid_cell_with_counts_and_centroid(self):
+        clusters = sorted(aggregate_clusters(None, 5), key=lambda cluster: -cluster['count'])
+        self.assertEqual([cluster['count'] for cluster in clusters], [3, 1])
+        tokyo = clusters[0]
+        self.assertEqual(tokyo['file_types'], {'image': 2, 'video': 1})
+        self.assertAlmostEqual(tokyo['latitude'], 35.69)
+        self.assertAlmostEqual(tokyo['longitude'], 139.77)
+
+    def test_bbox_limits_clusters(self):
+        clusters = aggregate_clusters((34, 135, 35, 136), 5)
+        self.assertEqual(clusters, [{
+            'latitude': 34.70, 'longitude': 135.50, 'count': 1, 'file_types': {'audio': 1},
+        }])
+
+    def test_view_switches_to_markers_at_max_zoom(self):
+        data = json.loads(self.client.get('/get_clusters/', {'bbox': '123,24,146,46', 'zoom': 5}).content)
+        self.assertEqual(data['mode'], 'clusters')
+        self.assertEqual(sum(cluster['count'] for cluster in data['clusters']), 4)
+
+        data = json.loads(self.client.get('/get_clusters/', {'bbox': '139,35,140,36', 'zoom': 12}).content)
+        self.assertEqual(data['mode'], 'markers')
+        self.assertEqual(sorted(marker['id'] for marker in data['markers']), sorted(item.id for item in self.tokyo))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/get_clusters/', {'bbox': 'x', 'zoom': 5}).status_code, 400)
+        self.assertEqual(self.client.get('/get_clusters/', {'zoom': 'x'}).status_code, 400)
+
+    def test_returns_not_modified_until_data_changes(self):
+        params = {'bbox': '123,24,146,46', 'zoom': 5}
+        etag = self.client.get('/get_clusters/', params)['ETag']
+        self.assertEqual(self.client.get('/get_clusters/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.osaka.delete()
+        self.assertEqual(self.client.get('/get_clusters/', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,43 @@
+import hashlib
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from .services import create_archive_from_upload, find_stored_copy
+from .testing import make_archive
+
+
+class UploadDedupTests(TestCase):
+
+    def _upload(self, data, name):
+        return create_archive_from_upload(
+            ContentFile(data, name=name), name, 'other', '説明', '東京都千代田区', 35.68, 139.76,
+        )
+
+    @mock.patch('archive_app.services.upload_file_to_supabase_storage')
+    def test_same_content_is_uploaded_once(self, upload):
+        upload.side_effect = lambda local_file, storage_file_name: f'https://example.com/{storage_file_name}'
+        first = self._upload(b'same bytes', 'first.pdf')
+        second = self._upload(b'same bytes', 'second.pdf')
+
+        upload.assert_called_once()
+        self.assertEqual(first.content_hash, hashlib.sha256(b'same bytes').hexdigest())
+        self.assertEqual(second.content_hash, first.content_hash)
+        self.assertEqual(second.file_path, 'https://example.com/first.pdf')
+        self.assertNotEqual(second.pk, first.pk)
+
+    @mock.patch('archive_app.services.upload_file_to_supabase_storage')
+    def test_different_content_is_uploaded_again(self, upload):
+        upload.side_effect = lambda local_file, storage_file_name: f'https://example.com/{storage_file_name}'
+        self._upload(b'first bytes', 'first.pdf')
+        second = self._upload(b'other bytes', 'second.pdf')
+
+        self.assertEqual(upload.call_count, 2)
+        self.assertEqual(second.file_path, 'https://example.com/second.pdf')
+
+    def test_find_stored_copy_returns_the_oldest(self):
+        first = make_archive(content_hash='a' * 64)
+        make_archive(content_hash='a' * 64)
+        self.assertEqual(find_stored_copy('a' * 64), first)
+        self.assertIsNone(find_stored_copy(''))
@@ -0,0 +1,138 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+BODY = bytes(range(256)) * 4
+ETAG = '"v1"'
+
+
+class FakeObjectHandler(BaseHTTPRequestHandler):
+    """
+    Supabase Storage の公開URL（Range・If-None-Match に対応）と署名URLの発行を真似たサーバー
+    """
+
+    def do_GET(self):
+        self.server.received.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            return
+        status, body, headers = 200, BODY, {}
+        value = self.headers.get('Range')
+        if value:
+            start, end = (int(part) for part in value.removeprefix('bytes=').split('-'))
+            if start >= len(BODY):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(BODY)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status, body = 206, BODY[start:end + 1]
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(BODY)}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', ETAG)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        name = self.path.split('/storage/v1/object/sign/', 1)[1]
+        body = json.dumps({'signedURL': f'/object/sign/{name}?token=signed'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadFileTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeObjectHandler)
+        cls.server.received = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    def setUp(self):
+        self.server.received.clear()
+        storages = {
+            **settings.STORAGES,
+            'archive': {
+                'BACKEND': 'archive_app.storage.SupabaseStorage',
+                'OPTIONS': {'bucket': 'bucket', 'url': self.base_url, 'key': 'key'},
+            },
+        }
+        patcher = override_settings(STORAGES=storages, MEDIA_CACHE_DIR=None, DOWNLOAD_MODE='proxy')
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.file_url = f'{self.base_url}/storage/v1/object/public/bucket/a.bin'
+
+    def _get(self, **params):
+        return self.client.get('/download/', {'url': self.file_url, **params.pop('query', {})}, **params)
+
+    def test_streams_whole_file_as_attachment(self):
+        response = self._get(query={'filename': '写真.bin'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), BODY)
+        self.assertEqual(response['Content-Length'], str(len(BODY)))
+        self.assertEqual(response['ETag'], ETAG)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertIn("filename*=utf-8''%E5%86%99%E7%9C%9F.bin", response['Content-Disposition'])
+
+    def test_forwards_range_and_returns_partial_content(self):
+        response = self._get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), BODY[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(BODY)}')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.server.received[-1]['Range'], 'bytes=10-19')
+
+    def test_unsatisfiable_range(self):
+        response = self._get(HTTP_RANGE=f'bytes={len(BODY)}-{len(BODY) + 10}')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(BODY)}')
+
+    def test_forwards_if_none_match_and_returns_not_modified(self):
+        response = self._get(HTTP_IF_NONE_MATCH=ETAG)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], ETAG)
+        self.assertEqual(response.content, b'')
+
+    def test_redirect_mode_sends_signed_url(self):
+        response = self._get(query={'mode': 'redirect', 'filename': 'a.bin'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            response['Location'],
+            f'{self.base_url}/storage/v1/object/sign/bucket/a.bin?token=signed&download=a.bin',
+        )
+        # ファイル本体は取得しない
+        self.assertEqual(self.server.received, [])
+
+    def test_redirect_setting_applies_without_mode_parameter(self):
+        with override_settings(DOWNLOAD_MODE='redirect'):
+            self.assertEqual(self._get().status_code, 302)
+
+    def test_redirect_mode_proxies_urls_outside_the_bucket(self):
+        self.file_url = f'{self.base_url}/elsewhere/a.bin'
+        response = self._get(query={'mode': 'redirect'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), BODY)
+
+    def test_missing_url(self):
+        self.assertEqual(self.client.get('/download/').status_code, 400)
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .services import decode_cursor, encode_cursor, get_file_page
+from .testing import make_archive
+
+
+@override_settings(FILE_LIST_PAGE_SIZE=3)
+class FilePageTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        # 同じ登録日時のデータを含めて、(作成日時, ID) で順序が決まることを確かめる
+        self.items = [
+            make_archive(file_path=f'https://example.com/{i}.jpg', created_at=now - timedelta(minutes=i // 2))
+            for i in range(8)
+        ]
+        self.expected = sorted(self.items, key=lambda item: (item.created_at, item.id), reverse=True)
+
+    def test_pages_follow_each_other_without_gaps_or_duplicates(self):
+        seen = []
+        after = None
+        while True:
+            page, cursor = get_file_page(after=after)
+            seen.extend(page)
+            if cursor is None:
+                break
+            after = decode_cursor(cursor)
+        self.assertEqual([item.id for item in seen], [item.id for item in self.expected])
+
+    def test_start_includes_the_given_item(self):
+        start = self.expected[4]
+        page, _ = get_file_page(start=start)
+        self.assertEqual([item.id for item in page], [item.id for item in self.expected[4:7]])
+
+    def test_cursor_round_trip_and_errors(self):
+        item = self.expected[0]
+        self.assertEqual(decode_cursor(encode_cursor(item)), (item.created_at, item.id))
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+        self.assertEqual(self.client.get('/files/', {'cursor': 'not-a-cursor'}).status_code, 400)
+
+    def test_file_list_fragment_continues_from_cursor(self):
+        _, cursor = get_file_page()
+        response = self.client.get('/files/', {'cursor': cursor, 'fragment': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item.id for item in response.context['files']], [item.id for item in self.expected[3:6]])
+
+    def test_captured_at_is_shown_when_known(self):
+        captured = make_archive(captured_at=datetime(2024, 5, 1, 3, 30, tzinfo=dt_timezone.utc))
+        response = self.client.get('/files/', {'from': captured.pk, 'fragment': 1})
+        self.assertContains(response, '撮影: 2024/05/01 03:30', count=1)
@@ -0,0 +1,126 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import geocache
+from .models import GeocodeCache
+from .utils import geocode_address, reverse_geocode
+
+FORWARD = GeocodeCache.KIND_FORWARD
+
+
+@override_settings(GEOCODE_CACHE_TTL=3600, GEOCODE_NEGATIVE_CACHE_TTL=60)
+class GeocodeCacheTests(TestCase):
+
+    def setUp(self):
+        geocache.clear_memory_cache()
+        self.addCleanup(geocache.clear_memory_cache)
+        self.now = timezone.now()
+        patcher = mock.patch('archive_app.geocache.timezone.now', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+    def test_normalize_address(self):
+        self.assertEqual(geocache.normalize_address('　東京都  千代田区１－１ '), '東京都 千代田区1-1')
+        self.assertEqual(geocache.normalize_address(None), '')
+
+    def test_coordinate_key_rounds(self):
+        with override_settings(GEOCODE_REVERSE_PRECISION=2):
+            self.assertEqual(geocache.coordinate_key(35.68123, 139.76789), '35.68,139.77')
+
+    def test_memory_then_database_hit(self):
+        fetch = mock.Mock(return_value=(35.0, 139.0))
+        self.assertEqual(geocache.lookup(FORWARD, 'a', fetch), (35.0, 139.0))
+        self.assertEqual(geocache.lookup(FORWARD, 'a', fetch), (35.0, 139.0))
+        # 別のプロセスではメモリには無いが、データベースから読める
+        geocache.clear_memory_cache()
+        with self.assertNumQueries(1):
+            self.assertEqual(geocache.lookup(FORWARD, 'a', fetch), (35.0, 139.0))
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_found_result_expires_after_ttl(self):
+        fetch = mock.Mock(return_value=(35.0, 139.0))
+        geocache.lookup(FORWARD, 'a', fetch)
+        self._advance(3599)
+        geocache.lookup(FORWARD, 'a', fetch)
+        self.assertEqual(fetch.call_count, 1)
+        self._advance(2)
+        geocache.lookup(FORWARD, 'a', fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_not_found_is_cached_with_shorter_ttl(self):
+        fetch = mock.Mock(return_value=None)
+        self.assertIsNone(geocache.lookup(FORWARD, 'nowhere', fetch))
+        entry = GeocodeCache.objects.get(kind=FORWARD, key='nowhere')
+        self.assertFalse(entry.found)
+        self.assertEqual(entry.expires_at, self.now + timedelta(seconds=60))
+
+        self.assertIsNone(geocache.lookup(FORWARD, 'nowhere', fetch))
+        self.assertEqual(fetch.call_count, 1)
+        self._advance(61)
+        geocache.clear_memory_cache()
+        geocache.lookup(FORWARD, 'nowhere', fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_errors_are_not_cached(self):
+        fetch = mock.Mock(side_effect=[RuntimeError('timeout'), (35.0, 139.0)])
+        with self.assertRaises(RuntimeError):
+            geocache.lookup(FORWARD, 'a', fetch)
+        self.assertFalse(GeocodeCache.objects.exists())
+        self.assertEqual(geocache.lookup(FORWARD, 'a', fetch), (35.0, 139.0))
+
+    def test_refresh_bypasses_the_cache(self):
+        fetch = mock.Mock(side_effect=[(35.0, 139.0), (36.0, 140.0)])
+        geocache.lookup(FORWARD, 'a', fetch)
+        self.assertEqual(geocache.lookup(FORWARD, 'a', fetch, refresh=True), (36.0, 140.0))
+        self.assertEqual(geocache.lookup(FORWARD, 'a', fetch), (36.0, 140.0))
+        self.assertEqual(GeocodeCache.objects.count(), 1)
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        lru = geocache.LRUCache(2)
+        expires_at = self.now + timedelta(hours=1)
+        lru.set('a', 1, expires_at)
+        lru.set('b', 2, expires_at)
+        lru.get('a')
+        lru.set('c', 3, expires_at)
+        self.assertEqual(lru.get('b'), (False, None))
+        self.assertEqual(lru.get('a'), (True, 1))
+
+
+@override_settings(GEOCODE_REVERSE_PRECISION=4)
+class GeocodeFunctionTests(TestCase):
+
+    def setUp(self):
+        geocache.clear_memory_cache()
+        self.addCleanup(geocache.clear_memory_cache)
+
+    def _response(self, data):
+        response = mock.Mock()
+        response.json.return_value = data
+        return response
+
+    @mock.patch('archive_app.utils.http_client.get')
+    def test_same_address_is_requested_once(self, get):
+        get.return_value = self._response([{'geometry': {'coordinates': [139.76, 35.68]}}])
+        self.assertEqual(geocode_address('東京都千代田区'), (35.68, 139.76))
+        self.assertEqual(geocode_address(' 東京都千代田区　'), (35.68, 139.76))
+        self.assertEqual(get.call_count, 1)
+
+    @mock.patch('archive_app.utils.http_client.get')
+    def test_nearby_coordinates_share_reverse_result(self, get):
+        get.return_value = self._response({'results': [{'municipality': '13101', 'localAddress': '丸の内一丁目'}]})
+        self.assertEqual(reverse_geocode(35.68121, 139.76711), '13101 丸の内一丁目')
+        self.assertEqual(reverse_geocode(35.68124, 139.76709), '13101 丸の内一丁目')
+        self.assertEqual(get.call_count, 1)
+
+    @mock.patch('archive_app.utils.http_client.get')
+    def test_network_error_falls_back_without_caching(self, get):
+        get.side_effect = RuntimeError('timeout')
+        with self.assertLogs('archive_app.utils', 'WARNING'):
+            self.assertEqual(geocode_address('大阪'), (None, None))
+        self.assertFalse(GeocodeCache.objects.exists())
@@ -0,0 +1,153 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from . import http_client
+from .http_client import CircuitBreaker, CircuitOpenError
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """
+    server.statuses の順にステータスを返す（最後のものは繰り返す）
+    """
+
+    def _respond(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.command)
+            status = server.statuses[min(len(server.requests), len(server.statuses)) - 1]
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    do_GET = do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(testcase, statuses):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    server.statuses = statuses
+    server.requests = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    testcase.addCleanup(server.server_close)
+    testcase.addCleanup(server.shutdown)
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('archive_app.http_client.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    def _open(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_the_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+
+    def test_allows_one_trial_after_reset_timeout(self):
+        self._open()
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_trial_success_closes_the_circuit(self):
+        self._open()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_trial_failure_reopens_the_circuit(self):
+        self._open()
+        self.now += 30
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+
+
+@override_settings(HTTP_MAX_RETRIES=2, HTTP_RETRY_BACKOFF=0, HTTP_CIRCUIT_FAILURE_THRESHOLD=3)
+class RequestTests(SimpleTestCase):
+
+    def setUp(self):
+        # 接続先ごとのセッション・ブレーカーはテストごとに作り直す
+        for patcher in (
+            mock.patch.dict(http_client._sessions, clear=True),
+            mock.patch.dict(http_client._breakers, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_retries_gateway_errors(self):
+        for status in (502, 503, 504):
+            with self.subTest(status=status):
+                http_client._breakers.clear()
+                server, url = start_server(self, [status, status, 200])
+                response = http_client.get(url, call_site='test')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(server.requests), 3)
+
+    def test_gives_up_after_max_retries(self):
+        server, url = start_server(self, [503])
+        self.assertEqual(http_client.get(url, call_site='test').status_code, 503)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_does_not_retry_non_idempotent_methods(self):
+        server, url = start_server(self, [503, 200])
+        response = http_client.request('POST', url, call_site='test', data=b'x')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(server.requests, ['POST'])
+
+    def test_does_not_retry_other_errors(self):
+        server, url = start_server(self, [500, 200])
+        self.assertEqual(http_client.get(url, call_site='test').status_code, 500)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        server, url = start_server(self, [500])
+        for _ in range(3):
+            http_client.get(url, call_site='test')
+        with self.assertRaises(CircuitOpenError):
+            http_client.get(url, call_site='test')
+        self.assertEqual(len(server.requests), 3)
+
+    def test_connection_errors_count_as_failures(self):
+        server, url = start_server(self, [200])
+        server.shutdown()
+        server.server_close()
+        for _ in range(3):
+            with self.assertRaises(requests.ConnectionError):
+                http_client.get(url, call_site='test', timeout=1)
+        with self.assertRaises(CircuitOpenError):
+            http_client.get(url, call_site='test')
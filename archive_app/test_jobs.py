@@ -0,0 +1,187 @@
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import jobs
+from .checks import check_upload_spool
+from .jobs import claim_next_job, enqueue_upload, requeue_stale_jobs, run_job
+from .models import Archive, UploadJob
+from .storage import SupabaseStorage, get_spool_storage
+
+
+class UploadJobQueueTests(TestCase):
+
+    def _job(self, **fields):
+        values = {'spool_path': '/nonexistent', 'storage_file_name': 'a.jpg', 'file_type': 'image'}
+        values.update(fields)
+        return UploadJob.objects.create(**values)
+
+    def test_claims_oldest_due_job_once(self):
+        later = self._job(run_after=timezone.now() - timedelta(seconds=10))
+        earliest = self._job(run_after=timezone.now() - timedelta(seconds=60))
+        self._job(run_after=timezone.now() + timedelta(hours=1))
+
+        job = claim_next_job()
+        self.assertEqual(job.pk, earliest.pk)
+        self.assertEqual(job.status, UploadJob.STATUS_RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(claim_next_job().pk, later.pk)
+        # 残りは実行予定の時刻がまだ来ていない
+        self.assertIsNone(claim_next_job())
+
+    def test_requeues_only_stale_running_jobs(self):
+        stale = self._job(status=UploadJob.STATUS_RUNNING)
+        fresh = self._job(status=UploadJob.STATUS_RUNNING)
+        done = self._job(status=UploadJob.STATUS_DONE)
+        old = timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_STALE_TIMEOUT + 60)
+        UploadJob.objects.filter(pk__in=[stale.pk, done.pk]).update(updated_at=old)
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(UploadJob.objects.get(pk=stale.pk).status, UploadJob.STATUS_PENDING)
+        self.assertEqual(UploadJob.objects.get(pk=fresh.pk).status, UploadJob.STATUS_RUNNING)
+        self.assertEqual(UploadJob.objects.get(pk=done.pk).status, UploadJob.STATUS_DONE)
+        self.assertEqual(claim_next_job().pk, stale.pk)
+
+
+class RunJobTests(TestCase):
+
+    def setUp(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        storages = {
+            **settings.STORAGES,
+            'spool': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': spool_dir}},
+        }
+        patcher = override_settings(STORAGES=storages, UPLOAD_SPOOL_PREFIX='spool/', UPLOAD_JOB_MAX_ATTEMPTS=3)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def _enqueue(self):
+        enqueue_upload(ContentFile(b'photo', name='a.jpg'), 'a.jpg', 'image', '説明', '東京', 35.68, 139.76)
+        return claim_next_job()
+
+    def _archive(self, *args):
+        if args:
+            self.received = args[0].read()
+        return Archive(file_type='image', file_path='https://example.com/a.jpg', latitude=35.68, longitude=139.76)
+
+    def test_enqueue_writes_to_spool_storage(self):
+        job = self._enqueue()
+        self.assertEqual(job.spool_path, 'spool/a.jpg')
+        with get_spool_storage().open(job.spool_path) as f:
+            self.assertEqual(f.read(), b'photo')
+
+    def test_successful_job_saves_archive_and_removes_spool_file(self):
+        job = self._enqueue()
+        with mock.patch('archive_app.jobs.prepare_archive_from_upload', side_effect=self._archive):
+            job = run_job(job)
+        self.assertEqual(self.received, b'photo')
+        self.assertEqual(job.status, UploadJob.STATUS_DONE)
+        self.assertEqual(job.archive.file_path, 'https://example.com/a.jpg')
+        self.assertFalse(get_spool_storage().exists(job.spool_path))
+
+    def test_failure_is_retried_later(self):
+        job = self._enqueue()
+        with mock.patch('archive_app.jobs.prepare_archive_from_upload', side_effect=RuntimeError('timeout')), \
+                self.assertLogs('archive_app.jobs', 'ERROR'):
+            job = run_job(job)
+        self.assertEqual(job.status, UploadJob.STATUS_PENDING)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(job.last_error, 'timeout')
+        self.assertTrue(get_spool_storage().exists(job.spool_path))
+
+    def test_last_attempt_fails_the_job(self):
+        job = self._enqueue()
+        UploadJob.objects.filter(pk=job.pk).update(attempts=3)
+        job.refresh_from_db()
+        with mock.patch('archive_app.jobs.prepare_archive_from_upload', side_effect=RuntimeError('timeout')), \
+                self.assertLogs('archive_app.jobs', 'ERROR'):
+            job = run_job(job)
+        self.assertEqual(job.status, UploadJob.STATUS_FAILED)
+        self.assertFalse(get_spool_storage().exists(job.spool_path))
+
+    def test_missing_spool_file_fails_without_retry(self):
+        job = self._enqueue()
+        get_spool_storage().delete(job.spool_path)
+        with self.assertLogs('archive_app.jobs', 'ERROR'):
+            job = run_job(job)
+        self.assertEqual(job.status, UploadJob.STATUS_FAILED)
+        self.assertIn('スプールのファイルが見つかりません', job.last_error)
+
+    def test_requeued_job_does_not_save_twice(self):
+        job = self._enqueue()
+
+        def requeue_and_prepare(*args):
+            # 処理中に止まったとみなされて、別のワーカーに取り出された
+            UploadJob.objects.filter(pk=job.pk).update(status=UploadJob.STATUS_PENDING)
+            claim_next_job()
+            return self._archive()
+
+        with mock.patch('archive_app.jobs.prepare_archive_from_upload', side_effect=requeue_and_prepare), \
+                self.assertLogs('archive_app.jobs', 'WARNING'):
+            run_job(job)
+        self.assertFalse(Archive.objects.exists())
+        self.assertTrue(get_spool_storage().exists(job.spool_path))
+
+
+class HeartbeatTests(SimpleTestCase):
+
+    @override_settings(UPLOAD_JOB_HEARTBEAT_INTERVAL=0.01)
+    def test_touches_job_until_finished(self):
+        job = UploadJob(pk=1)
+        beats = threading.Semaphore(0)
+        with mock.patch('archive_app.jobs._update_job', side_effect=lambda job: beats.release()) as update:
+            with jobs._heartbeat(job):
+                for _ in range(3):
+                    self.assertTrue(beats.acquire(timeout=5))
+            count = update.call_count
+            # 処理が終わったら更新しない
+            time.sleep(0.05)
+            self.assertEqual(update.call_count, count)
+        self.assertGreaterEqual(count, 3)
+        update.assert_called_with(job)
+
+
+class SpoolStorageTests(SimpleTestCase):
+
+    def _response(self, status_code, body=b''):
+        response = mock.MagicMock(status_code=status_code)
+        response.__enter__.return_value = response
+        response.iter_content.return_value = [body[:3], body[3:]]
+        return response
+
+    def test_supabase_storage_downloads_spooled_file(self):
+        storage = SupabaseStorage(url='https://example.supabase.co', key='key')
+        with mock.patch.object(storage, '_request', return_value=self._response(200, b'spooled')) as request:
+            with storage.open('spool/a.jpg') as f:
+                self.assertEqual(f.read(), b'spooled')
+        self.assertEqual(
+            request.call_args.args,
+            ('GET', 'https://example.supabase.co/storage/v1/object/file-mapping-bucket/spool/a.jpg'),
+        )
+
+    def test_supabase_storage_missing_file(self):
+        storage = SupabaseStorage(url='https://example.supabase.co', key='key')
+        for status in (400, 404):
+            with self.subTest(status=status), \
+                    mock.patch.object(storage, '_request', return_value=self._response(status)), \
+                    self.assertRaises(FileNotFoundError):
+                storage.open('spool/a.jpg')
+
+    @override_settings(UPLOAD_USE_QUEUE=True, UPLOAD_SPOOL_STORAGE='local', ARCHIVE_STORAGE_BACKEND='supabase')
+    def test_local_spool_is_reported(self):
+        self.assertEqual([message.id for message in check_upload_spool(None)], ['archive_app.W001'])
+        with mock.patch.dict('os.environ', {'VERCEL': '1'}):
+            self.assertEqual([message.id for message in check_upload_spool(None)], ['archive_app.E001'])
+
+    @override_settings(UPLOAD_USE_QUEUE=True, UPLOAD_SPOOL_STORAGE='archive', ARCHIVE_STORAGE_BACKEND='supabase')
+    def test_shared_spool_passes(self):
+        self.assertEqual(check_upload_spool(None), [])
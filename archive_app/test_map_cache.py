@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from .caching import get_location_versions
+from .models import Archive
+from .services import bulk_create_archives, create_map_html
+from .testing import make_archive
+
+
+class MapHtmlCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tokyo = make_archive(address='東京', latitude=35.68, longitude=139.76)
+
+    def test_cached_map_is_served_without_rebuilding(self):
+        html = create_map_html()
+        # 2回目はデータセットのバージョンを読むだけで、地図は作り直さない
+        with self.assertNumQueries(1):
+            self.assertEqual(create_map_html(), html)
+
+    def test_save_and_delete_rebuild_the_map(self):
+        create_map_html()
+        osaka = make_archive(address='大阪', latitude=34.70, longitude=135.50)
+        self.assertIn('/locations/34.7000000,135.5000000/', create_map_html())
+        osaka.delete()
+        self.assertNotIn('/locations/34.7000000,135.5000000/', create_map_html())
+
+    def test_cached_map_is_rebuilt_after_bulk_create(self):
+        html = create_map_html()
+        self.assertEqual(create_map_html(), html)
+        bulk_create_archives([
+            Archive(file_type='image', file_path='https://example.com/d.jpg', address='札幌', latitude=43.06, longitude=141.35),
+        ])
+        self.assertIn('/locations/43.0600000,141.3500000/', create_map_html())
+
+    def test_moving_an_archive_bumps_both_locations(self):
+        old, new = (35.68, 139.76), (34.70, 135.50)
+        before = get_location_versions([old, new])
+        self.tokyo.latitude, self.tokyo.longitude = new
+        self.tokyo.save()
+        after = get_location_versions([old, new])
+        self.assertNotEqual(after[old], before[old])
+        self.assertNotEqual(after[new], before[new])
@@ -0,0 +1,106 @@
+import gzip
+import json
+import struct
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .services import MARKER_FILE_TYPES
+from .testing import make_archive
+from .views import MARKER_CONTENT_TYPES
+
+
+def decode_binary(body, count):
+    """
+    binary 形式の本文を (ID, 緯度, 経度, 種類の番号) の列に戻す（地図の JavaScript と同じ読み方）
+    """
+    ids = struct.unpack_from(f'<{count}d', body, 0)
+    latitudes = struct.unpack_from(f'<{count}f', body, 8 * count)
+    longitudes = struct.unpack_from(f'<{count}f', body, 12 * count)
+    types = tuple(body[16 * count:17 * count])
+    return ids, latitudes, longitudes, types
+
+
+class MarkerFormatTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.image = make_archive(file_type='image', latitude=35.6812345678, longitude=139.7671234567)
+        self.audio = make_archive(file_type='audio', latitude=-33.8688, longitude=151.2093)
+        # 種類の一覧に無い値は other として返す
+        self.unknown = make_archive(file_type='document', latitude=0.5, longitude=-0.5)
+
+    def test_columnar(self):
+        response = self.client.get('/get_markers/', {'format': 'columnar'})
+        self.assertEqual(response['Content-Type'], MARKER_CONTENT_TYPES['columnar'])
+        self.assertEqual(response['X-Marker-Count'], '3')
+        self.assertEqual(json.loads(response.content), {
+            'file_types': list(MARKER_FILE_TYPES),
+            'ids': [self.image.pk, self.audio.pk, self.unknown.pk],
+            'latitudes': [35.681235, -33.8688, 0.5],
+            'longitudes': [139.767123, 151.2093, -0.5],
+            'types': [0, 2, 3],
+        })
+
+    def test_binary_layout(self):
+        response = self.client.get('/get_markers/', {'format': 'binary'})
+        self.assertEqual(response['Content-Type'], MARKER_CONTENT_TYPES['binary'])
+        self.assertEqual(response['X-Marker-Count'], '3')
+        self.assertEqual(len(response.content), 17 * 3)
+
+        ids, latitudes, longitudes, types = decode_binary(response.content, 3)
+        self.assertEqual(ids, (self.image.pk, self.audio.pk, self.unknown.pk))
+        for actual, expected in zip(latitudes, (35.6812345678, -33.8688, 0.5)):
+            self.assertAlmostEqual(actual, expected, places=5)
+        for actual, expected in zip(longitudes, (139.7671234567, 151.2093, -0.5)):
+            self.assertAlmostEqual(actual, expected, places=4)
+        self.assertEqual(types, (0, 2, 3))
+
+    def test_binary_ids_beyond_32_bits(self):
+        large = make_archive(id=2 ** 53 - 1)
+        response = self.client.get('/get_markers/', {'format': 'binary'})
+        ids = decode_binary(response.content, 4)[0]
+        self.assertEqual(ids[-1], large.pk)
+        self.assertEqual(int(ids[-1]), 2 ** 53 - 1)
+
+    def test_empty_binary(self):
+        response = self.client.get('/get_markers/', {'format': 'binary', 'bbox': '10,10,11,11'})
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Marker-Count'], '0')
+
+    def test_json_is_the_default(self):
+        response = self.client.get('/get_markers/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn('X-Marker-Count', response)
+        self.assertEqual(len(json.loads(response.content)), 3)
+
+    def test_accept_header_selects_format(self):
+        for fmt in ('columnar', 'binary'):
+            with self.subTest(fmt=fmt):
+                response = self.client.get('/get_markers/', HTTP_ACCEPT=f'{MARKER_CONTENT_TYPES[fmt]}, */*;q=0.1')
+                self.assertEqual(response['Content-Type'], MARKER_CONTENT_TYPES[fmt])
+                self.assertIn('Accept', response['Vary'])
+
+    def test_format_parameter_wins_over_accept(self):
+        response = self.client.get('/get_markers/', {'format': 'json'}, HTTP_ACCEPT=MARKER_CONTENT_TYPES['binary'])
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_invalid_format(self):
+        self.assertEqual(self.client.get('/get_markers/', {'format': 'xml'}).status_code, 400)
+
+    def test_each_format_has_its_own_etag(self):
+        etags = {
+            fmt: self.client.get('/get_markers/', {'format': fmt})['ETag'] for fmt in MARKER_CONTENT_TYPES
+        }
+        self.assertEqual(len(set(etags.values())), 3)
+        # 別の形式の ETag では 304 にならない
+        response = self.client.get('/get_markers/', {'format': 'binary'}, HTTP_IF_NONE_MATCH=etags['columnar'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/get_markers/', {'format': 'binary'}, HTTP_IF_NONE_MATCH=etags['binary'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_gzip_body_matches(self):
+        plain = self.client.get('/get_markers/', {'format': 'binary'}).content
+        response = self.client.get('/get_markers/', {'format': 'binary'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain)
@@ -0,0 +1,58 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .testing import make_archive
+
+
+class MarkerSyncTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tokyo = make_archive(address='東京', latitude=35.68, longitude=139.76)
+        self.osaka = make_archive(address='大阪', latitude=34.70, longitude=135.50)
+        self.fiji = make_archive(address='フィジー', latitude=-17.8, longitude=179.5)
+
+    def _ids(self, response):
+        return sorted(item['id'] for item in json.loads(response.content))
+
+    def test_unchanged_markers_return_not_modified(self):
+        response = self.client.get('/get_markers/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/get_markers/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        make_archive(address='名古屋', latitude=35.17, longitude=136.88)
+        response = self.client.get('/get_markers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(json.loads(response.content)), 4)
+
+    def test_since_returns_only_newer_markers(self):
+        response = self.client.get('/get_markers/')
+        cursor = response['X-Marker-Cursor']
+        self.assertEqual(int(cursor), self.fiji.id)
+        newer = make_archive(latitude=35.0, longitude=139.0)
+        self.assertEqual(self._ids(self.client.get('/get_markers/', {'since': cursor})), [newer.id])
+
+    def test_empty_delta_keeps_cursor(self):
+        response = self.client.get('/get_markers/', {'since': self.fiji.id})
+        self.assertEqual(self._ids(response), [])
+        self.assertEqual(int(response['X-Marker-Cursor']), self.fiji.id)
+
+    def test_inserts_keep_edit_version(self):
+        edits = self.client.get('/get_markers/')['X-Marker-Edits']
+        make_archive(latitude=35.0, longitude=139.0)
+        response = self.client.get('/get_markers/', {'since': self.fiji.id})
+        self.assertEqual(response['X-Marker-Edits'], edits)
+
+    def test_updates_and_deletes_change_edit_version(self):
+        edits = self.client.get('/get_markers/')['X-Marker-Edits']
+        self.osaka.description = '更新'
+        self.osaka.save()
+        updated = self.client.get('/get_markers/', {'since': self.fiji.id})['X-Marker-Edits']
+        self.assertNotEqual(updated, edits)
+
+        self.tokyo.delete()
+        deleted = self.client.get('/get_markers/', {'since': self.fiji.id})['X-Marker-Edits']
+        self.assertNotEqual(deleted, updated)
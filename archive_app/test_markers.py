@@ -0,0 +1,63 @@
+import json
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .testing import make_archive
+from .utils import parse_bbox
+
+
+class ParseBBoxTests(SimpleTestCase):
+
+    def test_returns_south_west_north_east(self):
+        self.assertEqual(parse_bbox('139.7,35.6,139.8,35.7'), (35.6, 139.7, 35.7, 139.8))
+
+    def test_empty_value_means_no_bbox(self):
+        self.assertIsNone(parse_bbox(''))
+        self.assertIsNone(parse_bbox(None))
+
+    def test_normalizes_wrapped_longitudes(self):
+        for actual, expected in zip(parse_bbox('499.7,35.6,499.8,35.7'), (35.6, 139.7, 35.7, 139.8)):
+            self.assertAlmostEqual(actual, expected)
+        self.assertEqual(parse_bbox('-200,0,200,10'), (0.0, -180.0, 10.0, 180.0))
+
+    def test_rejects_invalid_values(self):
+        for value in ('1,2,3', 'a,b,c,d', '0,10,1,5', '0,-100,1,5'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_bbox(value)
+
+
+class MarkerViewportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tokyo = make_archive(address='東京', latitude=35.68, longitude=139.76)
+        self.osaka = make_archive(address='大阪', latitude=34.70, longitude=135.50)
+        self.fiji = make_archive(address='フィジー', latitude=-17.8, longitude=179.5)
+
+    def _ids(self, response):
+        return sorted(item['id'] for item in json.loads(response.content))
+
+    def test_bbox_limits_markers_to_viewport(self):
+        response = self.client.get('/get_markers/', {'bbox': '139,35,140,36'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._ids(response), [self.tokyo.id])
+
+    def test_bbox_crossing_the_antimeridian(self):
+        response = self.client.get('/get_markers/', {'bbox': '170,-20,-170,-10'})
+        self.assertEqual(self._ids(response), [self.fiji.id])
+
+    def test_without_bbox_returns_everything(self):
+        response = self.client.get('/get_markers/')
+        self.assertEqual(self._ids(response), sorted([self.tokyo.id, self.osaka.id, self.fiji.id]))
+
+    def test_invalid_bbox_is_a_bad_request(self):
+        response = self.client.get('/get_markers/', {'bbox': '0,10,1,5'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', json.loads(response.content))
+
+    @override_settings(MARKERS_MAX_RESULTS=2)
+    def test_results_are_capped_and_flagged(self):
+        response = self.client.get('/get_markers/')
+        self.assertEqual(len(json.loads(response.content)), 2)
+        self.assertEqual(response['X-Markers-Truncated'], 'true')
@@ -0,0 +1,163 @@
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from .media_cache import MEDIA_CACHE_BYTES_SAVED, MEDIA_CACHE_REQUESTS, MediaCache
+from . import test_download
+from .test_download import BODY, ETAG
+
+
+class FakeUpstream:
+
+    def __init__(self, body, etag='"v1"', status_code=200):
+        self.status_code = status_code
+        self.headers = {'ETag': etag, 'Content-Length': str(len(body)), 'Content-Type': 'image/jpeg'}
+        self.body = body
+
+
+class MediaCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = MediaCache(self.directory, max_bytes=100, max_object_bytes=60, fresh_seconds=60)
+
+    def _store(self, url, body, **kwargs):
+        upstream = FakeUpstream(body, **kwargs)
+        return b''.join(self.cache.stream_and_store(url, upstream, [body[:5], body[5:]]))
+
+    def test_stores_and_finds_fresh_entry(self):
+        self.assertEqual(self._store('https://example.com/a.jpg', b'0123456789'), b'0123456789')
+        data_path, meta, fresh = self.cache.lookup('https://example.com/a.jpg')
+        self.assertTrue(fresh)
+        self.assertEqual(data_path.read_bytes(), b'0123456789')
+        self.assertEqual((meta['etag'], meta['size'], meta['content_type']), ('"v1"', 10, 'image/jpeg'))
+        self.assertIsNone(self.cache.lookup('https://example.com/b.jpg'))
+
+    def test_entry_becomes_stale_and_is_extended_by_revalidation(self):
+        self._store('https://example.com/a.jpg', b'0123456789')
+        with mock.patch('archive_app.media_cache.time.time', return_value=time.time() + 61):
+            data_path, meta, fresh = self.cache.lookup('https://example.com/a.jpg')
+            self.assertFalse(fresh)
+            self.cache.revalidated('https://example.com/a.jpg', meta)
+            self.assertTrue(self.cache.lookup('https://example.com/a.jpg')[2])
+
+    def test_interrupted_download_is_not_stored(self):
+        upstream = FakeUpstream(b'0123456789')
+        chunks = self.cache.stream_and_store('https://example.com/a.jpg', upstream, [b'01234', b'56789'])
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(self.cache.lookup('https://example.com/a.jpg'))
+        self.assertEqual([path.name for path in self.cache.directory.iterdir()], [])
+
+    def test_should_store_only_complete_tagged_small_responses(self):
+        self.assertTrue(self.cache.should_store(FakeUpstream(b'x' * 60)))
+        self.assertFalse(self.cache.should_store(FakeUpstream(b'x' * 61)))
+        self.assertFalse(self.cache.should_store(FakeUpstream(b'x', status_code=206)))
+        untagged = FakeUpstream(b'x')
+        del untagged.headers['ETag']
+        self.assertFalse(self.cache.should_store(untagged))
+
+    def test_evicts_least_recently_used(self):
+        for name in ('a', 'b', 'c'):
+            self._store(f'https://example.com/{name}', b'x' * 40)
+            time.sleep(0.01)
+        # c を入れた時点で上限を超えたので、一番古い a が消える
+        self.assertIsNone(self.cache.lookup('https://example.com/a'))
+        self.cache.lookup('https://example.com/b')
+        self._store('https://example.com/d', b'x' * 40)
+        self.assertIsNotNone(self.cache.lookup('https://example.com/b'))
+        self.assertIsNone(self.cache.lookup('https://example.com/c'))
+
+
+class DownloadMediaCacheTests(test_download.DownloadFileTests):
+    """
+    ディスクキャッシュを有効にした download_file（DownloadFileTests のテストもキャッシュ有りで実行する）
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        patcher = override_settings(MEDIA_CACHE_DIR=self.directory, MEDIA_CACHE_FRESH_SECONDS=60)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        patcher = mock.patch('archive_app.media_cache._media_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _download(self, **headers):
+        response = self._get(**headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def _saved(self):
+        return MEDIA_CACHE_BYTES_SAVED.samples().get((), 0)
+
+    def _requests(self, result):
+        return MEDIA_CACHE_REQUESTS.samples().get((result,), 0)
+
+    def _rewrite_meta(self, **changes):
+        for meta_path in Path(self.directory).glob('*.json'):
+            meta = json.loads(meta_path.read_text())
+            meta.update(changes)
+            meta_path.write_text(json.dumps(meta))
+
+    def _expire(self):
+        self._rewrite_meta(stored_at=time.time() - 120)
+
+    def test_second_download_is_served_from_disk(self):
+        self._download()
+        saved = self._saved()
+        self.server.received.clear()
+        response, body = self._download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, BODY)
+        self.assertEqual(response['ETag'], ETAG)
+        self.assertEqual(self.server.received, [])
+        self.assertEqual(self._saved(), saved + len(BODY))
+
+    def test_not_modified_from_cache_does_not_count_saved_bytes(self):
+        self._download()
+        saved = self._saved()
+        response, body = self._download(HTTP_IF_NONE_MATCH=ETAG)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(self._saved(), saved)
+
+    def test_stale_entry_is_revalidated_with_stored_etag(self):
+        self._download()
+        self._expire()
+        self.server.received.clear()
+        revalidated = self._requests('revalidated')
+
+        response, body = self._download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, BODY)
+        self.assertEqual(self.server.received[-1]['If-None-Match'], ETAG)
+        self.assertEqual(self._requests('revalidated'), revalidated + 1)
+
+        # 確認したので、しばらくは取得元に問い合わせない
+        self.server.received.clear()
+        self._download()
+        self.assertEqual(self.server.received, [])
+
+    def test_changed_upstream_replaces_stale_entry(self):
+        self._download()
+        self._rewrite_meta(stored_at=time.time() - 120, etag='"v0"')
+
+        response, body = self._download(HTTP_IF_NONE_MATCH='"v0"')
+        # 取得元では変わっているので、クライアントの ETag が古くても本体を返す
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, BODY)
+        self.assertEqual(self.server.received[-1]['If-None-Match'], '"v0"')
+        self.server.received.clear()
+        response, _ = self._download()
+        self.assertEqual(response['ETag'], ETAG)
+        self.assertEqual(self.server.received, [])
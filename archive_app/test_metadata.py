@@ -0,0 +1,290 @@
+import io
+import random
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from .metadata import extract_metadata, parse_exif
+
+JST = dt_timezone(timedelta(hours=9))
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=dt_timezone.utc)
+
+
+# --- EXIF のテスト用データ ---
+
+def _tiff_value(endian, value_type, value):
+    if value_type == 2:
+        raw = value.encode('ascii') + b'\x00'
+        return len(raw), raw
+    if value_type == 5:
+        return len(value), b''.join(struct.pack(endian + 'II', n, d) for n, d in value)
+    if value_type == 4:
+        return 1, struct.pack(endian + 'I', value)
+    raw = bytes(value)
+    return len(raw), raw
+
+
+def build_tiff(endian, ifd0=(), exif=(), gps=()):
+    """
+    (タグ, 型, 値) の一覧から、IFD0・Exif IFD・GPS IFD を持つ TIFF 形式のデータを作る
+    """
+    ifds = [list(ifd0), list(exif), list(gps)]
+    pointers = (1 if exif else 0) + (1 if gps else 0)
+    sizes = [2 + 12 * (len(entries) + (pointers if i == 0 else 0)) + 4 for i, entries in enumerate(ifds)]
+    exif_offset = 8 + sizes[0]
+    gps_offset = exif_offset + (sizes[1] if exif else 0)
+    data_offset = gps_offset + (sizes[2] if gps else 0)
+    if exif:
+        ifds[0].append((0x8769, 4, exif_offset))
+    if gps:
+        ifds[0].append((0x8825, 4, gps_offset))
+
+    blobs, data = [], b''
+    for entries in ifds:
+        if not entries:
+            continue
+        blob = struct.pack(endian + 'H', len(entries))
+        for tag, value_type, value in sorted(entries):
+            count, raw = _tiff_value(endian, value_type, value)
+            if len(raw) <= 4:
+                blob += struct.pack(endian + 'HHI', tag, value_type, count) + raw.ljust(4, b'\x00')
+            else:
+                blob += struct.pack(endian + 'HHII', tag, value_type, count, data_offset + len(data))
+                data += raw
+        blobs.append(blob + b'\x00' * 4)
+    order = b'II' if endian == '<' else b'MM'
+    return order + struct.pack(endian + 'HI', 42, 8) + b''.join(blobs) + data
+
+
+def build_jpeg(tiff):
+    app1 = b'Exif\x00\x00' + tiff
+    return b'\xff\xd8\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1 + b'\xff\xda' + b'\x00' * 64 + b'\xff\xd9'
+
+
+def gps_entries(latitude_ref, longitude_ref):
+    # 35度39分31.2秒・139度44分43.44秒
+    return [
+        (1, 2, latitude_ref),
+        (2, 5, [(35, 1), (39, 1), (312, 10)]),
+        (3, 2, longitude_ref),
+        (4, 5, [(139, 1), (44, 1), (4344, 100)]),
+    ]
+
+
+# --- MP4 / MOV のテスト用データ ---
+
+def box(box_type, payload=b''):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def large_box(box_type, payload=b''):
+    # 64ビットの大きさ（size = 1 の後に8バイトの大きさが続く）
+    return struct.pack('>I', 1) + box_type + struct.pack('>Q', 16 + len(payload)) + payload
+
+
+def mvhd(created, version=0):
+    seconds = int((created - MP4_EPOCH).total_seconds())
+    if version == 1:
+        return box(b'mvhd', bytes([1, 0, 0, 0]) + struct.pack('>QQIQ', seconds, seconds, 1000, 0))
+    return box(b'mvhd', bytes(4) + struct.pack('>IIII', seconds, seconds, 1000, 0))
+
+
+def xyz(location):
+    text = location.encode()
+    return box(b'\xa9xyz', struct.pack('>HH', len(text), 0x15c7) + text)
+
+
+def quicktime_meta(items):
+    keys = b''.join(struct.pack('>I', 8 + len(key)) + b'mdta' + key.encode() for key in items)
+    ilst = b''.join(
+        box(struct.pack('>I', index), box(b'data', struct.pack('>II', 1, 0) + value.encode()))
+        for index, value in enumerate(items.values(), start=1)
+    )
+    return box(b'meta', box(b'hdlr', bytes(24)) + box(b'keys', bytes(4) + struct.pack('>I', len(items)) + keys) + box(b'ilst', ilst))
+
+
+def build_mp4(*moov_children, mdat=b'\x00' * 1024, large_mdat=False):
+    media = large_box(b'mdat', mdat) if large_mdat else box(b'mdat', mdat)
+    # 撮影直後の動画と同じく、moov をファイルの最後に置く
+    return box(b'ftyp', b'qt  \x00\x00\x00\x00qt  ') + media + box(b'moov', b''.join(moov_children))
+
+
+def extract(data):
+    return extract_metadata(io.BytesIO(data))
+
+
+class ExifTests(SimpleTestCase):
+
+    def test_gps_in_both_byte_orders(self):
+        for endian in ('<', '>'):
+            with self.subTest(endian=endian):
+                result = extract(build_jpeg(build_tiff(endian, gps=gps_entries('N', 'E'))))
+                self.assertAlmostEqual(result['latitude'], 35 + 39 / 60 + 31.2 / 3600)
+                self.assertAlmostEqual(result['longitude'], 139 + 44 / 60 + 43.44 / 3600)
+
+    def test_southern_and_western_hemispheres_are_negative(self):
+        result = extract(build_jpeg(build_tiff('>', gps=gps_entries('S', 'W'))))
+        self.assertAlmostEqual(result['latitude'], -35.6586667, places=6)
+        self.assertAlmostEqual(result['longitude'], -139.7454, places=6)
+
+    def test_date_time_original_with_offset(self):
+        tiff = build_tiff('<', exif=[(0x9003, 2, '2023:08:15 19:30:00'), (0x9011, 2, '+09:00')])
+        self.assertEqual(parse_exif(tiff)['captured_at'], datetime(2023, 8, 15, 19, 30, tzinfo=JST))
+
+    def test_timezone_offset_formats(self):
+        cases = {
+            '+09:00': dt_timezone(timedelta(hours=9)),
+            '-0530': dt_timezone(-timedelta(hours=5, minutes=30)),
+            ' +0100 ': dt_timezone(timedelta(hours=1)),
+        }
+        for offset, tz in cases.items():
+            with self.subTest(offset=offset):
+                tiff = build_tiff('>', exif=[(0x9003, 2, '2023:08:15 19:30:00'), (0x9011, 2, offset)])
+                self.assertEqual(parse_exif(tiff)['captured_at'].utcoffset(), tz.utcoffset(None))
+
+    @override_settings(TIME_ZONE='Asia/Tokyo')
+    def test_missing_or_invalid_offset_uses_app_timezone(self):
+        for exif in ([(0x9003, 2, '2023:08:15 19:30:00')], [(0x9003, 2, '2023:08:15 19:30:00'), (0x9011, 2, 'JST')]):
+            with self.subTest(exif=exif):
+                captured_at = parse_exif(build_tiff('<', exif=exif))['captured_at']
+                self.assertEqual(captured_at, datetime(2023, 8, 15, 19, 30, tzinfo=JST))
+
+    def test_falls_back_to_ifd0_datetime(self):
+        tiff = build_tiff('<', ifd0=[(0x0132, 2, '2020:01:02 03:04:05')])
+        self.assertEqual(parse_exif(tiff)['captured_at'].replace(tzinfo=None), datetime(2020, 1, 2, 3, 4, 5))
+
+    def test_zero_coordinates_are_ignored(self):
+        gps = [(1, 2, 'N'), (2, 5, [(0, 1), (0, 1), (0, 1)]), (3, 2, 'E'), (4, 5, [(0, 1), (0, 1), (0, 1)])]
+        self.assertEqual(extract(build_jpeg(build_tiff('<', gps=gps))), {})
+
+
+class QuickTimeTests(SimpleTestCase):
+
+    def test_udta_xyz_location_and_mvhd_time(self):
+        created = datetime(2023, 8, 15, 10, 30, tzinfo=dt_timezone.utc)
+        result = extract(build_mp4(mvhd(created), box(b'udta', xyz('+35.6586+139.7454+010.000/'))))
+        self.assertEqual(result, {'latitude': 35.6586, 'longitude': 139.7454, 'captured_at': created})
+
+    def test_negative_iso6709_coordinates(self):
+        result = extract(build_mp4(box(b'udta', xyz('-33.8688-151.2093/'))))
+        self.assertEqual((result['latitude'], result['longitude']), (-33.8688, -151.2093))
+
+    def test_mvhd_version_1_times(self):
+        created = datetime(2040, 2, 29, 12, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(extract(build_mp4(mvhd(created, version=1)))['captured_at'], created)
+
+    def test_meta_keys_location_and_creation_date(self):
+        meta = quicktime_meta({
+            'com.apple.quicktime.make': 'Apple',
+            'com.apple.quicktime.location.ISO6709': '+35.0116+135.7681+044.000/',
+            'com.apple.quicktime.creationdate': '2023-08-15T19:30:00+09:00',
+        })
+        created = datetime(2023, 8, 15, 10, 30, tzinfo=dt_timezone.utc)
+        result = extract(build_mp4(mvhd(created - timedelta(days=1)), meta))
+        self.assertEqual((result['latitude'], result['longitude']), (35.0116, 135.7681))
+        # creationdate（撮影時の時差付き）が mvhd の時刻より優先される
+        self.assertEqual(result['captured_at'], datetime(2023, 8, 15, 19, 30, tzinfo=JST))
+
+    def test_64_bit_box_sizes(self):
+        created = datetime(2023, 8, 15, 10, 30, tzinfo=dt_timezone.utc)
+        data = build_mp4(mvhd(created), large_box(b'udta', xyz('+35.6586+139.7454/')), large_mdat=True)
+        result = extract(data)
+        self.assertEqual((result['latitude'], result['captured_at']), (35.6586, created))
+
+    @override_settings(METADATA_MAX_MOOV_BYTES=64)
+    def test_oversized_moov_is_skipped(self):
+        self.assertEqual(extract(build_mp4(box(b'udta', xyz('+35.6586+139.7454/')), box(b'free', bytes(100)))), {})
+
+
+class XmpTests(SimpleTestCase):
+
+    def test_attribute_packet(self):
+        packet = (
+            b'<?xpacket begin="\xef\xbb\xbf" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+            b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description'
+            b' exif:GPSLatitude="35,39.52N" exif:GPSLongitude="139,44.724W"'
+            b' exif:DateTimeOriginal="2023-08-15T19:30:00+09:00"/>'
+            b'</rdf:RDF></x:xmpmeta><?xpacket end="w"?>'
+        )
+        result = extract(b'\x89PNG\r\n\x1a\n' + bytes(32) + packet)
+        self.assertAlmostEqual(result['latitude'], 35 + 39.52 / 60)
+        self.assertAlmostEqual(result['longitude'], -(139 + 44.724 / 60))
+        self.assertEqual(result['captured_at'], datetime(2023, 8, 15, 19, 30, tzinfo=JST))
+
+    def test_element_packet(self):
+        packet = (
+            b'<x:xmpmeta><exif:GPSLatitude>33,52,7.68S</exif:GPSLatitude>'
+            b'<exif:GPSLongitude>151.2093</exif:GPSLongitude>'
+            b'<xmp:CreateDate>2023-08-15T19:30:00</xmp:CreateDate></x:xmpmeta>'
+        )
+        result = extract(packet)
+        self.assertAlmostEqual(result['latitude'], -(33 + 52 / 60 + 7.68 / 3600))
+        self.assertEqual(result['longitude'], 151.2093)
+        self.assertIn('captured_at', result)
+
+    def test_exif_wins_over_xmp(self):
+        packet = b'<x:xmpmeta exif:GPSLatitude="1.5N" exif:GPSLongitude="2.5E"></x:xmpmeta>'
+        result = extract(build_jpeg(build_tiff('<', gps=gps_entries('N', 'E'))) + packet)
+        self.assertAlmostEqual(result['latitude'], 35.6586667, places=6)
+
+
+class BrokenInputTests(SimpleTestCase):
+    """
+    壊れた・途中で切れたファイルでも、例外を出さず、止まらずに結果を返す
+    """
+
+    def setUp(self):
+        # 読み取れなかったメタデータの警告は出て当然なので、テストの出力には出さない
+        patcher = mock.patch('archive_app.metadata.logger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fixtures(self):
+        created = datetime(2023, 8, 15, 10, 30, tzinfo=dt_timezone.utc)
+        return [
+            build_jpeg(build_tiff('<', exif=[(0x9003, 2, '2023:08:15 19:30:00')], gps=gps_entries('N', 'E'))),
+            build_jpeg(build_tiff('>', gps=gps_entries('S', 'W'))),
+            build_mp4(mvhd(created), box(b'udta', xyz('+35.6586+139.7454/')), quicktime_meta({'a': 'b'})),
+            build_mp4(mvhd(created, version=1), large_box(b'udta', xyz('+35+139/')), large_mdat=True),
+        ]
+
+    def test_truncated_files(self):
+        for data in self._fixtures():
+            for length in range(len(data)):
+                self.assertIsInstance(extract(data[:length]), dict)
+            self.assertEqual(extract(data[:8]), {})
+
+    def test_random_garbage(self):
+        rng = random.Random(1234)
+        headers = [b'', b'\xff\xd8\xff\xe1\x00\x10Exif\x00\x00II*\x00', b'\x00\x00\x00\x18ftyp', b'<x:xmpmeta']
+        for _ in range(300):
+            data = rng.choice(headers) + rng.randbytes(rng.randint(0, 512))
+            self.assertEqual(extract(data), {})
+
+    def test_corrupted_fixtures(self):
+        rng = random.Random(5678)
+        for data in self._fixtures():
+            for _ in range(200):
+                corrupted = bytearray(data)
+                for _ in range(rng.randint(1, 8)):
+                    corrupted[rng.randrange(len(corrupted))] = rng.randrange(256)
+                self.assertIsInstance(extract(bytes(corrupted)), dict)
+
+    def test_bogus_sizes_do_not_hang(self):
+        cases = [
+            # 中身より大きい・0 の大きさの box
+            box(b'ftyp', b'qt  ') + struct.pack('>I4s', 0xFFFFFFFF, b'moov'),
+            box(b'ftyp', b'qt  ') + struct.pack('>I4s', 0, b'moov') + bytes(16),
+            box(b'ftyp', b'qt  ') + struct.pack('>I4sQ', 1, b'mdat', 2 ** 63) + bytes(16),
+            # 大きな件数で、大きさ 0 の key が続く keys
+            build_mp4(box(b'meta', box(b'hdlr', bytes(24)) + box(b'keys', bytes(4) + struct.pack('>I', 2 ** 31) + bytes(16)))),
+            # IFD の位置がデータの外
+            build_jpeg(b'II*\x00' + struct.pack('<I', 2 ** 31)),
+            build_jpeg(b'MM\x00*' + struct.pack('>IH', 8, 0xFFFF)),
+        ]
+        for data in cases:
+            with self.subTest(data=data[:24]):
+                self.assertIsInstance(extract(data), dict)
+
@@ -0,0 +1,128 @@
+import asyncio
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import metrics
+from .metrics import counter, histogram, render_prometheus, trace
+from .middleware import REQUEST_DB_QUERIES, REQUEST_LATENCY
+from .testing import make_archive
+
+
+class PrometheusFormatTests(SimpleTestCase):
+
+    def setUp(self):
+        # テストで作ったメトリクスが /metrics に残らないよう、登録先を空にしておく
+        patcher = mock.patch.dict(metrics.REGISTRY, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_counter(self):
+        requests = counter('test_requests_total', 'リクエスト数', ('view',))
+        requests.inc(view='a')
+        requests.inc(2, view='a')
+        requests.inc(view='b')
+        self.assertIs(counter('test_requests_total', '別の説明', ('view',)), requests)
+        self.assertEqual(render_prometheus(), (
+            '# HELP test_requests_total リクエスト数\n'
+            '# TYPE test_requests_total counter\n'
+            'test_requests_total{view="a"} 3\n'
+            'test_requests_total{view="b"} 1\n'
+        ))
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = histogram('test_seconds', '処理時間', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            latency.observe(value)
+        self.assertEqual(render_prometheus().splitlines()[2:], [
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1.0"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            'test_seconds_sum 4.05',
+            'test_seconds_count 4',
+        ])
+
+    def test_label_values_and_help_are_escaped(self):
+        counter('test_total', '説明\\改行\nあり', ('path',)).inc(path='a"b\\c\nd')
+        self.assertEqual(render_prometheus().splitlines(), [
+            '# HELP test_total 説明\\\\改行\\nあり',
+            '# TYPE test_total counter',
+            'test_total{path="a\\"b\\\\c\\nd"} 1',
+        ])
+
+    def test_trace_records_outcome(self):
+        @trace('sync_op')
+        def succeed():
+            return 1
+
+        @trace('sync_op')
+        def fail():
+            raise ValueError
+
+        @trace('async_op')
+        async def succeed_async():
+            return 2
+
+        self.assertEqual(succeed(), 1)
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertEqual(asyncio.run(succeed_async()), 2)
+
+        samples = metrics.OPERATION_LATENCY.samples()
+        self.assertEqual(samples[('sync_op', 'ok')]['count'], 1)
+        self.assertEqual(samples[('sync_op', 'error')]['count'], 1)
+        self.assertEqual(samples[('async_op', 'ok')]['count'], 1)
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_archive()
+
+    def _count(self, histogram, key):
+        return histogram.samples().get(key, {'count': 0})['count']
+
+    def test_records_latency_and_queries_per_view(self):
+        latency_key = ('get_markers', 'GET', '200')
+        before = self._count(REQUEST_LATENCY, latency_key)
+        queries_before = REQUEST_DB_QUERIES.samples().get(('get_markers',), {'sum': 0})['sum']
+
+        self.assertEqual(self.client.get('/get_markers/').status_code, 200)
+
+        self.assertEqual(self._count(REQUEST_LATENCY, latency_key), before + 1)
+        self.assertGreater(REQUEST_DB_QUERIES.samples()[('get_markers',)]['sum'], queries_before)
+
+    def test_unresolved_urls_share_one_label(self):
+        before = self._count(REQUEST_LATENCY, ('unresolved', 'GET', '404'))
+        self.client.get('/no-such-page-1/')
+        self.client.get('/no-such-page-2/')
+        self.assertEqual(self._count(REQUEST_LATENCY, ('unresolved', 'GET', '404')), before + 2)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_is_logged_with_sql(self):
+        with self.assertLogs('archive_app.middleware', 'WARNING') as logs:
+            self.client.get('/get_markers/')
+        self.assertIn('遅いリクエスト: GET /get_markers/ (get_markers) 200', logs.output[0])
+        self.assertIn('SQL', logs.output[0])
+
+
+class MetricsEndpointTests(TestCase):
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_not_found_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_open_in_debug_without_token(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE archive_request_seconds histogram', response.content)
+
+    @override_settings(METRICS_TOKEN='secret', DEBUG=True)
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
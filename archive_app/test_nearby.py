@@ -0,0 +1,96 @@
+import json
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .geo import bounding_box, haversine, nearest, within_radius
+from .models import Archive
+from .testing import make_archive
+
+
+class NearbyTests(TestCase):
+
+    def setUp(self):
+        # 東京駅からの距離がおよそ 0・1km・5km・30km の地点
+        self.origin = make_archive(latitude=35.6812, longitude=139.7671)
+        self.one_km = make_archive(latitude=35.6902, longitude=139.7671)
+        self.five_km = make_archive(latitude=35.7262, longitude=139.7671)
+        self.thirty_km = make_archive(latitude=35.9510, longitude=139.7671)
+
+    def _results(self, **params):
+        response = self.client.get('/nearby/', {'lat': 35.6812, 'lon': 139.7671, **params})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results']
+
+    def test_k_nearest_sorted_by_distance(self):
+        results = self._results(k=3)
+        self.assertEqual([item['id'] for item in results], [self.origin.id, self.one_km.id, self.five_km.id])
+        distances = [item['distance'] for item in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[1], 1000, delta=20)
+
+    def test_radius_cuts_off_farther_items(self):
+        results = self._results(radius=6000)
+        self.assertEqual([item['id'] for item in results], [self.origin.id, self.one_km.id, self.five_km.id])
+        self.assertTrue(all(item['distance'] <= 6000 for item in results))
+
+    def test_radius_and_k_together(self):
+        results = self._results(radius=50000, k=2)
+        self.assertEqual([item['id'] for item in results], [self.origin.id, self.one_km.id])
+
+    def test_helpers_match_haversine(self):
+        items = nearest(Archive.objects.all(), 35.6812, 139.7671, 4)
+        for item in items:
+            self.assertAlmostEqual(item.distance, haversine(35.6812, 139.7671, item.latitude, item.longitude))
+        self.assertEqual(len(within_radius(Archive.objects.all(), 35.6812, 139.7671, 500, 10)), 1)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/nearby/', {'lat': 'x', 'lon': 1}).status_code, 400)
+        self.assertEqual(self.client.get('/nearby/', {'lat': 95, 'lon': 1}).status_code, 400)
+        self.assertEqual(self.client.get('/nearby/', {'lat': 35, 'lon': 139, 'radius': 10 ** 9}).status_code, 400)
+
+    @override_settings(NEARBY_INITIAL_RADIUS=2000)
+    def test_nearest_found_within_first_radius_uses_one_query(self):
+        with self.assertNumQueries(1):
+            items = nearest(Archive.objects.all(), 35.6812, 139.7671, 2)
+        self.assertEqual([item.id for item in items], [self.origin.id, self.one_km.id])
+
+    @override_settings(NEARBY_INITIAL_RADIUS=500, NEARBY_MAX_RADIUS=50000)
+    def test_nearest_widens_radius_until_k_found(self):
+        # 500m → 2km → 8km → 32km と広げる
+        with self.assertNumQueries(4):
+            items = nearest(Archive.objects.all(), 35.6812, 139.7671, 4)
+        self.assertEqual(items[-1].id, self.thirty_km.id)
+
+    @override_settings(NEARBY_INITIAL_RADIUS=1000, NEARBY_MAX_RADIUS=10000)
+    def test_nearest_returns_fewer_than_k_beyond_max_radius(self):
+        items = nearest(Archive.objects.all(), 35.6812, 139.7671, 4)
+        self.assertEqual([item.id for item in items], [self.origin.id, self.one_km.id, self.five_km.id])
+
+    @override_settings(NEARBY_MAX_CANDIDATES=2)
+    def test_candidates_are_capped_nearest_first(self):
+        items = within_radius(Archive.objects.all(), 35.6812, 139.7671, 50000, 2)
+        self.assertEqual([item.id for item in items], [self.origin.id, self.one_km.id])
+
+    def test_radius_across_antimeridian(self):
+        east = make_archive(latitude=-17.8, longitude=179.99)
+        west = make_archive(latitude=-17.8, longitude=-179.99)
+        make_archive(latitude=-17.8, longitude=178.0)
+        items = within_radius(Archive.objects.all(), -17.8, 179.999, 5000, 10)
+        self.assertEqual({item.id for item in items}, {east.id, west.id})
+
+
+class BoundingBoxTests(SimpleTestCase):
+
+    def test_box_contains_the_circle(self):
+        south, west, north, east = bounding_box(35.0, 139.0, 10000)
+        for bearing_point in ((35.0899, 139.0), (34.9101, 139.0), (35.0, 139.1097), (35.0, 138.8903)):
+            self.assertLessEqual(haversine(35.0, 139.0, *bearing_point), 10000)
+            self.assertTrue(south <= bearing_point[0] <= north and west <= bearing_point[1] <= east)
+
+    def test_wraps_across_antimeridian(self):
+        south, west, north, east = bounding_box(0.0, 179.95, 10000)
+        self.assertGreater(west, east)
+        self.assertAlmostEqual(east, -179.96, places=2)
+
+    def test_covers_all_longitudes_near_poles(self):
+        self.assertEqual(bounding_box(89.95, 10.0, 20000)[1::2], (-180.0, 180.0))
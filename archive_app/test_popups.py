@@ -0,0 +1,84 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .testing import make_archive
+
+
+@override_settings(POPUP_CACHE_MAX_AGE=120)
+class MarkerPopupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.item = make_archive(
+            description='<script>alert(1)</script>',
+            file_path='https://example.com/storage/v1/object/public/archive/写真 1.jpg',
+        )
+
+    def test_renders_escaped_popup(self):
+        response = self.client.get(reverse('marker_detail', args=[self.item.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '東京都千代田区')
+        self.assertContains(response, '&lt;script&gt;alert(1)&lt;/script&gt;')
+        self.assertNotContains(response, '<script>')
+
+    def test_links_to_file_list(self):
+        response = self.client.get(reverse('marker_detail', args=[self.item.pk]))
+        expected = f'{reverse("file_list")}?from={self.item.pk}#file-%E5%86%99%E7%9C%9F%201.jpg'
+        self.assertContains(response, f'href="{expected}"')
+
+    def test_cached_by_browser_and_revalidated(self):
+        url = reverse('marker_detail', args=[self.item.pk])
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'max-age=120')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        # データが変わったら ETag も変わる
+        make_archive()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_missing_marker(self):
+        self.assertEqual(self.client.get(reverse('marker_detail', args=[self.item.pk + 1])).status_code, 404)
+
+
+@override_settings(POPUP_CACHE_MAX_AGE=120, LOCATION_POPUP_TOLERANCE=1e-5)
+class LocationPopupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.first = make_archive(file_type='image', description='一枚目', latitude=35.6812345, longitude=139.7671234)
+        self.second = make_archive(
+            file_type='audio', description='録音', latitude=35.6812345, longitude=139.7671234,
+            file_path='https://example.com/storage/v1/object/public/archive/b.mp3',
+        )
+        self.elsewhere = make_archive(description='大阪の写真', latitude=34.70, longitude=135.50)
+
+    def _url(self, lat, lon):
+        return reverse('location_detail', kwargs={'lat': lat, 'lon': lon})
+
+    def test_lists_every_item_at_the_location(self):
+        response = self.client.get(self._url('35.6812345', '139.7671234'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '一枚目')
+        self.assertContains(response, '録音')
+        self.assertContains(response, '<audio controls')
+        self.assertNotContains(response, '大阪の写真')
+        self.assertContains(response, f'{reverse("file_list")}?from={self.second.pk}#file-b.mp3')
+        self.assertEqual(response['Cache-Control'], 'max-age=120')
+
+    def test_rounded_coordinates_match(self):
+        # 地図のピンの座標は丸められていることがある
+        response = self.client.get(self._url('35.681236', '139.767123'))
+        self.assertContains(response, '一枚目')
+
+    def test_negative_coordinates(self):
+        make_archive(description='シドニー', latitude=-33.8688, longitude=-151.2093)
+        self.assertContains(self.client.get(self._url('-33.8688', '-151.2093')), 'シドニー')
+
+    def test_empty_location(self):
+        self.assertEqual(self.client.get(self._url('10', '10')).status_code, 404)
+
+    def test_not_modified(self):
+        url = self._url('35.6812345', '139.7671234')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
@@ -0,0 +1,50 @@
+import json
+
+from django.test import TestCase
+
+from .search import build_search_text
+from .testing import make_archive
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.shrine = make_archive(description='夏祭りの夜店', address='京都府京都市東山区', latitude=35.0, longitude=135.78)
+        self.fireworks = make_archive(description='花火大会の夜景', address='東京都墨田区')
+        self.english = make_archive(description='Tokyo Tower at night', address='東京都港区')
+
+    def _ids(self, query, **params):
+        response = self.client.get('/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in json.loads(response.content)['results']]
+
+    def test_build_search_text_splits_japanese_into_bigrams(self):
+        self.assertEqual(build_search_text('東京都 港区'), '東京 京都 都 港区 区')
+        self.assertEqual(build_search_text('Tokyo タワー'), 'tokyo タワ ワー ー')
+
+    def test_finds_japanese_words_inside_sentences(self):
+        self.assertEqual(self._ids('夜景'), [self.fireworks.id])
+        # 「東京都」にも「京都」という並びがある
+        self.assertCountEqual(self._ids('京都'), [self.shrine.id, self.fireworks.id, self.english.id])
+        self.assertEqual(self._ids('京都市'), [self.shrine.id])
+
+    def test_bigrams_must_be_adjacent(self):
+        # 「夜」と「景」はどちらもあるが、「夜店」の説明文には「夜景」という並びはない
+        self.assertNotIn(self.shrine.id, self._ids('夜景'))
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self._ids('東京 花火'), [self.fireworks.id])
+        self.assertEqual(self._ids('東京 祭り'), [])
+
+    def test_english_words_match_by_prefix(self):
+        self.assertEqual(self._ids('tow'), [self.english.id])
+
+    def test_updated_text_is_searchable(self):
+        self.shrine.description = '紅葉の名所'
+        self.shrine.save()
+        self.assertEqual(self._ids('紅葉'), [self.shrine.id])
+        self.assertEqual(self._ids('夜店'), [])
+
+    def test_bbox_and_empty_query(self):
+        self.assertEqual(self._ids('京都', bbox='135,34,136,36'), [self.shrine.id])
+        self.assertEqual(self.client.get('/search/', {'q': ' '}).status_code, 400)
@@ -0,0 +1,190 @@
+import io
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.cache import cache
+from django.core.files import File
+from django.test import SimpleTestCase, override_settings
+
+from .storage import SupabaseStorage
+
+
+class FakeStorageHandler(BaseHTTPRequestHandler):
+    """
+    Supabase Storage の REST API（1回でのアップロード・TUSの再開可能なアップロード）の一部を真似たサーバー
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _respond(self, status, headers=None, body=b''):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = urllib.parse.urlparse(self.path).path
+        self.state['requests'].append(('POST', path))
+        if path == '/storage/v1/upload/resumable':
+            # 再開可能なアップロードを作成する
+            upload_id = str(len(self.state['uploads']) + 1)
+            self.state['uploads'][upload_id] = {'length': int(self.headers['Upload-Length']), 'data': bytearray()}
+            self._respond(201, {'Location': f'/storage/v1/upload/resumable/{upload_id}'})
+            return
+        prefix = '/storage/v1/object/'
+        name = urllib.parse.unquote(path[len(prefix):])
+        self.state['objects'][name] = self._read_body()
+        self._respond(200, body=b'{}')
+
+    def do_HEAD(self):
+        upload_id = self.path.rsplit('/', 1)[-1]
+        self.state['requests'].append(('HEAD', self.path))
+        upload = self.state['uploads'].get(upload_id)
+        if upload is None:
+            self._respond(404)
+            return
+        self._respond(200, {'Upload-Offset': str(len(upload['data'])), 'Upload-Length': str(upload['length'])})
+
+    def do_PATCH(self):
+        upload_id = self.path.rsplit('/', 1)[-1]
+        offset = int(self.headers['Upload-Offset'])
+        self.state['requests'].append(('PATCH', offset))
+        upload = self.state['uploads'][upload_id]
+        length = int(self.headers['Content-Length'])
+        self.state['patches'] += 1
+        if self.state['patches'] in self.state['interrupt_patches']:
+            # 半分だけ受け取ったところで通信が切れたことにする
+            upload['data'] += self.rfile.read(length // 2)
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        assert offset == len(upload['data'])
+        upload['data'] += self.rfile.read(length)
+        if len(upload['data']) == upload['length']:
+            self.state['objects'][self.state['object_name']] = bytes(upload['data'])
+        self._respond(204, {'Upload-Offset': str(len(upload['data']))})
+
+
+class RecordingBytesIO(io.BytesIO):
+    """
+    read() に渡されたサイズを記録する（ファイル全体を一度に読み込んでいないかを確かめるため）
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_sizes = []
+
+    def read(self, size=-1):
+        self.read_sizes.append(size)
+        return super().read(size)
+
+
+@override_settings(
+    STORAGE_RESUMABLE_THRESHOLD=1024,
+    STORAGE_UPLOAD_CHUNK_SIZE=256,
+    HTTP_RETRY_BACKOFF=0,
+)
+class SupabaseStorageUploadTests(SimpleTestCase):
+    """
+    SupabaseStorage のアップロードを、ローカルの偽のストレージサーバーに対して確かめる
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStorageHandler)
+        self.server.state = {
+            'objects': {}, 'uploads': {}, 'requests': [], 'patches': 0,
+            'interrupt_patches': set(), 'object_name': 'big.bin',
+        }
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.storage = SupabaseStorage(
+            bucket='test-bucket', url=f'http://127.0.0.1:{self.server.server_port}', key='test-key',
+        )
+        self.state = self.server.state
+
+    def _file(self, data, name):
+        return File(RecordingBytesIO(data), name=name)
+
+    def _resume_key(self, name):
+        return f"archive:resumable_upload:test-bucket:{name}"
+
+    @override_settings(STORAGE_RESUMABLE_THRESHOLD=1024 * 1024)
+    def test_small_file_is_streamed_without_reading_it_into_memory(self):
+        data = bytes(range(256)) * 256
+        content = self._file(data, 'small.bin')
+        self.storage.save('small.bin', content)
+
+        self.assertEqual(self.state['objects']['test-bucket/small.bin'], data)
+        # 全体を読む read() / read(-1) は呼ばれず、少しずつ読まれている
+        self.assertGreater(len(content.file.read_sizes), 1)
+        self.assertTrue(all(size is not None and 0 < size < len(data) for size in content.file.read_sizes))
+
+    def test_large_file_is_sent_in_chunks(self):
+        data = bytes(range(256)) * 10
+        content = self._file(data, 'big.bin')
+        self.storage.save('big.bin', content)
+
+        self.assertEqual(self.state['objects']['big.bin'], data)
+        self.assertTrue(all(0 < size <= 256 for size in content.file.read_sizes))
+        self.assertEqual([offset for method, offset in self.state['requests'] if method == 'PATCH'],
+                         list(range(0, len(data), 256)))
+        # 完了したら再開用のURLは消す
+        self.assertIsNone(cache.get(self._resume_key('big.bin')))
+
+    def test_interrupted_patch_is_resumed_from_server_offset(self):
+        data = bytes(range(256)) * 10
+        self.state['interrupt_patches'] = {3}
+        self.storage.save('big.bin', self._file(data, 'big.bin'))
+
+        self.assertEqual(self.state['objects']['big.bin'], data)
+        patches = [offset for method, offset in self.state['requests'] if method == 'PATCH']
+        # 3回目（512バイト目から）が半分で切れたので、768バイト目ではなく640バイト目から送り直す
+        self.assertEqual(patches[:4], [0, 256, 512, 640])
+        self.assertIsNone(cache.get(self._resume_key('big.bin')))
+
+    @override_settings(STORAGE_UPLOAD_MAX_RETRIES=0)
+    def test_next_upload_resumes_from_cached_upload_url(self):
+        data = bytes(range(256)) * 10
+        self.state['interrupt_patches'] = {2}
+        with self.assertRaises(requests.RequestException):
+            self.storage.save('big.bin', self._file(data, 'big.bin'))
+        upload_url = cache.get(self._resume_key('big.bin'))
+        self.assertTrue(upload_url.endswith('/storage/v1/upload/resumable/1'))
+        self.assertNotIn('big.bin', self.state['objects'])
+
+        self.state['requests'].clear()
+        self.storage.save('big.bin', self._file(data, 'big.bin'))
+
+        self.assertEqual(self.state['objects']['big.bin'], data)
+        # 新しいアップロードは作らず、受け取り済みの位置（256 + 128バイト）から続きを送る
+        self.assertNotIn(('POST', '/storage/v1/upload/resumable'), self.state['requests'])
+        self.assertEqual(self.state['requests'][0][0], 'HEAD')
+        self.assertEqual(self.state['requests'][1], ('PATCH', 384))
+        self.assertEqual(len(self.state['uploads']), 1)
+        self.assertIsNone(cache.get(self._resume_key('big.bin')))
@@ -0,0 +1,19 @@
+# archive_app/testing.py
+
+from .models import Archive
+
+
+def make_archive(**fields):
+    """
+    テスト用のArchiveを保存して返す（指定しない項目は適当な値にする）
+    """
+    values = {
+        'file_type': 'image',
+        'file_path': 'https://example.com/storage/v1/object/public/archive/a.jpg',
+        'description': '',
+        'address': '東京都千代田区',
+        'latitude': 35.68,
+        'longitude': 139.76,
+    }
+    values.update(fields)
+    return Archive.objects.create(**values)
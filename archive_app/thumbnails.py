@@ -0,0 +1,60 @@
+# archive_app/thumbnails.py
+
+import io
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .storage import get_archive_storage
+
+logger = logging.getLogger(__name__)
+
+
+def _output_format():
+    """
+    縮小画像の形式（WebPが使えなければJPEG）と拡張子を返す
+    """
+    from PIL import features
+
+    if settings.THUMBNAIL_FORMAT == 'WEBP' and features.check('webp'):
+        return 'WEBP', '.webp'
+    return 'JPEG', '.jpg'
+
+
+def generate_derivatives(source_file, storage_file_name):
+    """
+    画像から縮小画像（サムネイル・中サイズ）を作り、元のファイルと同じ場所に保存する
+    {'thumbnail_url': ..., 'medium_url': ...} を返す（作れなかった場合は空の辞書）
+    """
+    # Pillowは画像をアップロードしたときに初めて読み込む（起動を速くするため）
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # Pillowが無い環境では縮小画像を作らない
+        return {}
+
+    image_format, extension = _output_format()
+    stem = Path(storage_file_name).stem
+    storage = get_archive_storage()
+    urls = {}
+    try:
+        source_file.seek(0)
+        with Image.open(source_file) as original:
+            # JPEGは縮小しながら読み込むと、大きな写真でもメモリと時間を節約できる
+            largest = max(settings.THUMBNAIL_SIZES.values())
+            original.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(original).convert('RGB')
+
+        # 大きいサイズから順に縮小していく
+        for field, size in sorted(settings.THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=settings.THUMBNAIL_QUALITY)
+            suffix = field.replace('_url', '')
+            name = storage.save(f"{stem}_{suffix}{extension}", ContentFile(buffer.getvalue()))
+            urls[field] = storage.url(name)
+    except Exception as e:
+        logger.warning("縮小画像を作成できませんでした (%s): %s", storage_file_name, e)
+        return {}
+    return urls
@@ -0,0 +1,37 @@
+# archive_app/uploadhandlers.py
+
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class ContentHashMixin:
+    """
+    ファイルを受信しながら SHA-256 を計算し、アップロードされたファイルの content_hash に設定する
+    （受信後にファイルを読み直さずに済む）
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.content_hash = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.content_hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.content_hash = self.content_hash.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    """
+    小さいファイルをメモリに受信しながらハッシュを計算する
+    """
+
+
+class HashingTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    """
+    大きいファイルを一時ファイルに受信しながらハッシュを計算する
+    """
@@ -1,53 +1,110 @@
 # map_app/utils.py などに作成
-import requests
+import logging
 import urllib.parse
 
-def geocode_address(address):
+from . import geocache, http_client
+from .metrics import trace
+from .models import GeocodeCache
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch_geocode(address):
+    """
+    地理院APIに問い合わせて、住所を (緯度, 経度) に変換する。見つからなければ None
+    """
+    url = "https://msearch.gsi.go.jp/address-search/AddressSearch?q=" + address
+    response = http_client.get(url, call_site='geocode_address')
+    response.raise_for_status()
+    data = response.json()
+
+    if data and len(data) > 0:
+        # 最初の結果を使用
+        coordinates = data[0]['geometry']['coordinates']
+        # 地理院APIは[経度, 緯度]の順で返すので、順序を入れ替える
+        return coordinates[1], coordinates[0]  # 緯度, 経度
+    return None
+
+
+def _fetch_reverse_geocode(lat, lon):
+    """
+    地理院APIに問い合わせて、緯度・経度を住所に変換する。見つからなければ None
+    """
+    url = f"https://mreverse.gsi.go.jp/reverse-geocode/cgi-bin/reversegeocode.cgi?lat={lat}&lon={lon}&zoom=18&format=json"
+    response = http_client.get(url, call_site='reverse_geocode')
+    response.raise_for_status()
+    data = response.json()
+
+    if data and 'results' in data and len(data['results']) > 0:
+        result = data['results'][0]
+        # 住所を組み立て
+        address_parts = []
+        if 'municipality' in result:
+            address_parts.append(result['municipality'])
+        if 'localAddress' in result:
+            address_parts.append(result['localAddress'])
+        if address_parts:
+            return ' '.join(address_parts)
+    return None
+
+
+@trace('geocode_address')
+def geocode_address(address, refresh=False):
     """
     住所を緯度・経度に変換する（ジオコーディング）
+    結果はキャッシュされ、同じ住所なら地理院APIに問い合わせない
     """
     try:
-        # 地理院APIを使用
-        url = "https://msearch.gsi.go.jp/address-search/AddressSearch?q=" + address
-        response = requests.get(url)
-        data = response.json()
-        
-        if data and len(data) > 0:
-            # 最初の結果を使用
-            coordinates = data[0]['geometry']['coordinates']
-            # 地理院APIは[経度, 緯度]の順で返すので、順序を入れ替える
-            return coordinates[1], coordinates[0]  # 緯度, 経度
-        else:
+        key = geocache.normalize_address(address)
+        result = geocache.lookup(
+            GeocodeCache.KIND_FORWARD, key, lambda: _fetch_geocode(address), refresh=refresh,
+        )
+        if result is None:
             return None, None
+        return result  # 緯度, 経度
     except Exception as e:
-        print(f"ジオコーディングエラー: {e}")
+        logger.warning("ジオコーディングエラー: %s", e)
         return None, None
 
-def reverse_geocode(lat, lon):
+
+@trace('reverse_geocode')
+def reverse_geocode(lat, lon, refresh=False):
     """
     緯度・経度を住所に変換する（逆ジオコーディング）
+    座標を丸めた値でキャッシュし、ほぼ同じ場所なら地理院APIに問い合わせない
     """
     try:
-        # 地理院APIを使用して逆ジオコーディング
-        url = f"https://mreverse.gsi.go.jp/reverse-geocode/cgi-bin/reversegeocode.cgi?lat={lat}&lon={lon}&zoom=18&format=json"
-        response = requests.get(url)
-        data = response.json()
-        
-        if data and 'results' in data and len(data['results']) > 0:
-            result = data['results'][0]
-            # 住所を組み立て
-            address_parts = []
-            if 'municipality' in result:
-                address_parts.append(result['municipality'])
-            if 'localAddress' in result:
-                address_parts.append(result['localAddress'])
-            
-            if address_parts:
-                return ' '.join(address_parts)
-            else:
-                return f"緯度: {lat}, 経度: {lon}"
-        else:
-            return f"緯度: {lat}, 経度: {lon}"
+        key = geocache.coordinate_key(lat, lon)
+        rounded_lat, rounded_lon = key.split(',')
+        address = geocache.lookup(
+            GeocodeCache.KIND_REVERSE, key,
+            lambda: _fetch_reverse_geocode(rounded_lat, rounded_lon), refresh=refresh,
+        )
+        if address:
+            return address
+        return f"緯度: {lat}, 経度: {lon}"
     except Exception as e:
-        print(f"逆ジオコーディングエラー: {e}")
-        return f"緯度: {lat}, 経度: {lon}"
\ No newline at end of file
+        logger.warning("逆ジオコーディングエラー: %s", e)
+        return f"緯度: {lat}, 経度: {lon}"
+
+
+def parse_bbox(value):
+    """
+    "西経,南緯,東経,北緯" 形式の文字列（Leafletの toBBoxString() と同じ順序）を
+    (south, west, north, east) のタプルに変換する
+    """
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        raise ValueError(f"bboxの形式が正しくありません: {value}")
+    if not (-90 <= south <= 90 and -90 <= north <= 90) or south > north:
+        raise ValueError(f"bboxの緯度が正しくありません: {value}")
+    # 経度は地図を何周もスクロールした場合に範囲外になるので -180〜180 に正規化する
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = (west + 180) % 360 - 180
+        east = (east + 180) % 360 - 180
+    return south, west, north, east
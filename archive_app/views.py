@@ -1,20 +1,54 @@
 # archive_app/views.py
 
 # --- DjangoとPythonの基本ライブラリ ---
+import hmac
 import os
-import requests
+import re
 import urllib.parse
 from datetime import datetime
-from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
 from pathlib import Path
 import uuid
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Count, Max
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import condition
 
 # --- このアプリケーションで作成したもの ---
 from .forms import UploadForm
-from .models import Archive  # データベースと連携するためのモデル
-from .services import upload_file_to_supabase_storage # Supabaseアップロード用関数
-from .utils import geocode_address, reverse_geocode # ジオコーディング用関数
+from . import http_client  # 外部サービスへの通信用
+from .media_cache import MEDIA_CACHE_BYTES_SAVED, MEDIA_CACHE_REQUESTS, get_media_cache
+from .metrics import render_prometheus, trace
+from .jobs import enqueue_upload  # バックグラウンド処理用のジョブ登録
+from .models import Archive, UploadJob  # データベースと連携するためのモデル
+from .services import create_archive_from_upload # アップロード・保存用関数
+from .services import create_archive_from_existing, find_stored_copy
+from .services import filter_by_bbox, serialize_marker, aggregate_clusters, cluster_cell_size
+from .services import decode_cursor, get_file_page, get_archive_stats
+from .services import MARKER_FORMATS, brotli_available, get_markers_payload
+from .services import MARKER_FILE_TYPES, get_location_popup_html
+from .caching import get_dataset_version
+from .geo import nearest, within_radius
+from .search import search_archives
+from .storage import get_archive_storage
+from .utils import parse_bbox
+
+# Accept-Encoding に gzip・br が含まれているか（GZipMiddleware と同じ判定）
+_ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+_ACCEPTS_BR_RE = re.compile(r'\bbr\b')
+
+# get_markers の形式ごとの Content-Type（Accept ヘッダーで形式を選ぶときにも使う）
+MARKER_CONTENT_TYPES = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.archive.markers.columnar+json',
+    'binary': 'application/vnd.archive.markers.binary',
+}
 
 
 def map_view(request):
@@ -25,42 +59,58 @@ def map_view(request):
     if request.method == 'POST':
         form = UploadForm(request.POST, request.FILES)
         if form.is_valid():
-            uploaded_file = request.FILES['file']
-            
-            # 1. ファイルをSupabase Storageにアップロードし、公開URLを取得
-            original_extension = Path(uploaded_file.name).suffix
-            storage_file_name = f"{uuid.uuid4()}{original_extension}"
-            public_url = upload_file_to_supabase_storage(uploaded_file, storage_file_name)
+            uploaded_file = request.FILES.get('file')
 
-            # 2. フォームから送信された緯度・経度・住所を取得
+            # 1. フォームから送信された緯度・経度・住所を取得
             lat = form.cleaned_data.get('latitude')
             lon = form.cleaned_data.get('longitude')
             address = form.cleaned_data.get('address', '')
 
-            # 3. 緯度・経度と住所を相互に補完
-            #    - 住所だけ入力されていれば、緯度・経度を検索
-            #    - 緯度・経度だけ入力されていれば、住所を検索
-            if not lat and not lon and address:
-                lat, lon = geocode_address(address)
-            elif lat and lon and not address:
-                address = reverse_geocode(lat, lon)
-            
-            # 4. 最終的な位置情報をもとに、データベースへ保存
-            if lat is not None and lon is not None:
-                # Archiveモデルのインスタンス（データ1行分）を作成
-                archive_data = Archive(
-                    file_path=public_url,
-                    file_type=form.cleaned_data['file_type'],
-                    description=form.cleaned_data.get('description', ''),
-                    address=address,
-                    latitude=lat,
-                    longitude=lon,
+            if uploaded_file is None:
+                # 2a. ファイル本体が送られなかった（事前確認で同じファイルがあると分かった）場合は、
+                #     Storageにあるファイルを使ってデータベースへ保存
+                existing = find_stored_copy(form.cleaned_data['content_hash'])
+                if existing is None:
+                    context = {
+                        'form': form,
+                        'error': 'ファイルが見つかりませんでした。もう一度ファイルを選択してください。',
+                        'cluster_max_zoom': settings.MARKER_CLUSTER_MAX_ZOOM,
+                        'marker_file_types': MARKER_FILE_TYPES,
+                    }
+                    return render(request, 'archive_app/index.html', context)
+                archive_data = create_archive_from_existing(
+                    existing, form.cleaned_data['file_type'],
+                    form.cleaned_data.get('description', ''), address, lat, lon,
                 )
-                # データベースに保存を実行
-                archive_data.save()
             else:
+                # Storage上のファイル名を決める（元の拡張子を残す）
+                original_extension = Path(uploaded_file.name).suffix
+                storage_file_name = f"{uuid.uuid4()}{original_extension}"
+
+                if settings.UPLOAD_USE_QUEUE:
+                    # 2b. ファイルをスプールに保存してジョブを登録し、すぐに応答する
+                    #     （アップロード・ジオコーディング・保存はワーカーが行う）
+                    job = enqueue_upload(
+                        uploaded_file, storage_file_name, form.cleaned_data['file_type'],
+                        form.cleaned_data.get('description', ''), address, lat, lon,
+                    )
+                    return redirect(f"{reverse('map_view')}?job={job.pk}")
+
+                # 2c. 位置情報を補完し、Supabase Storageにアップロードしてデータベースへ保存
+                #     （同じ中身のファイルがすでにあれば、アップロードせずに使い回す）
+                archive_data = create_archive_from_upload(
+                    uploaded_file, storage_file_name, form.cleaned_data['file_type'],
+                    form.cleaned_data.get('description', ''), address, lat, lon,
+                )
+
+            if archive_data is None:
                 # 住所から位置が特定できなかった場合のエラー表示
-                context = {'form': form, 'error': '位置情報が取得できませんでした。'}
+                context = {
+                    'form': form,
+                    'error': '位置情報が取得できませんでした。',
+                    'cluster_max_zoom': settings.MARKER_CLUSTER_MAX_ZOOM,
+                    'marker_file_types': MARKER_FILE_TYPES,
+                }
                 return render(request, 'archive_app/index.html', context)
 
             # 処理完了後、同じページにリダイレクトしてフォームの二重送信を防ぐ
@@ -70,75 +120,600 @@ def map_view(request):
     else:
         form = UploadForm()
 
-    context = {'form': form}
+    context = {
+        'form': form,
+        'cluster_max_zoom': settings.MARKER_CLUSTER_MAX_ZOOM,
+        'marker_file_types': MARKER_FILE_TYPES,
+        'job_id': request.GET.get('job', ''),
+    }
     return render(request, 'archive_app/index.html', context)
 
 
+def check_upload(request):
+    """
+    同じ中身のファイルがすでにアップロードされているかをJSON形式で返すAPIビュー
+    （ブラウザがファイル本体を送る前に、SHA-256 で確認するために使う）
+
+    クエリパラメータ:
+      sha256: ファイルの SHA-256（16進数の小文字64文字）
+    """
+    content_hash = request.GET.get('sha256', '').lower()
+    if not re.fullmatch(r'[0-9a-f]{64}', content_hash):
+        return JsonResponse({'error': 'sha256 を16進数64文字で指定してください'}, status=400)
+    return JsonResponse({'exists': find_stored_copy(content_hash) is not None})
+
+
+def job_status(request, job_id):
+    """
+    バックグラウンドで処理中のアップロードの状態をJSON形式で返すAPIビュー
+    """
+    job = UploadJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({'error': 'ジョブが見つかりません'}, status=404)
+    return JsonResponse({
+        'id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'attempts': job.attempts,
+        'error': job.last_error,
+        'archive_id': job.archive_id,
+    })
+
+
+def _archive_state(request):
+    """
+    Archiveテーブルの状態（最大ID・件数・最終登録日時）を取得する
+    ETagとLast-Modifiedの両方で使うので、1リクエストにつき1回だけ問い合わせる
+    """
+    if not hasattr(request, '_archive_state'):
+        request._archive_state = Archive.objects.aggregate(
+            max_id=Max('id'), count=Count('id'), last_created=Max('created_at'),
+        )
+    return request._archive_state
+
+
+def archive_etag(request, *args, **kwargs):
+    """
+    クラスタAPI用のETag（データが追加・削除されると変わる）
+    """
+    state = _archive_state(request)
+    return f"{state['max_id'] or 0}-{state['count']}"
+
+
+def archive_last_modified(request, *args, **kwargs):
+    """
+    クラスタAPI用のLast-Modified（最後に登録されたデータの日時）
+    """
+    return _archive_state(request)['last_created']
+
+
+def _markers_format(request):
+    """
+    応答の形式を format パラメータ（なければ Accept ヘッダー）から決める（不正な値なら ValueError）
+    """
+    fmt = request.GET.get('format')
+    if fmt:
+        if fmt not in MARKER_FORMATS:
+            raise ValueError(f"format は {', '.join(MARKER_FORMATS)} のいずれかを指定してください")
+        return fmt
+    accept = request.headers.get('Accept', '')
+    for fmt in ('binary', 'columnar'):
+        if MARKER_CONTENT_TYPES[fmt] in accept:
+            return fmt
+    return 'json'
+
+
+def _markers_encoding(request):
+    accept = request.headers.get('Accept-Encoding', '')
+    if _ACCEPTS_BR_RE.search(accept) and brotli_available():
+        return 'br'
+    if _ACCEPTS_GZIP_RE.search(accept):
+        return 'gzip'
+    return 'identity'
+
+
+def markers_etag(request, *args, **kwargs):
+    """
+    マーカーAPI用のETag（データセットのバージョン。1行だけのテーブルを読むので、Archiveは集計しない）
+    形式や圧縮の方法で中身が変わるので、ETagも分ける
+    """
+    if not hasattr(request, '_dataset_version'):
+        request._dataset_version = get_dataset_version()
+    try:
+        fmt = _markers_format(request)
+    except ValueError:
+        fmt = 'invalid'
+    return f"{request._dataset_version}-{fmt}-{_markers_encoding(request)}"
+
+
+def _markers_params(request):
+    """
+    get_markers のクエリパラメータ (bbox, since, 形式) を返す（不正な値なら ValueError）
+    """
+    return parse_bbox(request.GET.get('bbox')), int(request.GET.get('since', 0)), _markers_format(request)
+
+
+def _markers_response(request, payload, fmt):
+    encoding = _markers_encoding(request)
+    if encoding == 'br' and 'br' not in payload:
+        # brotli の無いプロセスが作ったキャッシュの場合
+        encoding = 'gzip'
+    # 圧縮済みのものをキャッシュしているので、リクエストごとに圧縮し直さない
+    body = payload['body'] if encoding == 'identity' else payload[encoding]
+    response = HttpResponse(body, content_type=MARKER_CONTENT_TYPES[fmt])
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    if fmt != 'json':
+        response['X-Marker-Count'] = str(payload['count'])
+    # 上限件数で打ち切った場合はヘッダーで知らせる
+    response['X-Markers-Truncated'] = 'true' if payload['truncated'] else 'false'
+    # 次回の since に指定するカーソル（今回返した中で最大のID）
+    response['X-Marker-Cursor'] = str(payload['cursor'])
+    # 前回から変わっていたら更新・削除があったので、since を付けずに読み込み直す
+    response['X-Marker-Edits'] = str(payload['edits'])
+    # ブラウザにキャッシュさせつつ、毎回 ETag で再検証させる
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@condition(etag_func=markers_etag)
 def get_markers(request):
     """
     地図に表示するマーカー情報をJSON形式で提供するAPIビュー
     （JavaScriptから非同期で呼び出される）
+
+    クエリパラメータ:
+      bbox: "西経,南緯,東経,北緯" 形式。指定された範囲内のデータだけを返す
+      since: 前回のレスポンスの X-Marker-Cursor。これより後に登録されたデータだけを返す
+      format: json（初期値）・columnar・binary（Accept ヘッダーでも指定できる。形式は services.MARKER_FORMATS）
+
+    応答はデータセットのバージョンごとにキャッシュされ、データに変更がなければ
+    If-None-Match に対して 304 を返す
+    """
+    try:
+        bbox, since, fmt = _markers_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return _markers_response(request, get_markers_payload(bbox, since, request._dataset_version, fmt), fmt)
+
+
+@condition(etag_func=markers_etag)
+async def _get_markers_async(request):
+    try:
+        bbox, since, fmt = _markers_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    payload = await sync_to_async(get_markers_payload)(bbox, since, request._dataset_version, fmt)
+    return _markers_response(request, payload, fmt)
+
+
+async def get_markers_async(request):
+    """
+    get_markers() の非同期版（ASYNC_VIEWS = True のときに使う）
+    condition の ETag の関数は同期で呼ばれるので、先にデータセットのバージョンを取得しておく
+    """
+    request._dataset_version = await sync_to_async(get_dataset_version)()
+    return await _get_markers_async(request)
+
+
+def dataset_etag(request, *args, **kwargs):
+    """
+    ポップアップ用のETag（データセットのバージョン）
+    """
+    return str(get_dataset_version())
+
+
+def _popup_response(html):
+    response = HttpResponse(html)
+    # 開き直したときはブラウザのキャッシュを使い、期限が切れたら ETag で再検証させる
+    patch_cache_control(response, max_age=settings.POPUP_CACHE_MAX_AGE)
+    return response
+
+
+@condition(etag_func=dataset_etag)
+def marker_detail(request, archive_id):
+    """
+    マーカー1件のポップアップのHTMLを返すビュー（ポップアップを開いたときに読み込まれる）
+    """
+    item = get_object_or_404(Archive, pk=archive_id)
+    return _popup_response(render_to_string('archive_app/marker_popup.html', {'item': item}))
+
+
+@condition(etag_func=dataset_etag)
+def location_detail(request, lat, lon):
+    """
+    同じ場所にある全アイテムのポップアップのHTMLを返すビュー（create_map_html の地図で使う）
+    """
+    html = get_location_popup_html(float(lat), float(lon))
+    if html is None:
+        raise Http404('この場所にはファイルがありません')
+    return _popup_response(html)
+
+
+def search(request):
+    """
+    説明文と住所を全文検索して、関連度の高い順にJSON形式で返すAPIビュー
+
+    クエリパラメータ:
+      q: 検索する文字列（空白区切りで複数指定するとすべてを含むものを返す）
+      bbox: "西経,南緯,東経,北緯" 形式。指定された範囲内のデータだけを検索する
+      page: ページ番号（1から）
     """
-    # データベースのArchiveテーブルから全てのデータを取得
-    all_archives = Archive.objects.all()
-    
-    markers = []
-    # 取得した各データを、JavaScriptで扱いやすい辞書の形に変換
-    for item in all_archives:
-        markers.append({
-            'latitude': item.latitude,
-            'longitude': item.longitude,
-            'address': item.address,
-            'file_type': item.file_type,
-            'description': item.description,
-            'file_name': os.path.basename(item.file_path),
-            'file_url': item.file_path,
-            'upload_date': item.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+    query = request.GET.get('q', '').strip()
+    try:
+        bbox = parse_bbox(request.GET.get('bbox'))
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not query:
+        return JsonResponse({'error': '検索する文字列（q）を指定してください'}, status=400)
+
+    page_size = settings.SEARCH_PAGE_SIZE
+    archives = search_archives(query, filter_by_bbox(Archive.objects.all(), bbox))
+    offset = (page - 1) * page_size
+    items = list(archives[offset:offset + page_size + 1])
+
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'has_next': len(items) > page_size,
+        'results': [serialize_marker(item) for item in items[:page_size]],
+    })
+
+
+def nearby(request):
+    """
+    指定した地点の近くにあるデータを、近い順にJSON形式で返すAPIビュー
+
+    クエリパラメータ:
+      lat, lon: 地点の緯度・経度
+      k: 近い順に返す件数
+      radius: この半径（メートル）以内のデータをすべて返す（k と同時に指定すると、そのうち近い k 件）
+    """
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+        k = int(request.GET['k']) if request.GET.get('k') else None
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'lat と lon（数値）を指定してください'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': '緯度・経度の範囲が正しくありません'}, status=400)
+    if k is not None and not 1 <= k <= settings.NEARBY_MAX_RESULTS:
+        return JsonResponse({'error': f'k は 1〜{settings.NEARBY_MAX_RESULTS} で指定してください'}, status=400)
+    if radius is not None and not 0 < radius <= settings.NEARBY_MAX_RADIUS:
+        return JsonResponse({'error': f'radius は {settings.NEARBY_MAX_RADIUS} メートル以下で指定してください'}, status=400)
+
+    if radius is not None:
+        items = within_radius(Archive.objects.all(), latitude, longitude, radius, k or settings.NEARBY_MAX_RESULTS)
+    else:
+        items = nearest(Archive.objects.all(), latitude, longitude, k or settings.NEARBY_DEFAULT_K)
+
+    results = []
+    for item in items:
+        marker = serialize_marker(item)
+        marker['distance'] = round(item.distance, 1)
+        results.append(marker)
+    return JsonResponse({'latitude': latitude, 'longitude': longitude, 'results': results})
+
+
+@condition(etag_func=archive_etag, last_modified_func=archive_last_modified)
+def get_clusters(request):
+    """
+    ズームレベルに応じて、サーバー側で集計したクラスタをJSON形式で返すAPIビュー
+    ズームアウトしている間はグリッドごとの件数・重心・種類別件数だけを返し、
+    MARKER_CLUSTER_MAX_ZOOM 以上にズームしたときだけ個別のマーカーを返す
+
+    クエリパラメータ:
+      bbox: "西経,南緯,東経,北緯" 形式の表示範囲
+      zoom: 地図のズームレベル
+    """
+    try:
+        bbox = parse_bbox(request.GET.get('bbox'))
+        zoom = int(request.GET.get('zoom', 0))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    zoom = max(0, min(zoom, 22))
+
+    if zoom >= settings.MARKER_CLUSTER_MAX_ZOOM:
+        archives = filter_by_bbox(Archive.objects.all(), bbox).order_by('id')
+        markers = [serialize_marker(item) for item in archives[:settings.MARKERS_MAX_RESULTS]]
+        response = JsonResponse({'mode': 'markers', 'zoom': zoom, 'markers': markers})
+    else:
+        clusters = aggregate_clusters(bbox, zoom)
+        response = JsonResponse({
+            'mode': 'clusters',
+            'zoom': zoom,
+            'cell_size': cluster_cell_size(zoom),
+            'clusters': clusters,
         })
-        
-    return JsonResponse(markers, safe=False)
+    patch_cache_control(response, no_cache=True)
+    return response
 
 
 def file_list(request):
     """
     アップロードされたファイルの一覧ページを表示するビュー
+    新しい順に1ページ分ずつ表示し、スクロールすると続きを読み込む
+
+    クエリパラメータ:
+      cursor: 前のページの最後を表すカーソル。この続きから表示する
+      from: データのID。このデータから表示する（地図のポップアップからのリンク用）
+      fragment: 1 の場合は、続きの読み込み用にファイルの部分だけを返す
     """
-    # データベースから作成日時が新しい順に全てのデータを取得
-    files_from_db = Archive.objects.order_by('-created_at')
-    
-    # 取得したデータをテンプレートに渡す
+    try:
+        after = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+        start_id = int(request.GET['from']) if request.GET.get('from') else None
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    start = Archive.objects.filter(pk=start_id).first() if start_id else None
+    files, next_cursor = get_file_page(after=after, start=start)
+
     context = {
-        'files': files_from_db
+        'files': files,
+        'next_cursor': next_cursor,
     }
+    if request.GET.get('fragment'):
+        return render(request, 'archive_app/file_list_items.html', context)
+
+    # 統計はデータベースで集計し、キャッシュしたものを使う
+    context['stats'] = get_archive_stats()
     return render(request, 'archive_app/file_list.html', context)
 
 
-def download_file(request):
+# 取得元にそのまま転送するリクエストヘッダー（範囲指定・条件付きGET）
+FORWARDED_REQUEST_HEADERS = ('Range', 'If-Range', 'If-None-Match', 'If-Modified-Since')
+
+# 取得元の応答からそのまま返すレスポンスヘッダー
+FORWARDED_RESPONSE_HEADERS = (
+    'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified', 'Cache-Control',
+)
+
+
+def _iter_upstream(upstream, chunk_size):
     """
-    SupabaseのURLからファイルを取得し、ダウンロードさせるためのビュー
-    （この関数のロジックは変更不要）
+    取得元の応答を少しずつ返し、最後に接続をプールに戻す
+    """
+    try:
+        yield from upstream.iter_content(chunk_size=chunk_size)
+    finally:
+        upstream.close()
+
+
+def _cached_file_response(request, data_path, meta, filename):
+    """
+    ディスクキャッシュにあるファイルを返す（sendfileが使える環境ではそれで送信される）
+    """
+    if request.headers.get('If-None-Match') == meta['etag']:
+        response = HttpResponse(status=304)
+    else:
+        # 本体をディスクから送るときだけ、取得元から転送せずに済んだバイト数に数える
+        MEDIA_CACHE_BYTES_SAVED.inc(meta['size'])
+        response = FileResponse(
+            open(data_path, 'rb'), as_attachment=True, filename=filename, content_type=meta['content_type'],
+        )
+    response['ETag'] = meta['etag']
+    if meta.get('last_modified'):
+        response['Last-Modified'] = meta['last_modified']
+    return response
+
+
+def _download_target(request):
+    """
+    ダウンロードするファイルのURL・ファイル名・方式を返す（URLが無ければ ValueError）
     """
     file_url = request.GET.get('url')
     filename = request.GET.get('filename')
 
     if not file_url:
-        return HttpResponse('URLが指定されていません', status=400)
-    
+        raise ValueError('URLが指定されていません')
+
     file_url = urllib.parse.unquote(file_url)
     if not filename:
         parsed_url = urllib.parse.urlparse(file_url)
         filename = os.path.basename(parsed_url.path)
-        
+
+    return file_url, filename, request.GET.get('mode') or settings.DOWNLOAD_MODE
+
+
+def _download_without_upstream(request, file_url, filename, mode):
+    """
+    取得元から中継せずに返せる場合（署名URLへのリダイレクト・ローカルのファイル・ディスクキャッシュ）は
+    (レスポンス, None, None) を、中継が必要な場合は
+    (None, 書き込みに使うディスクキャッシュ, 有効期間を過ぎたキャッシュ（あれば）) を返す
+    """
+    storage = get_archive_storage()
+    storage_name = storage.name_from_url(file_url)
+
+    if mode == 'redirect' and storage_name is not None:
+        # バイト列がこのプロセスを通らないよう、署名URLに直接取りに行かせる
+        return redirect(storage.signed_url(storage_name, settings.DOWNLOAD_SIGNED_URL_EXPIRES, download=filename)), None, None
+
+    if isinstance(storage, FileSystemStorage) and storage_name is not None:
+        # ローカルに保存したファイルはディスクから直接返す
+        return FileResponse(storage.open(storage_name), as_attachment=True, filename=filename), None, None
+
+    # ディスクキャッシュにあれば、取得元に問い合わせずに返す（範囲指定はキャッシュを使わない）
+    media_cache = get_media_cache()
+    if media_cache is not None:
+        if 'Range' in request.headers:
+            MEDIA_CACHE_REQUESTS.inc(result='bypass')
+            media_cache = None
+        else:
+            cached = media_cache.lookup(file_url)
+            if cached is None:
+                MEDIA_CACHE_REQUESTS.inc(result='miss')
+            else:
+                data_path, meta, fresh = cached
+                if fresh:
+                    MEDIA_CACHE_REQUESTS.inc(result='hit')
+                    return _cached_file_response(request, data_path, meta, filename), None, None
+                # 有効期間を過ぎているので、取得元に変更が無いか確認してから使う
+                return None, media_cache, cached
+    return None, media_cache, None
+
+
+def _upstream_headers(request, stale):
+    """
+    取得元に転送するリクエストヘッダーを返す
+    有効期間を過ぎたキャッシュがあれば、その ETag で条件付きGETにする
+    （クライアントの条件は、キャッシュから返すときに _cached_file_response() で判定する）
+    """
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    if stale is not None:
+        headers.pop('If-Modified-Since', None)
+        headers['If-None-Match'] = stale[1]['etag']
+    return headers
+
+
+def _revalidated_response(request, media_cache, file_url, stale, filename, status_code):
+    """
+    有効期間を過ぎたキャッシュを取得元に確認した結果、変更が無ければ（304）ディスクから返す
+    変更があった場合は None を返す（取得元の応答を中継し、キャッシュも書き換える）
+    """
+    if status_code != 304:
+        MEDIA_CACHE_REQUESTS.inc(result='miss')
+        return None
+    data_path, meta, _ = stale
+    MEDIA_CACHE_REQUESTS.inc(result='revalidated')
+    media_cache.revalidated(file_url, meta)
+    return _cached_file_response(request, data_path, meta, filename)
+
+
+def _empty_upstream_response(r):
+    # 変更なし（304）・範囲外（416）は本文なしでそのまま返す
+    response = HttpResponse(status=r.status_code)
+    for name in ('ETag', 'Last-Modified', 'Cache-Control', 'Content-Range'):
+        if name in r.headers:
+            response[name] = r.headers[name]
+    return response
+
+
+def _streaming_upstream_response(r, chunks, filename):
+    response = StreamingHttpResponse(
+        chunks,
+        status=r.status_code,  # 範囲指定の場合は 206
+        content_type=r.headers.get('Content-Type', 'application/octet-stream'),
+    )
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    for name in FORWARDED_RESPONSE_HEADERS:
+        if name in r.headers:
+            response[name] = r.headers[name]
+    return response
+
+
+@trace('download_file')
+def download_file(request):
+    """
+    SupabaseのURLからファイルを取得し、ダウンロードさせるためのビュー
+
+    - Range / If-None-Match / If-Modified-Since を取得元に転送し、206 / 304 をそのまま返す
+    - mode=redirect（または DOWNLOAD_MODE = 'redirect'）の場合は、ファイルを中継せずに
+      期限付きの署名URLへリダイレクトする
+    - MEDIA_CACHE_DIR を設定すると、よくダウンロードされるファイルをディスクにキャッシュする
+      （MEDIA_CACHE_FRESH_SECONDS を過ぎたものは、保存した ETag で取得元に確認してから使う）
+    """
     try:
-        r = requests.get(file_url, stream=True)
+        file_url, filename, mode = _download_target(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    try:
+        response, media_cache, stale = _download_without_upstream(request, file_url, filename, mode)
+        if response is not None:
+            return response
+
+        headers = _upstream_headers(request, stale)
+        r = http_client.get(file_url, stream=True, headers=headers, call_site='download_file')
+        if stale is not None:
+            response = _revalidated_response(request, media_cache, file_url, stale, filename, r.status_code)
+            if response is not None:
+                r.close()
+                return response
+
+        if r.status_code in (304, 416):
+            r.close()
+            return _empty_upstream_response(r)
         r.raise_for_status()
         
-        response = StreamingHttpResponse(r.iter_content(chunk_size=8192), content_type=r.headers.get('Content-Type', 'application/octet-stream'))
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        if 'Content-Length' in r.headers:
-            response['Content-Length'] = r.headers['Content-Length']
-            
-        return response
+        chunks = _iter_upstream(r, settings.DOWNLOAD_CHUNK_SIZE)
+        if media_cache is not None and media_cache.should_store(r):
+            # 最初のクライアントに返しながらディスクキャッシュに書き込む
+            chunks = media_cache.stream_and_store(file_url, r, chunks)
+        return _streaming_upstream_response(r, chunks, filename)
     except Exception as e:
-        return HttpResponse(f'ダウンロードエラー: {e}', status=500)
\ No newline at end of file
+        return HttpResponse(f'ダウンロードエラー: {e}', status=500)
+
+
+async def _aiter_upstream(upstream, chunk_size):
+    """
+    _iter_upstream() の非同期版（httpx の応答を少しずつ返し、最後に接続をプールに戻す）
+    """
+    try:
+        async for chunk in upstream.aiter_bytes(chunk_size):
+            yield chunk
+    finally:
+        await upstream.aclose()
+
+
+@trace('download_file')
+async def download_file_async(request):
+    """
+    download_file() の非同期版（ASYNC_VIEWS = True のときに使う）
+    取得元からの中継をイベントループ上で行うので、時間のかかるダウンロードでもワーカーを占有しない
+    """
+    try:
+        file_url, filename, mode = _download_target(request)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    try:
+        # 署名URLの発行やディスクキャッシュの確認は同期の処理なので、スレッドで行う
+        response, media_cache, stale = await sync_to_async(_download_without_upstream)(
+            request, file_url, filename, mode,
+        )
+        if response is not None:
+            return response
+
+        headers = _upstream_headers(request, stale)
+        r = await http_client.aget(file_url, stream=True, headers=headers, call_site='download_file')
+        if stale is not None:
+            response = await sync_to_async(_revalidated_response)(
+                request, media_cache, file_url, stale, filename, r.status_code,
+            )
+            if response is not None:
+                await r.aclose()
+                return response
+
+        if r.status_code in (304, 416):
+            await r.aclose()
+            return _empty_upstream_response(r)
+        if r.is_error:
+            await r.aclose()
+            r.raise_for_status()
+
+        chunks = _aiter_upstream(r, settings.DOWNLOAD_CHUNK_SIZE)
+        if media_cache is not None and media_cache.should_store(r):
+            chunks = media_cache.astream_and_store(file_url, r, chunks)
+        return _streaming_upstream_response(r, chunks, filename)
+    except Exception as e:
+        return HttpResponse(f'ダウンロードエラー: {e}', status=500)
+
+
+def metrics(request):
+    """
+    処理時間・SQL・外部サービスなどのメトリクスを Prometheus のテキスト形式で返す
+    "Authorization: Bearer <METRICS_TOKEN>" が必要。METRICS_TOKEN が未設定の場合は
+    DEBUG のときだけ認証なしで返し、それ以外は 404 にする（公開環境で内部の情報を出さない）
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            raise Http404
+    else:
+        given = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return HttpResponse('認証が必要です', status=401)
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -11,12 +11,13 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import urllib.parse
 from pathlib import Path
-from dotenv import load_dotenv
 import sys
 
-# Load environment variables from .env file
-load_dotenv()
+from django.core.exceptions import ImproperlyConfigured
+
+# .env ファイルは manage.py が読み込む（サーバーレス環境の起動を速くするため、ここでは読み込まない）
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,8 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'archive_app.middleware.RequestMetricsMiddleware',  # 処理時間・SQLの記録（最初に置いて全体を計測する）
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
+    'archive_app.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise（ASGIでもスレッドを経由しない版）
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,26 +85,14 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 
 if DATABASE_URL:
     # Use Supabase PostgreSQL (both development and production)
-    try:
-        import dj_database_url
-        DATABASES = {
-            'default': dj_database_url.parse(DATABASE_URL)
-        }
-        print(f"✅ Using Supabase PostgreSQL: {DATABASE_URL[:50]}...")
-    except ImportError:
-        print("❌ dj_database_url not found, install it with: pip install dj-database-url")
-        # Fallback to SQLite if dj_database_url is not available
-        DATABASES = {
-            'default': {
-                'ENGINE': 'django.db.backends.sqlite3',
-                'NAME': '/tmp/db.sqlite3' if os.environ.get('VERCEL') else BASE_DIR / 'db.sqlite3',
-            }
-        }
-    DATABASES['default']['ENGINE'] = 'django_pg8000' 
+    import dj_database_url
+    DATABASES = {
+        'default': dj_database_url.parse(DATABASE_URL)
+    }
+    DATABASES['default']['ENGINE'] = 'django_pg8000'
 
 else:
     # Development: Use SQLite
-    print("ℹ️  Using SQLite database")
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -110,28 +100,9 @@ else:
         }
     }
 
-# --- START DIAGNOSTIC BLOCK ---
-# Renderの環境変数をデバッグするためのブロック
-print("--- STARTING DIAGNOSTICS ---")
-database_url = os.environ.get('DATABASE_URL')
-supabase_url = os.environ.get('SUPABASE_URL')
-supabase_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
-
-# os.environ.get()が何を取得しているか、ブール値でログに出力
-print(f"DATABASE_URL is set: {bool(database_url)}")
-print(f"SUPABASE_URL is set: {bool(supabase_url)}")
-print(f"SUPABASE_SERVICE_ROLE_KEY is set: {bool(supabase_key)}")
-
-# 本番環境（Render）でDATABASE_URLがなければ、SQLiteに頼らずに意図的にデプロイを失敗させる
-IS_PRODUCTION = "gunicorn" in sys.argv[0]
-print(f"Running in production (gunicorn): {IS_PRODUCTION}")
-
-if IS_PRODUCTION and not database_url:
-    print("FATAL ERROR: DATABASE_URL is not set in the production environment!")
-    sys.exit(1) # これでビルドが明確に失敗する
-
-print("--- ENDING DIAGNOSTICS ---")
-# --- END DIAGNOSTIC BLOCK ---
+# 本番環境（Render）でDATABASE_URLがなければ、SQLiteに頼らずに意図的に起動を失敗させる
+if "gunicorn" in sys.argv[0] and not DATABASE_URL:
+    raise ImproperlyConfigured("DATABASE_URL is not set in the production environment!")
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -151,10 +122,64 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# CACHE_URL でキャッシュの保存先を選ぶ（複数のプロセス・サーバーで共有する場合は file か redis を使う）
+#   locmem://archive-cache    プロセス内のメモリ（初期値）
+#   file:///var/tmp/archive   ファイル（同じサーバーのプロセス間で共有）
+#   redis://localhost:6379/0  Redisのプロトコルを話すサーバー（Redis・Valkeyなど。redis パッケージが必要）
+CACHE_URL = os.environ.get('CACHE_URL', 'locmem://archive-cache')
+_cache_url = urllib.parse.urlparse(CACHE_URL)
+if _cache_url.scheme == 'locmem':
+    _cache_backend, _cache_location = 'django.core.cache.backends.locmem.LocMemCache', _cache_url.netloc
+elif _cache_url.scheme == 'file':
+    _cache_backend, _cache_location = 'django.core.cache.backends.filebased.FileBasedCache', _cache_url.path
+elif _cache_url.scheme in ('redis', 'rediss', 'unix'):
+    _cache_backend, _cache_location = 'django.core.cache.backends.redis.RedisCache', CACHE_URL
+else:
+    raise ImproperlyConfigured(f"CACHE_URL の形式が正しくありません: {CACHE_URL}")
+
+CACHES = {
+    'default': {
+        'BACKEND': _cache_backend,
+        'LOCATION': _cache_location,
+    }
+}
+
 #ファイル保存
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# アーカイブのファイルの保存先（supabase: Supabase Storage / local: MEDIA_ROOT 以下）
+ARCHIVE_STORAGE_BACKEND = os.environ.get('ARCHIVE_STORAGE_BACKEND', 'supabase')
+
+if ARCHIVE_STORAGE_BACKEND == 'local':
+    ARCHIVE_STORAGE = {
+        'BACKEND': 'archive_app.storage.LocalArchiveStorage',
+        'OPTIONS': {
+            'location': MEDIA_ROOT / 'archive',
+            'base_url': MEDIA_URL + 'archive/',
+        },
+    }
+else:
+    ARCHIVE_STORAGE = {
+        'BACKEND': 'archive_app.storage.SupabaseStorage',
+        'OPTIONS': {
+            'bucket': os.environ.get('SUPABASE_BUCKET', 'file-mapping-bucket'),
+        },
+    }
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'archive': ARCHIVE_STORAGE,
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -180,3 +205,140 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# --- archive_app の設定 ---
+
+# get_markers が1回のレスポンスで返すマーカーの最大件数
+MARKERS_MAX_RESULTS = int(os.environ.get('MARKERS_MAX_RESULTS', 5000))
+
+# このズームレベル未満ではサーバー側で集計したクラスタを返す（get_clusters）
+MARKER_CLUSTER_MAX_ZOOM = int(os.environ.get('MARKER_CLUSTER_MAX_ZOOM', 12))
+
+# クラスタ集計のグリッド数（地図タイル1枚の幅あたり）
+MARKER_CLUSTER_CELLS_PER_TILE = 4
+
+# create_map_html が生成した地図HTML・ポップアップのキャッシュ保持時間（秒）
+MAP_HTML_CACHE_TIMEOUT = 60 * 60
+
+# get_markers の応答（JSONとgzip）のキャッシュ保持時間（秒）。キーにデータセットのバージョンを含むので長めでよい
+MARKERS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# キャッシュが無いときの作り直し（同時に来たリクエストのうち1つだけが作り直す）
+CACHE_BUILD_LOCK_TIMEOUT = 60  # 作り直し中のロックの有効期間（秒、作り直しが失敗したまま残らないように）
+CACHE_BUILD_WAIT = 60  # 他のリクエストの作り直しを待つ最大の時間（秒）
+
+# ジオコーディング結果のキャッシュ
+GEOCODE_CACHE_TTL = 60 * 60 * 24 * 90  # 見つかった結果の保持期間（秒）
+GEOCODE_NEGATIVE_CACHE_TTL = 60 * 60 * 24  # 見つからなかった結果の保持期間（秒）
+GEOCODE_MEMORY_CACHE_SIZE = 1024  # プロセス内LRUキャッシュの件数
+GEOCODE_REVERSE_PRECISION = 4  # 逆ジオコーディングで座標を丸める桁数（約10m）
+
+# 外部サービス（地理院API・Supabase Storage）への通信
+HTTP_CONNECT_TIMEOUT = 3.05  # 接続のタイムアウト（秒）
+HTTP_READ_TIMEOUT = 15  # 読み込みのタイムアウト（秒）
+HTTP_MAX_RETRIES = 2  # 冪等なリクエストの再試行回数
+HTTP_RETRY_BACKOFF = 0.3  # 再試行の間隔の基準値（秒、回数ごとに倍になる）
+HTTP_POOL_MAXSIZE = 10  # 接続先ごとに使い回す接続の数
+HTTP_ASYNC_MAX_CONNECTIONS = 200  # 非同期のビュー（ASYNC_VIEWS）で同時に使う接続の最大数
+HTTP_CIRCUIT_FAILURE_THRESHOLD = 5  # この回数続けて失敗したら接続を一時停止する
+HTTP_CIRCUIT_RESET_TIMEOUT = 30  # 一時停止してから復旧を確認するまでの時間（秒）
+
+# アップロードをバックグラウンドのジョブで処理するか（ワーカー: python manage.py run_upload_worker）
+UPLOAD_USE_QUEUE = os.environ.get('UPLOAD_USE_QUEUE', 'false').lower() == 'true'
+UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or ('/tmp/spool' if os.environ.get('VERCEL') else BASE_DIR / 'spool')
+# スプールの保存先（archive: アーカイブと同じストレージの spool/ 以下 / local: UPLOAD_SPOOL_DIR）
+# web と worker は別のマシン・コンテナで動くことが多いので、初期値は両方から読めるアーカイブのストレージにする
+# （local は、web と worker が同じマシンや共有ボリュームで UPLOAD_SPOOL_DIR を共有している場合だけ使う）
+UPLOAD_SPOOL_STORAGE = os.environ.get('UPLOAD_SPOOL_STORAGE', 'archive')
+if UPLOAD_SPOOL_STORAGE == 'local':
+    STORAGES['spool'] = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': UPLOAD_SPOOL_DIR},
+    }
+    UPLOAD_SPOOL_PREFIX = ''
+else:
+    STORAGES['spool'] = ARCHIVE_STORAGE
+    UPLOAD_SPOOL_PREFIX = 'spool/'  # アーカイブのファイルと混ざらないように付ける
+UPLOAD_JOB_MAX_ATTEMPTS = 5  # ジョブを再試行する回数の上限
+UPLOAD_JOB_RETRY_DELAY = 30  # 最初の再試行までの時間（秒、失敗するたびに倍になる）
+UPLOAD_JOB_STALE_TIMEOUT = 60 * 30  # この時間「処理中」のままのジョブは処理待ちに戻す（秒）
+UPLOAD_JOB_HEARTBEAT_INTERVAL = 60  # 処理中のジョブの updated_at を更新する間隔（秒。UPLOAD_JOB_STALE_TIMEOUT より十分短くする）
+
+# Supabase Storageへのアップロード
+STORAGE_RESUMABLE_THRESHOLD = 50 * 1024 * 1024  # このサイズ以上は再開可能な分割アップロードにする
+STORAGE_UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024  # 分割アップロードの1回の送信サイズ（Supabaseは6MB固定）
+STORAGE_UPLOAD_MAX_RETRIES = 5  # 分割アップロードで1チャンクを送り直す回数の上限
+STORAGE_RESUMABLE_UPLOAD_TTL = 60 * 60 * 24  # 途中までのアップロードを再開できる期間（秒）
+
+# ファイルのダウンロード（download_file）
+# proxy: このサーバーが中継する / redirect: 期限付きの署名URLにリダイレクトする
+DOWNLOAD_MODE = os.environ.get('DOWNLOAD_MODE', 'proxy')
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', 256 * 1024))  # 中継するときの1回の読み込みサイズ
+DOWNLOAD_SIGNED_URL_EXPIRES = 60  # 署名URLの有効期間（秒）
+
+# ダウンロードするファイルのディスクキャッシュ（MEDIA_CACHE_DIR を設定すると有効）
+MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR')
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 2 * 1024 ** 3))  # キャッシュ全体の上限
+MEDIA_CACHE_MAX_OBJECT_BYTES = 512 * 1024 ** 2  # これより大きいファイルはキャッシュしない
+MEDIA_CACHE_FRESH_SECONDS = 60 * 60 * 24  # 取得元に問い合わせずにキャッシュを使う期間（秒）
+
+# 画像の縮小版（サムネイル・中サイズ）。値は長辺のピクセル数
+THUMBNAIL_SIZES = {
+    'thumbnail_url': 400,
+    'medium_url': 1280,
+}
+THUMBNAIL_FORMAT = 'WEBP'  # WebPが使えない場合はJPEGになる
+THUMBNAIL_QUALITY = 80
+
+# ファイル一覧の1ページあたりの件数
+FILE_LIST_PAGE_SIZE = 50
+
+# 全文検索の1ページあたりの件数
+SEARCH_PAGE_SIZE = 20
+
+# 近くのファイルの検索（/nearby/）
+NEARBY_DEFAULT_K = 10  # 件数も半径も指定されなかったときに返す件数
+NEARBY_MAX_RESULTS = 500  # 一度に返す最大件数
+NEARBY_MAX_RADIUS = 50000  # 指定できる最大の半径（メートル）
+NEARBY_INITIAL_RADIUS = 1000  # 件数だけを指定したときに最初に探す半径（メートル。足りなければ4倍ずつ NEARBY_MAX_RADIUS まで広げる）
+NEARBY_MAX_CANDIDATES = 2000  # 1回の検索でデータベースから読み込む候補の上限（近い順）
+
+# 写真・動画のメタデータ（撮影位置・撮影日時）の読み取り
+METADATA_READ_BYTES = 256 * 1024  # EXIF・XMPを探すために読むファイルの先頭のバイト数
+METADATA_MAX_MOOV_BYTES = 8 * 1024 * 1024  # これより大きい動画のメタデータ（moov）は読まない
+
+# アップロードされたファイルを受信しながら SHA-256 を計算する（同じファイルの重複アップロードを防ぐため）
+FILE_UPLOAD_HANDLERS = [
+    'archive_app.uploadhandlers.HashingMemoryFileUploadHandler',
+    'archive_app.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
+# 起動時間の予算（manage.py check_startup で確認する）
+STARTUP_IMPORT_BUDGET_MS = 800  # WSGIアプリとURL設定の読み込みにかけてよい時間（ミリ秒）
+STARTUP_LAZY_MODULES = ['folium', 'pandas', 'numpy', 'PIL']  # 起動時に読み込んではいけない重いモジュール
+
+# 処理時間の計測（/metrics で Prometheus のテキスト形式で公開する）
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # /metrics に必要な "Authorization: Bearer <トークン>"（未設定なら DEBUG 以外は 404）
+# これより遅いリクエスト（秒）はSQLと外部処理の内訳をログに出す（未設定ならログに出さない）
+SLOW_REQUEST_THRESHOLD = float(os.environ['SLOW_REQUEST_THRESHOLD']) if os.environ.get('SLOW_REQUEST_THRESHOLD') else None
+SLOW_REQUEST_LOG_QUERIES = 10  # 遅いリクエストのログに出すSQLの件数（時間のかかった順）
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'archive_app': {'handlers': ['console'], 'level': os.environ.get('ARCHIVE_LOG_LEVEL', 'INFO')},
+    },
+}
+
+# ASGI（uvicorn ワーカー）で動かす場合に True にすると、get_markers・download_file を非同期版にする
+# （WSGI のままだと非同期のストリーミングは一度に読み込まれてしまうので、gunicorn の同期ワーカーでは False のまま）
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+
+# マーカー・場所のポップアップ（/markers/<ID>/・/locations/<緯度>,<経度>/）
+POPUP_CACHE_MAX_AGE = 60  # ブラウザにキャッシュさせる時間（秒）。過ぎた後は ETag で再検証する
+LOCATION_POPUP_TOLERANCE = 1e-5  # /locations/ で同じ場所とみなす緯度・経度の差（度。約1メートル）
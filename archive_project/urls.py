@@ -16,17 +16,31 @@ Including another URLconf
 """
 # map_project/urls.py
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from archive_app.views import map_view, get_markers, file_list, download_file
+from archive_app.views import map_view, get_markers, get_clusters, search, nearby, file_list, download_file, job_status, check_upload, metrics
+from archive_app.views import marker_detail, location_detail
+from archive_app.views import get_markers_async, download_file_async
+
+# ASGI（uvicorn）で動かす場合は、待ち時間の長いビューを非同期版にする
+if settings.ASYNC_VIEWS:
+    get_markers, download_file = get_markers_async, download_file_async
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', map_view, name='map_view'),
     path('get_markers/', get_markers, name='get_markers'),
+    path('get_clusters/', get_clusters, name='get_clusters'),
+    path('markers/<int:archive_id>/', marker_detail, name='marker_detail'),
+    re_path(r'^locations/(?P<lat>-?\d+(?:\.\d+)?),(?P<lon>-?\d+(?:\.\d+)?)/$', location_detail, name='location_detail'),
+    path('search/', search, name='search'),
+    path('nearby/', nearby, name='nearby'),
     path('files/', file_list, name='file_list'),
     path('download/', download_file, name='download_file'),
+    path('uploads/check/', check_upload, name='check_upload'),
+    path('jobs/<int:job_id>/', job_status, name='job_status'),
+    path('metrics', metrics, name='metrics'),
 ]
 
 # 開発環境でメディアファイルと静的ファイルを配信するための設定
@@ -13,4 +13,12 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'archive_project.settings')
 
+try:
+    # 開発環境では .env ファイルから環境変数を読み込む（既に設定されている値は上書きしない）
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    load_dotenv()
+
 application = get_wsgi_application()
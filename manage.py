@@ -7,6 +7,13 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'archive_project.settings')
+    try:
+        # 開発環境では .env ファイルから環境変数を読み込む
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv()
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: